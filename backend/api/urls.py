@@ -32,20 +32,28 @@ urlpatterns = [
     # =======================
     path("listings/", listings_views.ListingListCreateView.as_view(), name="listing-list-create"),
     path("listings/<int:pk>/", listings_views.ListingRetrieveUpdateDestroyView.as_view(), name="listing-detail"),
+    path("listings/<int:pk>/availability/", listings_views.ListingAvailabilityView.as_view(), name="listing-availability"),
+    path("listings/<int:pk>/calendar.ics", listings_views.ListingCalendarExportView.as_view(), name="listing-calendar-ics"),
 
     # =======================
-    # Utils (Geo)
+    # Utils (Geo) — ✅ async (ASGI): Nominatim ne bloque plus de worker
     # =======================
-    path("utils/reverse-geocode/", listings_views.ReverseGeocodeView.as_view(), name="reverse-geocode"),
-    path("utils/search-places/", listings_views.PlaceSearchView.as_view(), name="search-places"),
+    path("utils/reverse-geocode/", listings_views.AsyncReverseGeocodeView.as_view(), name="reverse-geocode"),
+    path("utils/search-places/", listings_views.AsyncPlaceSearchView.as_view(), name="search-places"),
 
     # =======================
     # Bookings — NEW FLOW
     # =======================
     path("bookings/request/", listings_views.BookingRequestCreateView.as_view(), name="booking-request"),
+    path("bookings/quote/", listings_views.BookingQuoteView.as_view(), name="booking-quote"),
     path("bookings/my/", listings_views.MyBookingsView.as_view(), name="my-bookings"),
     path("bookings/owner-inbox/", listings_views.OwnerBookingsInboxView.as_view(), name="owner-bookings-inbox"),
+    # ✅ async (ASGI): flux SSE des changements de statut (client + gérant)
+    path("bookings/events/stream/", listings_views.BookingEventStreamView.as_view(), name="booking-events-stream"),
+    path("bookings/events/stream-token/", listings_views.BookingEventStreamTokenView.as_view(), name="booking-events-stream-token"),
+    path("bookings/owner-inbox/overview/", listings_views.OwnerInboxOverviewView.as_view(), name="owner-inbox-overview"),
     path("bookings/<int:booking_id>/decision/", listings_views.OwnerBookingDecisionView.as_view(), name="owner-booking-decision"),
+    path("bookings/decisions/bulk/", listings_views.OwnerBulkDecisionView.as_view(), name="owner-bulk-decision"),
     path("bookings/<int:booking_id>/payment-info/", listings_views.BookingPaymentInfoView.as_view(), name="booking-payment-info"),
 
     # =======================
@@ -80,6 +88,8 @@ urlpatterns = [
     path("owners/me/dashboard/", listings_views.OwnerDashboardMeView.as_view(), name="owner-dashboard-me"),
     path("sellers/<int:user_id>/", listings_views.SellerPublicPageView.as_view(), name="seller-public-page"),
     path("owners/me/listings/<int:listing_id>/", listings_views.OwnerListingDeleteView.as_view(), name="owner-listing-delete"),
+    path("owners/me/listings/<int:listing_id>/external-calendars/", listings_views.OwnerExternalCalendarListCreateView.as_view(), name="owner-external-calendars"),
+    path("owners/me/external-calendars/<int:pk>/", listings_views.OwnerExternalCalendarDeleteView.as_view(), name="owner-external-calendar-delete"),
     
      # =========================
     # ✅ ADMIN DASHBOARD
@@ -98,6 +108,7 @@ urlpatterns = [
     path("admin/disputes/<int:dispute_id>/messages/", listings_views.AdminDisputeAddMessageView.as_view(), name="admin-dispute-add-message"),
 
     path("admin/audit/", listings_views.AdminAuditLogListView.as_view(), name="admin-audit"),
+    path("admin/push/metrics/", listings_views.AdminPushMetricsView.as_view(), name="admin-push-metrics"),
 
     # =========================
     # ✅ ADMIN STATS
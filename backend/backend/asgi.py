@@ -3,6 +3,11 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+✅ Les vues async (geocode) ne libèrent vraiment le worker que servies ici:
+    uvicorn backend.asgi:application --workers 2
+(sous WSGI elles tournent quand même, mais chaque appel occupe son worker)
+✅ Le flux SSE bookings/events/stream/ exige ASGI (501 sous WSGI)
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
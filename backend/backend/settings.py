@@ -112,7 +112,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",  
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "listings.middleware.AsyncWhiteNoiseMiddleware",  # ✅ WhiteNoise async-capable (vues async sous ASGI)
 
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -289,6 +289,79 @@ VAPID_PUBLIC_KEY = env("VAPID_PUBLIC_KEY")
 VAPID_PRIVATE_KEY_PATH = env("VAPID_PRIVATE_KEY_PATH", default="")
 VAPID_CLAIMS = {"sub": "mailto:support@decrouresi.com"}
 
+# ✅ Outbox push (manage.py push_worker): retries + backoff puis dead-letter
+PUSH_OUTBOX_MAX_ATTEMPTS = 6
+PUSH_OUTBOX_BACKOFF_BASE = 30          # secondes (30s, 60s, 120s...)
+PUSH_OUTBOX_BACKOFF_MAX = 60 * 60      # plafond 1h
+PUSH_OUTBOX_LEASE_SECONDS = 120        # une ligne réservée revient si le worker meurt
+
+# ✅ Fan-out web push: threads par process + envois simultanés max par push service
+PUSH_MAX_WORKERS = 8
+PUSH_PER_HOST_CONCURRENCY = 4
+
+# ✅ Regroupement (digest) par type: fenêtre en secondes (0 = envoi immédiat)
+PUSH_COALESCE_WINDOWS = {
+    "booking_request": 60,
+}
+
+# ✅ Logs push: 1 envoi réussi sur 20 est journalisé (échecs/expirés: toujours)
+PUSH_LOG_SAMPLE_RATE = 0.05
+
+# ✅ Expiration des bookings (manage.py expire_bookings / push_worker --expire-every)
+# durée max (heures) dans chaque statut avant passage à "expired"
+BOOKING_EXPIRY_TTL_HOURS = {
+    "requested": 72,          # gérant sans réponse (depuis created_at)
+    "approved": 48,           # paiement non fait (depuis approved_at)
+    "awaiting_payment": 48,
+}
+BOOKING_EXPIRY_BATCH_SIZE = 500
+BOOKING_EXPIRY_INTERVAL_SECONDS = 300
+
+# ✅ Codes clés check-in: hash HMAC (secret dédié possible, sinon SECRET_KEY) + anti brute-force par gérant
+KEY_CODE_SECRET = env("KEY_CODE_SECRET", default="")
+KEY_CODE_ENCRYPTION_KEY = env("KEY_CODE_ENCRYPTION_KEY", default="")  # clé Fernet (sinon dérivée du secret)
+KEY_CODE_MAX_FAILURES = 5
+KEY_CODE_FAILURE_WINDOW_MINUTES = 15
+KEY_CODE_LOCK_MINUTES = 15
+
+# ✅ Idempotency-Key: durée de conservation des réponses rejouables
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+IDEMPOTENCY_LOCK_SECONDS = 60  # ✅ bail d'une clé in_progress, renouvelé tant que la vue tourne (process tué -> reprise après ce délai)
+
+# ✅ Flux SSE des bookings (/bookings/events/stream/)
+BOOKING_EVENTS_POLL_SECONDS = 2           # lecture du marqueur en cache (pas de requête DB)
+BOOKING_EVENTS_DB_POLL_SECONDS = 30       # relecture de la table au plus tard (cache non partagé entre process)
+BOOKING_EVENTS_STREAM_TOKEN_SECONDS = 60  # jeton de flux (?token=): ouvrir la connexion seulement
+BOOKING_EVENTS_STREAM_MAX_SECONDS = 300   # EventSource se reconnecte avec Last-Event-ID
+BOOKING_EVENTS_RETENTION_DAYS = 7         # purge par le sweeper d'expiration
+
+# ✅ Calendriers .ics (export par résidence + import Airbnb / Booking.com)
+EXTERNAL_CALENDAR_SYNC_INTERVAL_SECONDS = 900   # manage.py import_calendars --loop
+ICAL_IMPORT_TIMEOUT = 15
+ICAL_IMPORT_MAX_BYTES = 2 * 1024 * 1024          # .ics plus gros: refusé
+ICAL_IMPORT_MAX_REDIRECTS = 3
+EXTERNAL_CALENDAR_NEW_POLL_SECONDS = 5           # calendriers ajoutés: 1er import par le worker
+ICAL_IMPORT_PAST_DAYS = 30                      # blocs terminés depuis plus longtemps: ignorés
+ICAL_EXPORT_CACHE_SECONDS = 60 * 60
+
+# ✅ Dashboard admin: métriques recalculées au plus toutes les N secondes (?fresh=1 pour forcer)
+ADMIN_METRICS_CACHE_SECONDS = 30
+
+# ✅ Webhooks Paystack: inbox dédupliquée, traitée par manage.py paystack_webhook_worker
+PAYSTACK_WEBHOOK_MAX_ATTEMPTS = 8
+PAYSTACK_WEBHOOK_LEASE_SECONDS = 120
+PAYSTACK_WEBHOOK_RETENTION_DAYS = 30   # purge (done/ignored) par le sweeper d'expiration
+
+# ✅ Réconciliation des transactions "initiated" (manage.py reconcile_payments)
+PAYSTACK_RECONCILE_AFTER_MINUTES = 30
+PAYSTACK_RECONCILE_CONCURRENCY = 4
+PAYSTACK_RECONCILE_RATE_PER_SECOND = 5
+
+# ✅ Bouton "Payer": réutilise la page Paystack encore valide au lieu d'en créer une par clic
+PAYSTACK_AUTHORIZATION_TTL_MINUTES = 30
+PAYSTACK_MAX_INIT_ATTEMPTS_PER_BOOKING = 5       # pages Paystack ouvertes...
+PAYSTACK_INIT_ATTEMPTS_WINDOW_MINUTES = 60       # ...sur cette fenêtre glissante
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
@@ -365,13 +438,20 @@ LOGGING = {
     },
 
     "handlers": {
-        # ✅ log file dédié (INFO+)
+        # ✅ log file dédié (INFO+) — non bloquant (queue + thread d'écriture)
         "push_file": {
             "level": "INFO",
-            "class": "logging.FileHandler",
+            "class": "listings.log_handlers.NonBlockingFileHandler",
             "filename": os.path.join(BASE_DIR, "push.log"),
             "formatter": "verbose",
         },
+        # ✅ imports iCal (manage.py import_calendars): fichier séparé des pushs
+        "ical_file": {
+            "level": "INFO",
+            "class": "listings.log_handlers.NonBlockingFileHandler",
+            "filename": os.path.join(BASE_DIR, "ical.log"),
+            "formatter": "verbose",
+        },
         # ✅ erreurs django (ERROR+)
         "django_file": {
             "level": "ERROR",
@@ -394,6 +474,12 @@ LOGGING = {
             "level": "INFO",
             "propagate": False,
         },
+        # ✅ imports de calendriers externes (listings/ical.py)
+        "ical": {
+            "handlers": ["ical_file"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 }
 
@@ -6,9 +6,21 @@ admin.site.register(Listing)
 admin.site.register(Booking)
 admin.site.register(ListingImage)
 admin.site.register(BookingDateProposal)
+admin.site.register(BookingEvent)
+admin.site.register(ExternalCalendar)
+admin.site.register(ExternalCalendarBlock)
+admin.site.register(KeyCodeAttempt)
+admin.site.register(ListingOccupancy)
+admin.site.register(ListingOccupancyMonth)
 admin.site.register(PaymentTransaction)
+admin.site.register(PaymentPayloadArchive)
+admin.site.register(PaystackWebhookEvent)
 admin.site.register(PushSubscription)
+admin.site.register(NotificationOutbox)
+admin.site.register(IdempotencyKey)
+admin.site.register(PushMetricBucket)
 admin.site.register(Payout)
 admin.site.register(Dispute)
 admin.site.register(DisputeMessage)
-admin.site.register(AuditLog)
\ No newline at end of file
+admin.site.register(AuditLog)
+admin.site.register(DailyBookingRollup)
\ No newline at end of file
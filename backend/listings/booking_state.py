@@ -0,0 +1,72 @@
+#listings/booking_state.py
+from django.db import transaction
+
+from .models import Booking
+from . import occupancy, events, rollups
+
+
+# =========================================================
+# ✅ Machine à états des bookings
+# requested -> awaiting_payment -> paid -> checked_in -> released
+#          \-> rejected / expired / cancelled
+#
+# Chaque transition = 1 seul UPDATE ... WHERE id=? AND status IN (...)
+# -> un seul appelant "gagne" (verify vs webhook, double clic, 2 admins...)
+# -> les effets de bord (push, payout, code clé, événement SSE) ne se font que si on a gagné
+# =========================================================
+
+# statut cible -> statuts de départ autorisés
+ALLOWED_FROM = {
+    "awaiting_payment": ("requested",),
+    "approved": ("requested",),
+    "rejected": ("requested",),
+    # ✅ approved = "acceptée, le client peut payer" (bookings d'avant awaiting_payment, override support):
+    # un paiement confirmé dessus doit passer en paid, sinon il serait perdu ("already_paid" sans booking payé)
+    "paid": ("awaiting_payment", "approved"),
+    "checked_in": ("paid",),
+    "released": ("checked_in",),
+    "expired": ("requested", "approved", "awaiting_payment"),
+    "cancelled": ("requested", "approved", "awaiting_payment"),
+}
+
+
+def transition(booking: Booking, to_status: str, from_statuses=None, **fields) -> bool:
+    """
+    ✅ Compare-and-set: passe booking à to_status SI son statut en base est dans from_statuses
+    (par défaut ALLOWED_FROM[to_status]). fields = autres colonnes écrites dans le même UPDATE.
+
+    Retourne True si cette transition a gagné (l'instance est alors mise à jour),
+    False si le booking avait déjà changé de statut (l'instance n'est pas modifiée).
+    """
+    if from_statuses is None:
+        from_statuses = ALLOWED_FROM[to_status]
+
+    with transaction.atomic():
+        won = (
+            Booking.objects
+            .filter(id=booking.id, status__in=list(from_statuses))
+            .update(status=to_status, **fields)
+        )
+        if not won:
+            return False
+
+        before = (booking.status, booking.start_date, booking.end_date)
+        booking.status = to_status
+        for name, value in fields.items():
+            setattr(booking, name, value)
+        after = (booking.status, booking.start_date, booking.end_date)
+        booking._occupancy_snapshot = after
+
+        # ✅ .update() ne déclenche pas post_save: on met l'index d'occupation à jour ici
+        if occupancy.occupancy_changed(before, after):
+            ranges = [(s[1], s[2]) for s in (before, after) if s[1] and s[2]]
+            occupancy.refresh_ranges(booking.listing_id, ranges)
+
+        # ✅ stats admin: le jour de création du booking entre / sort des rollups (ou ses montants changent)
+        if before[0] in rollups.PAID_BOOKING_STATUSES or to_status in rollups.PAID_BOOKING_STATUSES:
+            rollups.refresh_for_booking(booking)
+
+        # ✅ flux SSE (client + gérant)
+        events.record(booking)
+
+    return True
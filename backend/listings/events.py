@@ -0,0 +1,90 @@
+#listings/events.py
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Booking, BookingEvent
+
+
+# =========================================================
+# ✅ Événements booking (flux SSE)
+# écrits dans la MÊME transaction que le changement de statut:
+# si la transaction rollback, l'événement disparaît avec
+# + marqueur en cache par user (après commit): le flux ne relit la table que s'il a bougé
+# =========================================================
+
+def _marker_key(user_id) -> str:
+    return f"booking_events:marker:{user_id}"
+
+
+def _touch(user_ids):
+    stamp = time.time()
+    cache.set_many({_marker_key(u): stamp for u in user_ids}, timeout=24 * 3600)
+
+
+async def amarker(user_id):
+    """
+    ✅ Change à chaque commit d'événements pour ce user (None: rien vu par ce cache)
+    """
+    return await cache.aget(_marker_key(user_id))
+
+
+def record_many(rows):
+    """
+    ✅ rows: [(booking_id, user_id, owner_id, status), ...] -> 1 seul INSERT
+    Le client ET le gérant reçoivent l'événement.
+    """
+    events = []
+    for booking_id, user_id, owner_id, status_name in rows:
+        for recipient in {user_id, owner_id}:
+            if recipient:
+                events.append(BookingEvent(user_id=recipient, booking_id=booking_id, status=status_name))
+    if events:
+        recipients = {e.user_id for e in events}
+        transaction.on_commit(lambda: _touch(recipients))
+    return BookingEvent.objects.bulk_create(events)
+
+
+def record(booking: Booking):
+    """
+    ✅ Événement pour le statut actuel du booking
+    """
+    owner_id = (
+        booking.listing.author_id
+        if Booking.listing.is_cached(booking)
+        else Booking.objects.filter(id=booking.id).values_list("listing__author_id", flat=True).first()
+    )
+    return record_many([(booking.id, booking.user_id, owner_id, booking.status)])
+
+
+def since(user_id, last_id: int, limit: int = 100):
+    """
+    ✅ Événements du user après last_id (lecture du flux)
+    """
+    return list(
+        BookingEvent.objects
+        .filter(user_id=user_id, id__gt=last_id)
+        .order_by("id")
+        .values("id", "booking_id", "status", "created_at")[:limit]
+    )
+
+
+def last_id_for(user_id) -> int:
+    return (
+        BookingEvent.objects
+        .filter(user_id=user_id)
+        .order_by("-id")
+        .values_list("id", flat=True)
+        .first()
+    ) or 0
+
+
+def purge_old(now=None) -> int:
+    days = int(getattr(settings, "BOOKING_EVENTS_RETENTION_DAYS", 7))
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    deleted, _ = BookingEvent.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
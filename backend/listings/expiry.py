@@ -0,0 +1,200 @@
+#listings/expiry.py
+import time
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Booking, PaymentTransaction
+from .notifications import enqueue_push_many
+from .idempotency import purge_expired
+from . import occupancy
+from . import events as booking_events
+from . import paystack_inbox
+
+logger = logging.getLogger("push")
+
+
+# =========================================================
+# ✅ Expiration des bookings "qui traînent"
+# - requested        : le gérant n'a pas répondu
+# - approved /
+#   awaiting_payment : le client n'a pas payé (les dates sont libérées)
+#                      SAUF paiement en cours: page Paystack encore valide ou transaction réussie
+#                      (sinon le client paie un booking expiré; cas tardif: views._handle_late_payment)
+# - paid             : code clé expiré -> effacé (le booking reste "paid")
+# (+ purge des Idempotency-Key expirées et des vieux événements SSE)
+# UPDATE par lots (ensemble), notifs via l'outbox
+# =========================================================
+
+# statut -> (champ de référence, titre, message client)
+EXPIRABLE = {
+    "requested": (
+        "created_at",
+        "Demande expirée",
+        "Le gérant n'a pas répondu à temps. Tu peux refaire une demande.",
+    ),
+    "approved": (
+        "approved_at",
+        "Réservation expirée",
+        "Le délai de paiement est dépassé, les dates ont été libérées.",
+    ),
+    "awaiting_payment": (
+        "approved_at",
+        "Réservation expirée",
+        "Le délai de paiement est dépassé, les dates ont été libérées.",
+    ),
+}
+
+
+def _ttl(status_name: str):
+    hours = (getattr(settings, "BOOKING_EXPIRY_TTL_HOURS", {}) or {}).get(status_name)
+    return timedelta(hours=float(hours)) if hours else None
+
+
+def _batch_size() -> int:
+    return int(getattr(settings, "BOOKING_EXPIRY_BATCH_SIZE", 500))
+
+
+def _payment_in_flight(now):
+    """
+    ✅ Sous-requête: le booking a une transaction réussie, ou une page Paystack encore utilisable
+    (authorization_expires_at, ou created_at + PAYSTACK_AUTHORIZATION_TTL_MINUTES pour les anciennes)
+    """
+    ttl = timedelta(minutes=int(getattr(settings, "PAYSTACK_AUTHORIZATION_TTL_MINUTES", 30)))
+    live = Q(status="initiated") & (
+        Q(authorization_expires_at__gt=now)
+        | Q(authorization_expires_at__isnull=True, created_at__gt=now - ttl)
+    )
+    return Exists(
+        PaymentTransaction.objects.filter(Q(status="success") | live, booking_id=OuterRef("pk"))
+    )
+
+
+def _expire_batch(status_name: str, cutoff, batch_size: int, now=None) -> int:
+    """
+    ✅ Un lot: verrouille (SKIP LOCKED) puis 1 seul UPDATE ... WHERE id IN (...) AND status=...
+    """
+    field, title, body = EXPIRABLE[status_name]
+    stale = Q(**{f"{field}__lt": cutoff})
+    if field != "created_at":
+        stale |= Q(**{f"{field}__isnull": True}, created_at__lt=cutoff)
+
+    qs = Booking.objects.filter(stale, status=status_name)
+    if status_name != "requested":
+        qs = qs.exclude(_payment_in_flight(now or timezone.now()))
+
+    with transaction.atomic():
+        rows = list(
+            qs
+            .select_for_update(skip_locked=True, of=("self",))
+            .order_by("id")
+            .values("id", "user_id", "listing_id", "listing__author_id", "start_date", "end_date")[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        # ✅ lignes verrouillées: un initialize concurrent attend, puis relit le statut "expired" et refuse
+        done = Booking.objects.filter(id__in=[r["id"] for r in rows], status=status_name).update(status="expired")
+
+        # ✅ .update(): pas de signal -> dates libérées dans l'index d'occupation
+        occupancy.refresh_for_bookings(rows)
+        booking_events.record_many(
+            [(r["id"], r["user_id"], r["listing__author_id"], "expired") for r in rows]
+        )
+
+        notifs = [
+            (r["user_id"], title, body, {"type": "booking_expired", "booking_id": r["id"]})
+            for r in rows
+        ]
+        if status_name == "requested":
+            notifs += [
+                (
+                    r["listing__author_id"],
+                    "Demande expirée",
+                    f"La demande #{r['id']} a expiré sans réponse.",
+                    {"type": "booking_expired", "booking_id": r["id"], "url": "/owner/inbox"},
+                )
+                for r in rows
+                if r["listing__author_id"]
+            ]
+        enqueue_push_many(notifs)
+
+    return done
+
+
+def _clear_expired_key_codes(now, batch_size: int) -> int:
+    total = 0
+    while True:
+        ids = list(
+            Booking.objects
+            .filter(status="paid", key_code_hash__isnull=False, key_code_expires_at__lt=now)
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return total
+        total += (
+            Booking.objects
+            .filter(id__in=ids, key_code_expires_at__lt=now)
+            .update(key_code_hash=None, key_code_encrypted=None)
+        )
+
+
+def sweep(now=None) -> dict:
+    """
+    ✅ Un passage complet -> compteurs par statut (+ "key_codes")
+    """
+    now = now or timezone.now()
+    batch_size = _batch_size()
+    counts = {}
+
+    for status_name in EXPIRABLE:
+        ttl = _ttl(status_name)
+        if not ttl:
+            continue
+        cutoff = now - ttl
+        total = 0
+        while True:
+            done = _expire_batch(status_name, cutoff, batch_size, now)
+            total += done
+            if done < batch_size:
+                break
+        counts[status_name] = total
+
+    counts["key_codes"] = _clear_expired_key_codes(now, batch_size)
+    counts["idempotency_keys"] = purge_expired(now)
+    counts["events"] = booking_events.purge_old(now)
+    counts["paystack_webhooks"] = paystack_inbox.purge_old(now)
+
+    logger.info(
+        "BOOKING_EXPIRY %s",
+        " ".join(f"{k}={v}" for k, v in counts.items()),
+    )
+    return counts
+
+
+# =========================================================
+# ✅ Planificateur "in-process" (option): thread daemon qui lance sweep()
+# toutes les N secondes — ex: dans le process du push_worker
+# =========================================================
+
+def start_scheduler(interval: float = None) -> threading.Thread:
+    interval = float(interval or getattr(settings, "BOOKING_EXPIRY_INTERVAL_SECONDS", 300))
+
+    def _loop():
+        while True:
+            try:
+                sweep()
+            except Exception as e:
+                logger.exception("BOOKING_EXPIRY sweep failed: %s", str(e))
+            finally:
+                close_old_connections()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=_loop, name="booking-expiry", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,227 @@
+#listings/fake_paystack.py
+import hmac
+import json
+import random
+import re
+import hashlib
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+logger = logging.getLogger("push")
+
+
+# =========================================================
+# ✅ Faux Paystack local (dev / tests / test de charge) — JAMAIS en prod
+# PAYSTACK_BASE_URL=http://127.0.0.1:8765 + manage.py fake_paystack
+#
+# - POST /transaction/initialize, GET /transaction/verify/<reference>
+# - webhook "charge.success" signé (x-paystack-signature) envoyé à webhook_url après initialize
+# - latence (latency_ms ± jitter_ms), pannes (failure_rate -> HTTP 500), refus (decline_rate)
+#
+# Statut renvoyé par verify:
+# - référence qui contient "fail" / "abandon" / "pending" -> failed / abandoned / ongoing
+# - sinon: tiré à l'initialize (decline_rate -> failed), puis default_outcome
+# =========================================================
+
+_VERIFY_RE = re.compile(r"^/transaction/verify/(?P<reference>[^/?]+)")
+
+REFERENCE_OUTCOMES = (
+    ("fail", "failed"),
+    ("abandon", "abandoned"),
+    ("pending", "ongoing"),
+)
+
+
+def sign_webhook(secret: str, body: bytes) -> str:
+    # ✅ même calcul que PaystackWebhookView (HMAC SHA512 du body brut)
+    return hmac.new((secret or "").encode("utf-8"), body, hashlib.sha512).hexdigest()
+
+
+class FakePaystackState:
+    def __init__(
+        self,
+        default_outcome: str = "success",
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        failure_rate: float = 0,
+        decline_rate: float = 0,
+        webhook_url: str = None,
+        webhook_secret: str = "",
+        webhook_delay: float = 0.5,
+    ):
+        self.default_outcome = default_outcome
+        self.latency_ms = float(latency_ms)
+        self.jitter_ms = float(jitter_ms)
+        self.failure_rate = float(failure_rate)
+        self.decline_rate = float(decline_rate)
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.webhook_delay = float(webhook_delay)
+
+        self.transactions = {}  # reference -> {"amount", "email", "outcome", ...}
+        self.calls = {"initialize": 0, "verify": 0, "injected_errors": 0, "webhooks_sent": 0, "webhooks_failed": 0}
+        self._lock = threading.Lock()
+
+    def outcome_for(self, reference: str) -> str:
+        for marker, outcome in REFERENCE_OUTCOMES:
+            if marker in reference:
+                return outcome
+        tx = self.transactions.get(reference)
+        if tx and tx.get("outcome"):
+            return tx["outcome"]
+        return self.default_outcome
+
+    def count(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+
+    def simulate_network(self) -> bool:
+        """
+        ✅ Attend la latence simulée -> False si on doit répondre une panne (500)
+        """
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        if self.failure_rate and random.random() < self.failure_rate:
+            self.count("injected_errors")
+            return False
+        return True
+
+    def emit_webhook(self, reference: str):
+        """
+        ✅ charge.success signé, comme Paystack après le paiement du client
+        """
+        tx = self.transactions.get(reference) or {}
+        body = json.dumps({
+            "event": "charge.success",
+            "data": {
+                "reference": reference,
+                "status": "success",
+                "amount": tx.get("amount"),
+                "currency": "XOF",
+                "metadata": tx.get("metadata"),
+            },
+        }).encode("utf-8")
+        try:
+            r = requests.post(
+                self.webhook_url,
+                data=body,
+                headers={
+                    "Content-Type": "application/json",
+                    "x-paystack-signature": sign_webhook(self.webhook_secret, body),
+                },
+                timeout=10,
+            )
+            self.count("webhooks_sent" if r.status_code < 400 else "webhooks_failed")
+        except Exception as e:
+            self.count("webhooks_failed")
+            logger.warning("FAKE_PAYSTACK webhook failed ref=%s err=%s", reference, str(e))
+
+    def schedule_webhook(self, reference: str):
+        if not self.webhook_url or self.outcome_for(reference) != "success":
+            return
+        timer = threading.Timer(self.webhook_delay, self.emit_webhook, args=(reference,))
+        timer.daemon = True
+        timer.start()
+
+
+def _handler_for(state: FakePaystackState):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass  # ✅ silencieux
+
+        def _json(self, code: int, body: dict):
+            raw = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _authorized(self) -> bool:
+            if (self.headers.get("Authorization") or "").startswith("Bearer "):
+                return True
+            self._json(401, {"status": False, "message": "Invalid key"})
+            return False
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+
+            if not self._authorized():
+                return
+            if self.path.rstrip("/") != "/transaction/initialize":
+                return self._json(404, {"status": False, "message": "Not found"})
+
+            state.count("initialize")
+            if not state.simulate_network():
+                return self._json(500, {"status": False, "message": "Simulated failure"})
+
+            payload = json.loads(raw or b"{}")
+            reference = payload.get("reference") or ""
+            declined = bool(state.decline_rate and random.random() < state.decline_rate)
+            state.transactions[reference] = {**payload, "outcome": "failed" if declined else None}
+            state.schedule_webhook(reference)
+
+            self._json(200, {
+                "status": True,
+                "message": "Authorization URL created",
+                "data": {
+                    "authorization_url": f"http://{self.headers.get('Host')}/checkout/{reference}",
+                    "access_code": f"ac_{reference}",
+                    "reference": reference,
+                },
+            })
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            m = _VERIFY_RE.match(self.path)
+            if not m:
+                return self._json(404, {"status": False, "message": "Not found"})
+
+            state.count("verify")
+            if not state.simulate_network():
+                return self._json(500, {"status": False, "message": "Simulated failure"})
+
+            reference = m.group("reference")
+            tx = state.transactions.get(reference) or {}
+            self._json(200, {
+                "status": True,
+                "message": "Verification successful",
+                "data": {
+                    "reference": reference,
+                    "status": state.outcome_for(reference),
+                    "amount": tx.get("amount"),
+                    "currency": "XOF",
+                },
+            })
+
+    return Handler
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8765, **state_options):
+    """
+    ✅ -> serveur (pas encore démarré); state accessible via server.state
+    port=0 -> port libre choisi par l'OS (tests)
+    state_options: default_outcome, latency_ms, jitter_ms, failure_rate, decline_rate,
+                   webhook_url, webhook_secret, webhook_delay
+    """
+    state = FakePaystackState(**state_options)
+    server = ThreadingHTTPServer((host, port), _handler_for(state))
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def start_in_thread(**kwargs):
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="fake-paystack", daemon=True).start()
+    return server
@@ -1,8 +1,10 @@
-import time
+import asyncio
+import contextlib
+import weakref
 import unicodedata
 from typing import Optional, Dict, Any, List, Tuple
 
-import requests
+import aiohttp
 
 
 # ✅ Liste des 10 communes d'Abidjan (classique)
@@ -23,6 +25,9 @@ ABIDJAN_COMMUNES = [
 _REVERSE_CACHE: Dict[Tuple[float, float], Dict[str, Any]] = {}
 _REVERSE_CACHE_MAX = 500
 
+NOMINATIM_REVERSE_URL = "https://nominatim.openstreetmap.org/reverse"
+NOMINATIM_SEARCH_URL = "https://nominatim.openstreetmap.org/search"
+
 
 def _norm(s: str) -> str:
     """
@@ -69,7 +74,164 @@ def detect_abidjan_commune(display_name: Optional[str], addr: Dict[str, Any]) ->
     return None
 
 
-def reverse_geocode_nominatim(latitude: float, longitude: float, timeout: int = 15, retries: int = 2) -> dict:
+def _pick_city(addr: Dict[str, Any]) -> Optional[str]:
+    # ✅ city = ville
+    return addr.get("city") or addr.get("town") or addr.get("village") or addr.get("state")
+
+
+def _pick_borough(addr: Dict[str, Any]) -> Optional[str]:
+    # ✅ borough = quartier (on prend neighbourhood/quarter en priorité)
+    return (
+        addr.get("neighbourhood")
+        or addr.get("quarter")
+        or addr.get("city_district")
+        or addr.get("district")
+    )
+
+
+def _pick_area(display_name: Optional[str], addr: Dict[str, Any]) -> Optional[str]:
+    # ✅ area = commune/zone (Abidjan)
+    # IMPORTANT: on force si on détecte une des 10 communes dans l'adresse complète
+    forced_commune = detect_abidjan_commune(display_name, addr)
+    return forced_commune or (
+        addr.get("suburb")  # ✅ souvent commune à Abidjan
+        or addr.get("city_district")
+        or addr.get("municipality")
+        or addr.get("county")
+        or addr.get("state_district")
+    )
+
+
+def _reverse_cache_key(latitude: float, longitude: float) -> Tuple[float, float]:
+    # ✅ arrondir coords -> rend le cache efficace (et évite spam)
+    return round(float(latitude), 5), round(float(longitude), 5)
+
+
+def _reverse_params(lat_r: float, lng_r: float) -> dict:
+    return {
+        "format": "jsonv2",
+        "lat": lat_r,
+        "lon": lng_r,
+        "zoom": 18,
+        "addressdetails": 1,
+    }
+
+
+def _reverse_headers() -> dict:
+    # ✅ User-Agent propre (évite les rejets)
+    return {"User-Agent": "DecrouResi/1.0 (Abidjan, CI) reverse-geocode"}
+
+
+def _search_params(query: str, limit: int) -> dict:
+    return {
+        "q": query,
+        "format": "jsonv2",
+        "addressdetails": 1,
+        "limit": limit,
+        "countrycodes": "ci",  # ✅ CI
+    }
+
+
+def _search_headers() -> dict:
+    return {"User-Agent": "DecrouResi/1.0 (Abidjan, CI) forward-geocode"}
+
+
+def _normalize_reverse(data: dict, lat_r: float, lng_r: float) -> dict:
+    """
+    ✅ Réponse Nominatim /reverse -> dict normalisé
+    """
+    data = data or {}
+    addr = data.get("address", {}) or {}
+    display = data.get("display_name")
+
+    return {
+        "address_label": display,
+        "city": _pick_city(addr),
+        "area": _pick_area(display, addr),
+        "borough": _pick_borough(addr),
+        "latitude": lat_r,
+        "longitude": lng_r,
+        "raw": data,
+    }
+
+
+def _normalize_search(results: list) -> list:
+    """
+    ✅ Réponse Nominatim /search -> liste normalisée
+    """
+    cleaned = []
+    for item in results or []:
+        addr = item.get("address", {}) or {}
+        display = item.get("display_name")
+
+        lat_val = float(item.get("lat")) if item.get("lat") else None
+        lng_val = float(item.get("lon")) if item.get("lon") else None
+
+        if lat_val is None or lng_val is None:
+            continue
+
+        cleaned.append(
+            {
+                "address_label": display,
+                "latitude": lat_val,
+                "longitude": lng_val,
+                "city": _pick_city(addr),
+                "area": _pick_area(display, addr),
+                "borough": _pick_borough(addr),
+            }
+        )
+    return cleaned
+
+
+def _cache_reverse(cache_key: Tuple[float, float], result: dict) -> None:
+    # ✅ cache (et purge si trop gros)
+    if len(_REVERSE_CACHE) >= _REVERSE_CACHE_MAX:
+        _REVERSE_CACHE.clear()
+    _REVERSE_CACHE[cache_key] = result
+
+
+# =========================================================
+# ✅ Appels Nominatim (ASGI): client aiohttp non bloquant
+# =========================================================
+
+# ✅ une session aiohttp par event loop, UNIQUEMENT sous ASGI (1 loop qui vit autant que le worker)
+# sous WSGI, async_to_sync crée puis ferme un loop par appel: une session partagée par loop fuirait
+# (jamais fermée, "Unclosed client session") -> session ouverte et fermée par appel
+_SESSIONS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+
+
+def _shared_session() -> aiohttp.ClientSession:
+    loop = asyncio.get_running_loop()
+    session = _SESSIONS.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession()
+        _SESSIONS[loop] = session
+    return session
+
+
+@contextlib.asynccontextmanager
+async def _client_session(shared: bool):
+    if shared:
+        yield _shared_session()
+        return
+    async with aiohttp.ClientSession() as session:
+        yield session
+
+
+async def _get_json(session: aiohttp.ClientSession, url: str, params: dict, headers: dict, timeout: int):
+    async with session.get(
+        url,
+        params=params,
+        headers=headers,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    ) as r:
+        r.raise_for_status()
+        return await r.json(content_type=None)
+
+
+async def reverse_geocode_nominatim_async(
+    latitude: float, longitude: float, timeout: int = 15, retries: int = 2, shared_session: bool = False,
+) -> dict:
     """
     Retourne un dict normalisé:
     {
@@ -80,97 +242,39 @@ def reverse_geocode_nominatim(latitude: float, longitude: float, timeout: int =
       "raw": {...}
     }
 
-    ✅ timeout augmenté
-    ✅ retries en cas de timeout
+    ✅ retries en cas de timeout (backoff sans bloquer le worker)
     ✅ cache simple (coords arrondies) pour éviter spam Nominatim
     ✅ force commune d'Abidjan si détectée dans l'adresse
+    - lève asyncio.TimeoutError si tous les essais ont expiré
+    - shared_session=True: session du loop (ASGI uniquement)
     """
-    # ✅ arrondir coords -> rend le cache efficace (et évite spam)
-    lat_r = round(float(latitude), 5)
-    lng_r = round(float(longitude), 5)
-    cache_key = (lat_r, lng_r)
+    cache_key = _reverse_cache_key(latitude, longitude)
+    lat_r, lng_r = cache_key
 
     if cache_key in _REVERSE_CACHE:
         return _REVERSE_CACHE[cache_key]
 
-    url = "https://nominatim.openstreetmap.org/reverse"
-    params = {
-        "format": "jsonv2",
-        "lat": lat_r,
-        "lon": lng_r,
-        "zoom": 18,
-        "addressdetails": 1,
-    }
-    headers = {
-        # ✅ User-Agent propre (évite les rejets)
-        "User-Agent": "DecrouResi/1.0 (Abidjan, CI) reverse-geocode",
-    }
-
     last_err: Optional[Exception] = None
 
-    for attempt in range(retries + 1):
-        try:
-            r = requests.get(url, params=params, headers=headers, timeout=timeout)
-            r.raise_for_status()
-            data = r.json() or {}
-
-            addr = data.get("address", {}) or {}
-            display = data.get("display_name")
-
-            # ✅ city = ville
-            city = addr.get("city") or addr.get("town") or addr.get("village") or addr.get("state")
-
-            # ✅ borough = quartier (on prend neighbourhood/quarter en priorité)
-            borough = (
-                addr.get("neighbourhood")
-                or addr.get("quarter")
-                or addr.get("city_district")
-                or addr.get("district")
-            )
-
-            # ✅ area = commune/zone (Abidjan)
-            # IMPORTANT: on force si on détecte une des 10 communes dans l'adresse complète
-            forced_commune = detect_abidjan_commune(display, addr)
-
-            area = forced_commune or (
-                addr.get("suburb")  # ✅ souvent commune à Abidjan
-                or addr.get("city_district")
-                or addr.get("municipality")
-                or addr.get("county")
-                or addr.get("state_district")
-            )
-
-            result = {
-                 "address_label": display,
-                 "city": city,
-                 "area": area,
-                 "borough": borough,
-                 "latitude": lat_r,
-                 "longitude": lng_r,
-                 "raw": data,
-            }
-
-
-            # ✅ cache (et purge si trop gros)
-            if len(_REVERSE_CACHE) >= _REVERSE_CACHE_MAX:
-                _REVERSE_CACHE.clear()
-            _REVERSE_CACHE[cache_key] = result
+    async with _client_session(shared_session) as session:
+        for attempt in range(retries + 1):
+            try:
+                data = await _get_json(session, NOMINATIM_REVERSE_URL, _reverse_params(lat_r, lng_r), _reverse_headers(), timeout)
+                result = _normalize_reverse(data or {}, lat_r, lng_r)
+                _cache_reverse(cache_key, result)
+                return result
 
-            return result
+            except asyncio.TimeoutError as e:
+                last_err = e
+                # ✅ backoff sans bloquer le worker
+                await asyncio.sleep(0.35 * (attempt + 1))
 
-        except requests.exceptions.Timeout as e:
-            last_err = e
-            # ✅ petit backoff avant retry
-            time.sleep(0.35 * (attempt + 1))
-        except Exception as e:
-            # ✅ autres erreurs -> on remonte
-            raise e
-
-    # ✅ si on a échoué uniquement par timeout
     raise last_err  # type: ignore
 
 
-def forward_geocode_nominatim(query: str, limit: int = 6, timeout: int = 12, retries: int = 1) -> list:
+async def forward_geocode_nominatim_async(
+    query: str, limit: int = 6, timeout: int = 12, retries: int = 1, shared_session: bool = False,
+) -> list:
     """
     ✅ Forward geocoding (texte -> coordonnées + infos)
     Retourne une liste:
@@ -179,77 +283,22 @@ def forward_geocode_nominatim(query: str, limit: int = 6, timeout: int = 12, ret
       ...
     ]
 
-    ✅ timeout augmenté + retry
-    ✅ force commune Abidjan si détectée
+    ✅ retry en cas de timeout + force commune Abidjan si détectée
     """
     query = (query or "").strip()
     if not query:
         return []
 
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        "q": query,
-        "format": "jsonv2",
-        "addressdetails": 1,
-        "limit": limit,
-        "countrycodes": "ci",  # ✅ CI
-    }
-    headers = {"User-Agent": "DecrouResi/1.0 (Abidjan, CI) forward-geocode"}
-
     last_err: Optional[Exception] = None
 
-    for attempt in range(retries + 1):
-        try:
-            r = requests.get(url, params=params, headers=headers, timeout=timeout)
-            r.raise_for_status()
-            results = r.json() or []
-
-            cleaned = []
-            for item in results:
-                addr = item.get("address", {}) or {}
-                display = item.get("display_name")
-
-                city = addr.get("city") or addr.get("town") or addr.get("village") or addr.get("state")
-
-                borough = (
-                    addr.get("neighbourhood")
-                    or addr.get("quarter")
-                    or addr.get("city_district")
-                    or addr.get("district")
-                )
-
-                forced_commune = detect_abidjan_commune(display, addr)
-                area = forced_commune or (
-                    addr.get("suburb")
-                    or addr.get("city_district")
-                    or addr.get("municipality")
-                    or addr.get("county")
-                    or addr.get("state_district")
-                )
-
-                lat_val = float(item.get("lat")) if item.get("lat") else None
-                lng_val = float(item.get("lon")) if item.get("lon") else None
-
-                if lat_val is None or lng_val is None:
-                    continue
-
-                cleaned.append(
-                    {
-                        "address_label": display,
-                        "latitude": lat_val,
-                        "longitude": lng_val,
-                        "city": city,
-                        "area": area,
-                        "borough": borough,
-                    }
-                )
-
-            return cleaned
-
-        except requests.exceptions.Timeout as e:
-            last_err = e
-            time.sleep(0.25 * (attempt + 1))
-        except Exception as e:
-            raise e
+    async with _client_session(shared_session) as session:
+        for attempt in range(retries + 1):
+            try:
+                results = await _get_json(session, NOMINATIM_SEARCH_URL, _search_params(query, limit), _search_headers(), timeout)
+                return _normalize_search(results or [])
+
+            except asyncio.TimeoutError as e:
+                last_err = e
+                await asyncio.sleep(0.25 * (attempt + 1))
 
     raise last_err  # type: ignore
@@ -0,0 +1,362 @@
+#listings/ical.py
+import socket
+import logging
+import contextlib
+import ipaddress
+from datetime import date, datetime, timedelta
+from urllib.parse import urljoin, urlsplit
+
+import requests
+import requests.adapters
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Booking,
+    ExternalCalendar,
+    ExternalCalendarBlock,
+    BLOCKING_BOOKING_STATUSES,
+)
+from . import occupancy
+
+logger = logging.getLogger("ical")
+
+
+# =========================================================
+# ✅ Export .ics (bookings bloquants d'une résidence)
+# - pas de données perso: juste "Réservé" + dates
+# - les blocs importés ne sont PAS ré-exportés (évite les boucles entre plateformes)
+# =========================================================
+
+PRODID = "-//DecrouResi//Calendrier residence//FR"
+
+
+def _escape(text: str) -> str:
+    return (
+        (text or "")
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    # ✅ RFC 5545: lignes de 75 octets max, continuation = CRLF + espace
+    out, chunk = [], ""
+    for ch in line:
+        if len((chunk + ch).encode("utf-8")) > 75:
+            out.append(chunk)
+            chunk = " " + ch
+        else:
+            chunk += ch
+    out.append(chunk)
+    return "\r\n".join(out)
+
+
+def render_listing_ics(listing) -> str:
+    host = getattr(settings, "ICAL_UID_DOMAIN", "decrouresi.com")
+    stamp = timezone.now().strftime("%Y%m%dT%H%M%SZ")
+
+    rows = (
+        Booking.objects
+        .filter(
+            listing_id=listing.id,
+            status__in=BLOCKING_BOOKING_STATUSES,
+            start_date__isnull=False,
+            end_date__isnull=False,
+        )
+        .order_by("start_date")
+        .values_list("id", "start_date", "end_date")
+    )
+
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(listing.title)}",
+    ]
+    for booking_id, start, end in rows:
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:booking-{booking_id}@{host}",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART;VALUE=DATE:{start:%Y%m%d}",
+            f"DTEND;VALUE=DATE:{end:%Y%m%d}",
+            "SUMMARY:Réservé",
+            "TRANSP:OPAQUE",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(_fold(line) for line in lines) + "\r\n"
+
+
+# =========================================================
+# ✅ Import .ics externes -> ExternalCalendarBlock
+# parseur minimal (VEVENT: UID, SUMMARY, DTSTART, DTEND) — suffit pour Airbnb / Booking.com
+# =========================================================
+
+def _unfold(text: str):
+    lines = []
+    for raw in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        if raw[:1] in (" ", "\t") and lines:
+            lines[-1] += raw[1:]
+        elif raw:
+            lines.append(raw)
+    return lines
+
+
+def _parse_date(value: str):
+    # ✅ DATE (20270105) ou DATE-TIME (20270105T140000Z): on garde le jour
+    return datetime.strptime(value.strip()[:8], "%Y%m%d").date()
+
+
+def parse_ics(text: str):
+    """
+    ✅ -> [{"uid", "summary", "start_date", "end_date"}] (end exclu, comme Booking)
+    """
+    events, current = [], None
+    for line in _unfold(text):
+        name, _, value = line.partition(":")
+        key = name.split(";", 1)[0].upper()
+
+        if key == "BEGIN" and value.upper() == "VEVENT":
+            current = {}
+        elif key == "END" and value.upper() == "VEVENT":
+            if current and current.get("start_date"):
+                start = current["start_date"]
+                end = current.get("end_date") or start + timedelta(days=1)
+                if end <= start:
+                    end = start + timedelta(days=1)
+                events.append({
+                    "uid": current.get("uid", "")[:255],
+                    "summary": current.get("summary", "")[:255],
+                    "start_date": start,
+                    "end_date": end,
+                })
+            current = None
+        elif current is not None:
+            try:
+                if key == "DTSTART":
+                    current["start_date"] = _parse_date(value)
+                elif key == "DTEND":
+                    current["end_date"] = _parse_date(value)
+            except ValueError:
+                continue
+            if key == "UID":
+                current["uid"] = value
+            elif key == "SUMMARY":
+                current["summary"] = value.replace("\\,", ",").replace("\\;", ";")
+    return events
+
+
+def _horizon():
+    # ✅ on ne garde pas le passé lointain
+    return date.today() - timedelta(days=int(getattr(settings, "ICAL_IMPORT_PAST_DAYS", 30)))
+
+
+# =========================================================
+# ✅ Téléchargement sûr (URL fournie par un gérant = entrée non fiable, anti-SSRF)
+# - https uniquement, l'hôte doit résoudre vers des adresses publiques (pas de réseau interne)
+# - connexion à l'adresse IP validée (pas de 2e résolution DNS -> pas de DNS rebinding),
+#   Host / SNI / certificat restent ceux du nom d'hôte
+# - redirections suivies à la main, chaque étape re-vérifiée (max ICAL_IMPORT_MAX_REDIRECTS)
+# - corps lu en streaming, coupé à ICAL_IMPORT_MAX_BYTES
+# - last_error = message générique (le détail reste dans les logs serveur)
+# =========================================================
+
+class UnsafeCalendarURL(ValueError):
+    pass
+
+
+class CalendarTooLarge(ValueError):
+    pass
+
+
+# ✅ messages stockés dans ExternalCalendar.last_error (visibles par le gérant)
+FETCH_ERRORS = {
+    "refused": "URL refusée (https public uniquement).",
+    "too_large": "Calendrier trop volumineux.",
+    "http": "Le calendrier a répondu avec une erreur.",
+    "invalid": "Le fichier reçu n'est pas un calendrier .ics valide.",
+    "unreachable": "Calendrier injoignable.",
+}
+
+
+def _resolve_public(url: str):
+    """
+    ✅ -> (hostname, port, adresse IP publique à utiliser pour la connexion)
+    Lève UnsafeCalendarURL si l'URL n'est pas https ou si UNE des adresses résolues n'est pas publique
+    (privée, loopback, link-local, réservée...).
+    """
+    parts = urlsplit(url or "")
+    if parts.scheme != "https" or not parts.hostname or parts.username or parts.password:
+        raise UnsafeCalendarURL("https URL without credentials required")
+    try:
+        port = parts.port or 443
+        infos = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise UnsafeCalendarURL(f"cannot resolve {parts.hostname}")
+    addresses = []
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if not address.is_global or address.is_multicast:
+            raise UnsafeCalendarURL(f"{parts.hostname} resolves to non-public address {address}")
+        addresses.append(str(address))
+    if not addresses:
+        raise UnsafeCalendarURL(f"cannot resolve {parts.hostname}")
+    return parts.hostname, port, addresses[0]
+
+
+def validate_calendar_url(url: str) -> str:
+    """
+    ✅ Contrôle à l'ajout (serializer). Au téléchargement, fetch_calendar re-résout
+    et se connecte à l'adresse validée (le DNS peut changer entre-temps).
+    """
+    _resolve_public(url)
+    return url
+
+
+class _PinnedAdapter(requests.adapters.HTTPAdapter):
+    """
+    ✅ Connexion TCP vers l'IP déjà validée; SNI + vérification du certificat sur le nom d'hôte
+    """
+    def __init__(self, hostname: str, address: str, **kwargs):
+        self.hostname = hostname
+        self.address = address
+        super().__init__(max_retries=0, **kwargs)
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        host_params["host"] = self.address
+        pool_kwargs["server_hostname"] = self.hostname
+        pool_kwargs["assert_hostname"] = self.hostname
+        return host_params, pool_kwargs
+
+
+@contextlib.contextmanager
+def _pinned_get(url: str, headers: dict, timeout: int):
+    hostname, port, address = _resolve_public(url)
+    host = hostname if port == 443 else f"{hostname}:{port}"
+    with requests.Session() as session:
+        session.trust_env = False  # ✅ pas de proxy d'environnement: il résoudrait le nom lui-même
+        session.mount("https://", _PinnedAdapter(hostname, address))
+        with session.get(
+            url, headers={**headers, "Host": host}, timeout=timeout, allow_redirects=False, stream=True,
+        ) as resp:
+            yield resp
+
+
+def fetch_calendar(url: str, headers: dict):
+    """
+    ✅ GET sûr -> (status_code, response headers, texte). 304 -> texte vide.
+    """
+    timeout = int(getattr(settings, "ICAL_IMPORT_TIMEOUT", 15))
+    max_bytes = int(getattr(settings, "ICAL_IMPORT_MAX_BYTES", 2 * 1024 * 1024))
+    max_redirects = int(getattr(settings, "ICAL_IMPORT_MAX_REDIRECTS", 3))
+
+    for _ in range(max_redirects + 1):
+        with _pinned_get(url, headers, timeout) as resp:
+            if resp.is_redirect:
+                url = urljoin(url, resp.headers.get("Location") or "")
+                continue
+            if resp.status_code == 304:
+                return 304, resp.headers, ""
+            resp.raise_for_status()
+
+            if int(resp.headers.get("Content-Length") or 0) > max_bytes:
+                raise CalendarTooLarge(resp.headers.get("Content-Length"))
+            body = bytearray()
+            for chunk in resp.iter_content(chunk_size=64 * 1024):
+                body += chunk
+                if len(body) > max_bytes:
+                    raise CalendarTooLarge(f">{max_bytes}")
+            return resp.status_code, resp.headers, body.decode(resp.encoding or "utf-8", errors="replace")
+
+    raise UnsafeCalendarURL("too many redirects")
+
+
+def _error_kind(exc: Exception) -> str:
+    if isinstance(exc, UnsafeCalendarURL):
+        return "refused"
+    if isinstance(exc, CalendarTooLarge):
+        return "too_large"
+    if isinstance(exc, requests.HTTPError):
+        return "http"
+    if isinstance(exc, ValueError):
+        return "invalid"
+    return "unreachable"
+
+
+def sync_calendar(calendar: ExternalCalendar) -> dict:
+    """
+    ✅ Télécharge (GET conditionnel, fetch_calendar) et remplace les blocs de ce calendrier
+    -> {"status": "updated" | "not_modified" | "error", "blocks": n}
+    Appelé uniquement par le worker (manage.py import_calendars), jamais dans une requête HTTP.
+    """
+    headers = {"User-Agent": getattr(settings, "ICAL_USER_AGENT", "DecrouResi/1.0 (calendar sync)")}
+    if calendar.etag:
+        headers["If-None-Match"] = calendar.etag
+    if calendar.last_modified:
+        headers["If-Modified-Since"] = calendar.last_modified
+
+    now = timezone.now()
+    try:
+        status_code, resp_headers, text = fetch_calendar(calendar.url, headers)
+        if status_code == 304:
+            ExternalCalendar.objects.filter(id=calendar.id).update(last_fetched_at=now, last_error=None)
+            return {"status": "not_modified", "blocks": None}
+        if "BEGIN:VCALENDAR" not in text[:1024].upper():
+            raise ValueError("not an iCalendar body")
+        events = parse_ics(text)
+    except Exception as e:
+        ExternalCalendar.objects.filter(id=calendar.id).update(last_fetched_at=now, last_error=FETCH_ERRORS[_error_kind(e)])
+        logger.warning("ICAL import failed calendar=%s err=%s", calendar.id, str(e))
+        return {"status": "error", "blocks": None}
+
+    horizon = _horizon()
+    events = [e for e in events if e["end_date"] > horizon]
+
+    with transaction.atomic():
+        old = list(calendar.blocks.values_list("start_date", "end_date"))
+        calendar.blocks.all().delete()
+        ExternalCalendarBlock.objects.bulk_create([
+            ExternalCalendarBlock(calendar=calendar, listing_id=calendar.listing_id, **e)
+            for e in events
+        ])
+        ExternalCalendar.objects.filter(id=calendar.id).update(
+            etag=resp_headers.get("ETag"),
+            last_modified=resp_headers.get("Last-Modified"),
+            last_fetched_at=now,
+            last_error=None,
+        )
+
+        # ✅ index d'occupation: mois des anciens + nouveaux blocs
+        changed = set(old) ^ {(e["start_date"], e["end_date"]) for e in events}
+        if changed:
+            occupancy.refresh_ranges(calendar.listing_id, changed)
+
+    return {"status": "updated", "blocks": len(events)}
+
+
+def sync_new() -> int:
+    """
+    ✅ Calendriers jamais importés (ajoutés par un gérant): traités en priorité par le worker
+    """
+    count = 0
+    for calendar in ExternalCalendar.objects.filter(is_active=True, last_fetched_at__isnull=True).order_by("id"):
+        sync_calendar(calendar)
+        count += 1
+    return count
+
+
+def sync_all() -> dict:
+    counts = {"updated": 0, "not_modified": 0, "error": 0}
+    for calendar in ExternalCalendar.objects.filter(is_active=True).order_by("id").iterator():
+        counts[sync_calendar(calendar)["status"]] += 1
+    logger.info("ICAL import %s", " ".join(f"{k}={v}" for k, v in counts.items()))
+    return counts
@@ -0,0 +1,209 @@
+#listings/idempotency.py
+import json
+import hashlib
+import logging
+import functools
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger("push")
+
+
+# =========================================================
+# ✅ Idempotency-Key (header déjà autorisé par CORS_ALLOW_HEADERS)
+# - 1er envoi: la vue s'exécute, la réponse est stockée
+# - renvoi (réseau mobile instable): même réponse rejouée, rien n'est ré-exécuté
+# - même clé + autre body: 422 / clé encore en cours: 409
+# - seules les réponses 2xx sont figées; erreurs (exception, 4xx, 5xx): la clé est libérée
+#   -> le client peut réessayer (ex: initialize Paystack en échec, booking pas encore approuvé)
+# - in_progress = bail (locked_until): process tué en pleine requête -> la clé est reprise à expiration
+#   tant que la vue tourne, le bail est renouvelé (handler plus long que le bail: Paystack lent...)
+# =========================================================
+
+HEADER = "Idempotency-Key"
+
+
+def _ttl() -> timedelta:
+    return timedelta(hours=int(getattr(settings, "IDEMPOTENCY_KEY_TTL_HOURS", 24)))
+
+
+def _lease() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, "IDEMPOTENCY_LOCK_SECONDS", 60)))
+
+
+def _fingerprint(request) -> str:
+    try:
+        body = json.dumps(request.data, sort_keys=True, cls=JSONEncoder)
+    except Exception:
+        body = (request.body or b"").decode("utf-8", "replace")
+    raw = f"{request.method}\n{request.path}\n{body}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _claim(user, scope: str, key: str, fingerprint: str):
+    """
+    ✅ -> (row créée ou reprise par nous, None) ou (None, row existante)
+    """
+    now = timezone.now()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                row = IdempotencyKey.objects.create(
+                    user=user,
+                    scope=scope,
+                    key=key,
+                    fingerprint=fingerprint,
+                    locked_until=now + _lease(),
+                    expires_at=now + _ttl(),
+                )
+            return row, None
+        except IntegrityError:
+            existing = IdempotencyKey.objects.filter(user=user, scope=scope, key=key).first()
+            if existing is None:
+                continue  # ✅ supprimée entre-temps: on retente
+            if existing.expires_at <= now:
+                IdempotencyKey.objects.filter(id=existing.id, expires_at__lte=now).delete()
+                continue
+            if _take_over(existing, fingerprint, now):
+                return existing, None
+            return None, existing
+    return None, None
+
+
+def _take_over(row: IdempotencyKey, fingerprint: str, now) -> bool:
+    """
+    ✅ in_progress dont le bail a expiré (ou antérieur aux bails): on reprend la clé
+    UPDATE conditionnel: 2 renvois simultanés -> un seul reprend, l'autre reçoit 409
+    """
+    if row.status != "in_progress" or row.fingerprint != fingerprint:
+        return False
+    if row.locked_until is not None and row.locked_until > now:
+        return False
+    locked_until = now + _lease()
+    taken = (
+        IdempotencyKey.objects
+        .filter(id=row.id, status="in_progress", locked_until=row.locked_until)
+        .update(locked_until=locked_until)
+    )
+    row.locked_until = locked_until
+    return bool(taken)
+
+
+class _LeaseKeeper(threading.Thread):
+    """
+    ✅ Renouvelle le bail toutes les lease/3 pendant que la vue s'exécute
+    UPDATE conditionnel sur locked_until (jeton): si la clé a été reprise, on arrête
+    """
+    def __init__(self, row: IdempotencyKey):
+        super().__init__(name=f"idempotency-lease-{row.id}", daemon=True)
+        self.row_id = row.id
+        self.locked_until = row.locked_until
+        self._done = threading.Event()
+
+    def run(self):
+        every = _lease().total_seconds() / 3
+        try:
+            while not self._done.wait(every):
+                locked_until = timezone.now() + _lease()
+                renewed = (
+                    IdempotencyKey.objects
+                    .filter(id=self.row_id, status="in_progress", locked_until=self.locked_until)
+                    .update(locked_until=locked_until)
+                )
+                if not renewed:
+                    return
+                self.locked_until = locked_until
+        except Exception as e:
+            logger.warning("IDEMPOTENCY lease renewal failed key_id=%s err=%s", self.row_id, str(e))
+        finally:
+            connection.close()  # ✅ connexion propre à ce thread
+
+    def stop(self):
+        """
+        ✅ -> locked_until courant (pour finaliser la ligne avec le bon jeton)
+        """
+        self._done.set()
+        self.join()
+        return self.locked_until
+
+
+def _replay(row: IdempotencyKey) -> Response:
+    response = Response(row.response_body, status=row.response_status)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(view_method):
+    """
+    ✅ Décorateur pour les méthodes (post) des APIView
+    Sans header Idempotency-Key: comportement inchangé.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = (request.headers.get(HEADER) or "").strip()[:255]
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        user = request.user if getattr(request.user, "is_authenticated", False) else None
+        scope = f"{request.method} {request.path}"[:255]
+        fingerprint = _fingerprint(request)
+
+        row, existing = _claim(user, scope, key, fingerprint)
+
+        if existing is not None:
+            if existing.fingerprint != fingerprint:
+                return Response(
+                    {"detail": "Idempotency-Key déjà utilisée pour une autre requête."},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if existing.status != "done":
+                return Response(
+                    {"detail": "Requête déjà en cours de traitement."},
+                    status=status.HTTP_409_CONFLICT,
+                    headers={"Retry-After": "2"},
+                )
+            return _replay(existing)
+
+        if row is None:
+            # ✅ course improbable (clé supprimée/recréée en boucle): on exécute sans cache
+            return view_method(self, request, *args, **kwargs)
+
+        keeper = _LeaseKeeper(row)
+        keeper.start()
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            IdempotencyKey.objects.filter(id=row.id, locked_until=keeper.stop()).delete()
+            raise
+
+        # ✅ notre bail: si la clé a été reprise entre-temps (bail perdu), on ne touche plus à la ligne
+        ours = IdempotencyKey.objects.filter(id=row.id, locked_until=keeper.stop())
+
+        # ✅ 4xx: dépend de l'état (statut du booking, Paystack indisponible, 409/429 transitoires)
+        # -> pas figé: un renvoi avec la même clé ré-exécute la vue
+        if not 200 <= response.status_code < 300 or not hasattr(response, "data"):
+            ours.delete()
+            return response
+
+        ours.update(
+            status="done",
+            response_status=response.status_code,
+            response_body=json.loads(json.dumps(response.data, cls=JSONEncoder)),
+        )
+        return response
+
+    return wrapper
+
+
+def purge_expired(now=None) -> int:
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
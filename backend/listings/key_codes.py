@@ -0,0 +1,107 @@
+#listings/key_codes.py
+import hmac
+import base64
+import hashlib
+from datetime import timedelta
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import KeyCodeAttempt
+
+
+# =========================================================
+# ✅ Codes clés (check-in) — jamais en clair en base
+# - key_code_hash: HMAC-SHA256(secret serveur, "<gérant>:<code>")
+#   -> validation = 1 seule recherche sur index (uniq_active_key_code_hash)
+#   -> le même code chez 2 gérants donne 2 hash différents
+# - key_code_encrypted: Fernet (AES + HMAC), déchiffré seulement pour le client (my-key-code)
+# - compteur d'échecs par gérant (6 chiffres = 1M combinaisons, on limite les essais)
+# =========================================================
+
+def _secret() -> bytes:
+    return (getattr(settings, "KEY_CODE_SECRET", "") or settings.SECRET_KEY).encode("utf-8")
+
+
+def hash_key_code(owner_id, code: str) -> str:
+    message = f"{owner_id}:{(code or '').strip()}".encode("utf-8")
+    return hmac.new(_secret(), message, hashlib.sha256).hexdigest()
+
+
+def _fernet() -> Fernet:
+    # ✅ KEY_CODE_ENCRYPTION_KEY (clé Fernet) sinon dérivée du secret des hash (clé distincte)
+    key = getattr(settings, "KEY_CODE_ENCRYPTION_KEY", "")
+    if not key:
+        key = base64.urlsafe_b64encode(hashlib.sha256(b"key-code-encryption:" + _secret()).digest())
+    return Fernet(key)
+
+
+def encrypt_key_code(code: str) -> str:
+    return _fernet().encrypt(code.encode("utf-8")).decode("ascii")
+
+
+def decrypt_key_code(token: str):
+    """
+    ✅ -> code en clair, ou None (pas de code / clé changée)
+    """
+    if not token:
+        return None
+    try:
+        return _fernet().decrypt(token.encode("ascii")).decode("utf-8")
+    except InvalidToken:
+        return None
+
+
+def _max_failures() -> int:
+    return int(getattr(settings, "KEY_CODE_MAX_FAILURES", 5))
+
+
+def _window() -> timedelta:
+    return timedelta(minutes=int(getattr(settings, "KEY_CODE_FAILURE_WINDOW_MINUTES", 15)))
+
+
+def _lock_duration() -> timedelta:
+    return timedelta(minutes=int(getattr(settings, "KEY_CODE_LOCK_MINUTES", 15)))
+
+
+def locked_for(owner_id) -> int:
+    """
+    ✅ Secondes restantes de blocage (0 = le gérant peut essayer)
+    """
+    locked_until = (
+        KeyCodeAttempt.objects
+        .filter(owner_id=owner_id)
+        .values_list("locked_until", flat=True)
+        .first()
+    )
+    if not locked_until:
+        return 0
+    return max(int((locked_until - timezone.now()).total_seconds()), 0)
+
+
+def record_failure(owner_id):
+    """
+    ✅ +1 échec (fenêtre glissante simple); bloque le gérant au-delà du max
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        attempt, _ = KeyCodeAttempt.objects.select_for_update().get_or_create(owner_id=owner_id)
+
+        if attempt.window_started_at < now - _window():
+            attempt.failures = 0
+            attempt.window_started_at = now
+
+        attempt.failures += 1  # ✅ ligne verrouillée: pas de course entre 2 essais simultanés
+        if attempt.failures >= _max_failures():
+            attempt.locked_until = now + _lock_duration()
+            attempt.failures = 0
+            attempt.window_started_at = now
+
+        attempt.save(update_fields=["failures", "window_started_at", "locked_until"])
+
+
+def reset_failures(owner_id):
+    KeyCodeAttempt.objects.filter(owner_id=owner_id).update(failures=0, locked_until=None)
@@ -0,0 +1,212 @@
+#listings/loadtest.py
+import math
+import time
+import secrets
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Listing
+from .reconciliation import RateLimiter
+
+User = get_user_model()
+
+
+# =========================================================
+# ✅ Test de charge du tunnel de réservation (contre une API qui tourne + faux Paystack)
+# demande -> acceptation gérant -> initialize -> verify -> check-in (code clé)
+#
+# - 1 gérant + 1 client + 1 résidence par parcours (pas de throttle par user faussé)
+# - débit global plafonné (token bucket, requêtes HTTP / s)
+# - latences par étape -> count / ok / erreurs / p50 / p95 / max + débit global
+# =========================================================
+
+STEPS = ("request", "approve", "pay_init", "pay_verify", "key_code", "check_in")
+LOADTEST_EMAIL_DOMAIN = "loadtest.local"
+
+
+def percentile(values, pct: float) -> float:
+    """
+    ✅ Rang le plus proche (pas d'interpolation)
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def create_actors(flows: int, run_id: str, price_per_night: int = 10000):
+    """
+    ✅ -> [{"owner_token", "client_token", "listing_id"}, ...] (mots de passe inutilisables)
+    """
+    actors = []
+    for i in range(flows):
+        pair = []
+        for role in ("owner", "client"):
+            u = User(email=f"lt_{run_id}_{role}{i}@{LOADTEST_EMAIL_DOMAIN}", username=f"lt_{run_id}_{role}{i}")
+            u.set_unusable_password()
+            u.save()
+            pair.append(u)
+        owner, client = pair
+        listing = Listing.objects.create(
+            author=owner, title=f"Loadtest {run_id} #{i}", price_per_night=price_per_night, max_guests=2,
+        )
+        actors.append({
+            "owner_token": str(RefreshToken.for_user(owner).access_token),
+            "client_token": str(RefreshToken.for_user(client).access_token),
+            "listing_id": listing.id,
+        })
+    return actors
+
+
+def cleanup(run_id: str = None) -> int:
+    prefix = f"lt_{run_id}_" if run_id else "lt_"
+    users = User.objects.filter(email__startswith=prefix, email__endswith=f"@{LOADTEST_EMAIL_DOMAIN}")
+    Listing.objects.filter(author__in=users).delete()
+    deleted, _ = users.delete()
+    return deleted
+
+
+class _Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = []
+        self.flows_ok = 0
+        self._lock = threading.Lock()
+
+    def ok(self, step: str, ms: float):
+        with self._lock:
+            self.latencies[step].append(ms)
+
+    def fail(self, step: str, ms: float, detail: str):
+        with self._lock:
+            self.errors[step] += 1
+            self.latencies[f"{step}:failed"].append(ms)
+            if len(self.error_samples) < 20:
+                self.error_samples.append(f"{step}: {detail}"[:200])
+
+    def flow_done(self):
+        with self._lock:
+            self.flows_ok += 1
+
+
+def _run_flow(base_url: str, actor: dict, start_date, limiter: RateLimiter, rec: _Recorder, timeout: float):
+    session = requests.Session()
+    owner = {"Authorization": f"Bearer {actor['owner_token']}"}
+    client = {"Authorization": f"Bearer {actor['client_token']}"}
+
+    def call(step, method, path, headers, json_body=None, expect=(200, 201)):
+        limiter.acquire()
+        started = time.monotonic()
+        try:
+            r = session.request(method, f"{base_url}{path}", headers=headers, json=json_body, timeout=timeout)
+        except Exception as e:
+            rec.fail(step, (time.monotonic() - started) * 1000, str(e))
+            return None
+        ms = (time.monotonic() - started) * 1000
+        if r.status_code not in expect:
+            rec.fail(step, ms, f"HTTP {r.status_code} {r.text[:120]}")
+            return None
+        rec.ok(step, ms)
+        try:
+            return r.json()
+        except ValueError:
+            return {}
+
+    data = call("request", "POST", "/bookings/request/", client, {
+        "listing": actor["listing_id"],
+        "duration_days": 2,
+        "desired_start_date": start_date.isoformat(),
+    })
+    if not data:
+        return
+    booking_id = data["id"]
+
+    if not call("approve", "POST", f"/bookings/{booking_id}/decision/", owner, {"action": "approve"}):
+        return
+
+    data = call("pay_init", "POST", f"/bookings/{booking_id}/paystack/initialize/", client, {})
+    if not data:
+        return
+
+    data = call("pay_verify", "POST", "/payments/paystack/verify/", client, {"reference": data["reference"]})
+    if not data:
+        return
+    code = data.get("key_code")
+    if not code:
+        # ✅ webhook (faux Paystack) + worker passés avant verify: code via l'endpoint dédié
+        data = call("key_code", "GET", f"/bookings/{booking_id}/my-key-code/", client)
+        code = (data or {}).get("code")
+        if not code:
+            return
+
+    if call("check_in", "POST", "/bookings/validate-key/", owner, {"code": code}):
+        rec.flow_done()
+
+
+def run(base_url: str, flows: int = 50, rps: float = 20, concurrency: int = 10, timeout: float = 30, keep: bool = False) -> dict:
+    """
+    ✅ base_url: racine de l'API, ex http://127.0.0.1:8000/api/v1
+    -> rapport {"steps": {step: {...}}, "throughput_rps", "flows_ok", ...}
+    """
+    base_url = base_url.rstrip("/")
+    run_id = secrets.token_hex(3)
+    actors = create_actors(flows, run_id)
+    start_date = timezone.localdate() + timedelta(days=30)
+
+    limiter = RateLimiter(rps, burst=max(1, int(rps)))
+    rec = _Recorder()
+
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="loadtest") as pool:
+            futures = [
+                pool.submit(_run_flow, base_url, actor, start_date, limiter, rec, timeout)
+                for actor in actors
+            ]
+        elapsed = time.monotonic() - started
+        for fut in futures:
+            if fut.exception():
+                rec.fail("flow", 0, repr(fut.exception()))
+    finally:
+        if not keep:
+            cleanup(run_id)
+
+    steps = {}
+    total_ok = 0
+    for step in STEPS:
+        values = rec.latencies.get(step, [])
+        failed = rec.latencies.get(f"{step}:failed", [])
+        if step == "key_code" and not (values or failed):
+            continue  # ✅ seulement si le webhook a devancé verify
+        total_ok += len(values)
+        steps[step] = {
+            "count": len(values) + len(failed),
+            "ok": len(values),
+            "errors": rec.errors.get(step, 0),
+            "p50_ms": round(percentile(values, 50), 1),
+            "p95_ms": round(percentile(values, 95), 1),
+            "max_ms": round(max(values), 1) if values else 0.0,
+            "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        }
+
+    return {
+        "run_id": run_id,
+        "flows": flows,
+        "flows_ok": rec.flows_ok,
+        "target_rps": rps,
+        "throughput_rps": round(total_ok / elapsed, 2) if elapsed else 0.0,
+        "flows_per_s": round(rec.flows_ok / elapsed, 2) if elapsed else 0.0,
+        "elapsed_s": round(elapsed, 2),
+        "steps": steps,
+        "error_samples": rec.error_samples,
+    }
@@ -0,0 +1,34 @@
+#listings/log_handlers.py
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+
+class NonBlockingFileHandler(QueueHandler):
+    """
+    ✅ Handler fichier NON bloquant pour les chemins chauds (push)
+    - le thread appelant ne fait qu'un put_nowait() dans une queue bornée
+    - un thread QueueListener écrit dans le fichier
+    - queue pleine -> le log est abandonné (jamais de blocage), compté dans `dropped`
+    Utilisé dans settings.LOGGING (handler "push_file").
+    """
+
+    def __init__(self, filename, level=logging.NOTSET, max_queue=10000, encoding=None):
+        super().__init__(queue.Queue(maxsize=max_queue))
+        self.setLevel(level)
+        self.dropped = 0
+        self._file_handler = logging.FileHandler(filename, encoding=encoding)
+        self._listener = QueueListener(self.queue, self._file_handler)
+        self._listener.start()
+        atexit.register(self._listener.stop)
+
+    def setFormatter(self, fmt):
+        # ✅ le format (asctime, level...) est appliqué côté fichier, pas ici
+        self._file_handler.setFormatter(fmt)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
@@ -0,0 +1,41 @@
+import time
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from listings.expiry import sweep
+
+
+class Command(BaseCommand):
+    """
+    ✅ Expire les bookings en attente trop longtemps (TTL: settings.BOOKING_EXPIRY_TTL_HOURS)
+    python manage.py expire_bookings          # un passage (cron)
+    python manage.py expire_bookings --loop   # en continu (BOOKING_EXPIRY_INTERVAL_SECONDS)
+    """
+    help = "Passe en 'expired' les demandes / paiements en attente trop vieux et efface les codes clés expirés."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Tourner en continu.")
+        parser.add_argument("--interval", type=float, default=None, help="Pause (s) entre deux passages.")
+
+    def handle(self, *args, **options):
+        self._stop = False
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        interval = options["interval"] or float(getattr(settings, "BOOKING_EXPIRY_INTERVAL_SECONDS", 300))
+
+        while not self._stop:
+            counts = sweep()
+            self.stdout.write(" ".join(f"{k}={v}" for k, v in counts.items()))
+            if not options["loop"]:
+                break
+
+            slept = 0.0
+            while slept < interval and not self._stop:
+                time.sleep(1)
+                slept += 1
+
+    def _request_stop(self, *args):
+        self._stop = True
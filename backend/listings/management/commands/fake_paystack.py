@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from listings.fake_paystack import make_server
+
+
+class Command(BaseCommand):
+    """
+    ✅ Faux Paystack local (dev / tests) — PAYSTACK_BASE_URL=http://127.0.0.1:8765
+    python manage.py fake_paystack
+    python manage.py fake_paystack --port 9000 --outcome abandoned
+    python manage.py fake_paystack --latency-ms 300 --jitter-ms 100 --failure-rate 0.02 --decline-rate 0.05 \
+        --webhook-url http://127.0.0.1:8000/api/v1/payments/paystack/webhook/
+    """
+    help = "Lance un faux serveur Paystack (initialize / verify / webhook signé) avec latence et pannes simulées."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--outcome", default="success",
+            choices=["success", "failed", "abandoned", "ongoing"],
+            help="Statut verify par défaut (références contenant fail/abandon/pending: statut forcé).",
+        )
+        parser.add_argument("--latency-ms", type=float, default=0, help="Latence ajoutée à chaque appel.")
+        parser.add_argument("--jitter-ms", type=float, default=0, help="Variation aléatoire de la latence (±).")
+        parser.add_argument("--failure-rate", type=float, default=0, help="Part des appels qui répondent 500 (0-1).")
+        parser.add_argument("--decline-rate", type=float, default=0, help="Part des paiements refusés (0-1).")
+        parser.add_argument("--webhook-url", default=None, help="URL du webhook de l'API (charge.success signé).")
+        parser.add_argument("--webhook-delay", type=float, default=0.5, help="Délai (s) initialize -> webhook.")
+
+    def handle(self, *args, **options):
+        server = make_server(
+            options["host"],
+            options["port"],
+            default_outcome=options["outcome"],
+            latency_ms=options["latency_ms"],
+            jitter_ms=options["jitter_ms"],
+            failure_rate=options["failure_rate"],
+            decline_rate=options["decline_rate"],
+            webhook_url=options["webhook_url"],
+            webhook_secret=getattr(settings, "PAYSTACK_SECRET_KEY", ""),
+            webhook_delay=options["webhook_delay"],
+        )
+        host, port = server.server_address[:2]
+        self.stdout.write(f"Faux Paystack sur http://{host}:{port} (Ctrl+C pour arrêter)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(" ".join(f"{k}={v}" for k, v in server.state.calls.items()))
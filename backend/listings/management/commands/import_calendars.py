@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from listings.models import ExternalCalendar
+from listings.ical import sync_all, sync_calendar, sync_new
+from listings.workers import WorkerLoop
+
+
+class Command(BaseCommand):
+    """
+    ✅ Importe les calendriers .ics externes (Airbnb, Booking.com...) -> blocs de dates
+    python manage.py import_calendars                 # un passage (cron)
+    python manage.py import_calendars --loop          # en continu (EXTERNAL_CALENDAR_SYNC_INTERVAL_SECONDS)
+                                                      # + nouveaux calendriers toutes les EXTERNAL_CALENDAR_NEW_POLL_SECONDS
+    python manage.py import_calendars --calendar 12   # un seul calendrier
+    """
+    help = "Télécharge les calendriers .ics externes actifs et met à jour les dates bloquées des résidences."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Tourner en continu.")
+        parser.add_argument("--interval", type=float, default=None, help="Pause (s) entre deux passages.")
+        parser.add_argument("--calendar", type=int, default=None, help="ID d'un seul ExternalCalendar.")
+
+    def handle(self, *args, **options):
+        if options["calendar"]:
+            calendar = ExternalCalendar.objects.get(id=options["calendar"])
+            result = sync_calendar(calendar)
+            self.stdout.write(f"calendar={calendar.id} status={result['status']} blocks={result['blocks']}")
+            return
+
+        loop = WorkerLoop()
+        interval = options["interval"] or float(getattr(settings, "EXTERNAL_CALENDAR_SYNC_INTERVAL_SECONDS", 900))
+        poll = float(getattr(settings, "EXTERNAL_CALENDAR_NEW_POLL_SECONDS", 5))
+
+        while not loop.stopped:
+            counts = sync_all()
+            self.stdout.write(" ".join(f"{k}={v}" for k, v in counts.items()))
+            if not options["loop"]:
+                break
+            # ✅ entre deux passages: calendriers ajoutés par un gérant entre-temps
+            loop.sleep(interval, tick=self._sync_new, every=poll)
+
+    def _sync_new(self):
+        new = sync_new()
+        if new:
+            self.stdout.write(f"new={new}")
@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from listings.loadtest import run, cleanup
+
+
+class Command(BaseCommand):
+    """
+    ✅ Test de charge du tunnel réservation -> paiement -> check-in
+    (API lancée avec PAYSTACK_BASE_URL pointant vers manage.py fake_paystack, jamais la prod)
+    python manage.py payment_loadtest --base-url http://127.0.0.1:8000/api/v1 --flows 200 --rps 50 --concurrency 20
+    python manage.py payment_loadtest --cleanup      # supprime les comptes lt_*@loadtest.local restés (--keep)
+    """
+    help = "Rejoue demandes -> acceptations -> paiements -> check-ins à un débit cible et affiche débit + p95 par étape."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000/api/v1", help="Racine de l'API testée.")
+        parser.add_argument("--flows", type=int, default=50, help="Nombre de parcours complets.")
+        parser.add_argument("--rps", type=float, default=20, help="Débit cible (requêtes HTTP / s, toutes étapes).")
+        parser.add_argument("--concurrency", type=int, default=10, help="Parcours menés en parallèle.")
+        parser.add_argument("--timeout", type=float, default=30)
+        parser.add_argument("--keep", action="store_true", help="Garder les comptes / résidences créés.")
+        parser.add_argument("--cleanup", action="store_true", help="Supprimer les données de test puis quitter.")
+        parser.add_argument("--json", action="store_true", help="Rapport en JSON.")
+
+    def handle(self, *args, **options):
+        if options["cleanup"]:
+            self.stdout.write(f"supprimés={cleanup()}")
+            return
+
+        report = run(
+            options["base_url"],
+            flows=options["flows"],
+            rps=options["rps"],
+            concurrency=options["concurrency"],
+            timeout=options["timeout"],
+            keep=options["keep"],
+        )
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report))
+            return
+
+        self.stdout.write(
+            f"flows={report['flows_ok']}/{report['flows']} elapsed_s={report['elapsed_s']} "
+            f"throughput_rps={report['throughput_rps']} (cible {report['target_rps']}) flows_per_s={report['flows_per_s']}"
+        )
+        self.stdout.write(f"{'étape':<12}{'count':>7}{'ok':>7}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'rps':>8}")
+        for step, s in report["steps"].items():
+            self.stdout.write(
+                f"{step:<12}{s['count']:>7}{s['ok']:>7}{s['errors']:>6}"
+                f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['max_ms']:>10}{s['rps']:>8}"
+            )
+        for sample in report["error_samples"]:
+            self.stdout.write(f"  ! {sample}")
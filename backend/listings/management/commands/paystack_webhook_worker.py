@@ -0,0 +1,43 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from listings.paystack_inbox import drain_inbox, timing_stats
+from listings.workers import WorkerLoop
+
+logger = logging.getLogger("push")
+
+
+class Command(BaseCommand):
+    """
+    ✅ Worker webhooks Paystack: traite l'inbox (PaystackWebhookEvent) en tâche de fond
+    python manage.py paystack_webhook_worker            # boucle infinie
+    python manage.py paystack_webhook_worker --once     # un seul passage (cron)
+    python manage.py paystack_webhook_worker --stats    # temps de réponse / traitement (dernière heure)
+    """
+    help = "Applique les webhooks Paystack reçus (transaction, booking payé, code clé, push) avec retries/backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Vider l'inbox une fois puis quitter.")
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--sleep", type=float, default=1.0, help="Pause (s) quand l'inbox est vide.")
+        parser.add_argument("--stats", action="store_true", help="Afficher les mesures puis quitter.")
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            self.stdout.write(" ".join(f"{k}={v}" for k, v in timing_stats().items()))
+            return
+
+        WorkerLoop().drain(
+            drain_inbox,
+            batch_size=max(1, options["batch_size"]),
+            once=options["once"],
+            idle_sleep=options["sleep"],
+            on_batch=lambda counts: self._report(counts, options["once"]),
+        )
+
+    def _report(self, counts: dict, once: bool):
+        line = " ".join(f"{k}={v}" for k, v in counts.items())
+        logger.info("PAYSTACK_WORKER batch %s", line)
+        if once:
+            self.stdout.write(line)
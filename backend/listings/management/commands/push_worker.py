@@ -0,0 +1,48 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from listings.notifications import drain_outbox
+from listings.expiry import start_scheduler
+from listings.workers import WorkerLoop
+
+logger = logging.getLogger("push")
+
+
+class Command(BaseCommand):
+    """
+    ✅ Worker push: vide l'outbox (NotificationOutbox) en tâche de fond
+    python manage.py push_worker            # boucle infinie
+    python manage.py push_worker --once     # un seul passage (cron)
+    python manage.py push_worker --expire-every 300   # + expiration des bookings dans ce process
+    """
+    help = "Envoie les notifications push en attente (outbox) avec retries/backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Vider l'outbox une fois puis quitter.")
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--sleep", type=float, default=2.0, help="Pause (s) quand l'outbox est vide.")
+        parser.add_argument(
+            "--expire-every", type=float, default=0,
+            help="Lance aussi l'expiration des bookings toutes les N secondes (0 = non).",
+        )
+
+    def handle(self, *args, **options):
+        loop = WorkerLoop()
+
+        if options["expire_every"] > 0 and not options["once"]:
+            start_scheduler(options["expire_every"])
+
+        loop.drain(
+            drain_outbox,
+            batch_size=max(1, options["batch_size"]),
+            once=options["once"],
+            idle_sleep=options["sleep"],
+            on_batch=lambda counts: self._report(counts, options["once"]),
+        )
+
+    def _report(self, counts: dict, once: bool):
+        line = " ".join(f"{k}={v}" for k, v in counts.items())
+        logger.info("PUSH_WORKER batch %s", line)
+        if once:
+            self.stdout.write(line)
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.rollups import rebuild
+
+
+def _date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Date invalide: {value} (attendu YYYY-MM-DD)")
+
+
+class Command(BaseCommand):
+    """
+    ✅ Reconstruit les rollups quotidiens des stats admin (DailyBookingRollup)
+    python manage.py rebuild_booking_rollups                      # tout l'historique (1er déploiement)
+    python manage.py rebuild_booking_rollups --date-from 2026-01-01 --date-to 2026-01-31
+    (un changement de gérant est répercuté tout seul: receiver post_save Listing)
+    """
+    help = "Recalcule DailyBookingRollup (jour x résidence) depuis les bookings payés."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date-from", type=_date, default=None)
+        parser.add_argument("--date-to", type=_date, default=None)
+
+    def handle(self, *args, **options):
+        count = rebuild(options["date_from"], options["date_to"])
+        self.stdout.write(f"rollups={count}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from listings.models import Listing
+from listings.occupancy import rebuild_listing
+
+
+class Command(BaseCommand):
+    """
+    ✅ Reconstruit l'index d'occupation (calendrier de dispo)
+    python manage.py rebuild_occupancy              # toutes les résidences
+    python manage.py rebuild_occupancy --listing 12
+    """
+    help = "Recalcule les bitmaps d'occupation des résidences depuis les bookings bloquants."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listing", type=int, action="append", help="Id de résidence (répétable).")
+
+    def handle(self, *args, **options):
+        ids = options["listing"] or Listing.objects.values_list("id", flat=True).iterator()
+        count = 0
+        for listing_id in ids:
+            rebuild_listing(listing_id)
+            count += 1
+        self.stdout.write(f"rebuilt={count}")
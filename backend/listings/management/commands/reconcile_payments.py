@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from listings.reconciliation import reconcile
+
+
+class Command(BaseCommand):
+    """
+    ✅ Réconcilie les transactions Paystack restées "initiated" (webhook perdu, page fermée)
+    python manage.py reconcile_payments                              # > PAYSTACK_RECONCILE_AFTER_MINUTES
+    python manage.py reconcile_payments --older-than 60 --concurrency 8 --rate 10
+    python manage.py reconcile_payments --dry-run --json             # rapport seul, aucune écriture
+    """
+    help = "Vérifie auprès de Paystack les transactions 'initiated' trop vieilles et applique le résultat (payé / échoué)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=None, help="Âge minimum (minutes).")
+        parser.add_argument("--concurrency", type=int, default=None, help="Appels Paystack en parallèle.")
+        parser.add_argument("--rate", type=float, default=None, help="Appels Paystack max par seconde (0 = illimité).")
+        parser.add_argument("--limit", type=int, default=None, help="Nombre max de transactions ce passage.")
+        parser.add_argument("--dry-run", action="store_true", help="Interroger Paystack sans rien modifier.")
+        parser.add_argument("--json", action="store_true", help="Rapport en JSON.")
+
+    def handle(self, *args, **options):
+        report = reconcile(
+            older_than_minutes=options["older_than"],
+            concurrency=options["concurrency"],
+            rate=options["rate"],
+            limit=options["limit"],
+            dry_run=options["dry_run"],
+        )
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report))
+            return
+
+        self.stdout.write(" ".join(f"{k}={v}" for k, v in report.items() if k != "error_refs"))
+        if report["error_refs"]:
+            self.stdout.write("erreurs: " + ", ".join(report["error_refs"]))
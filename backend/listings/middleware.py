@@ -0,0 +1,35 @@
+#listings/middleware.py
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    ✅ WhiteNoise utilisable sous ASGI sans tout repasser en synchrone
+    WhiteNoiseMiddleware (6.x) est sync-only: Django exécute alors toute la chaîne en dessous
+    (vues async comprises) dans LE thread synchrone partagé -> les vues async passent une par une.
+    Ici: même logique, mais en mode async les fichiers statiques sont servis via sync_to_async
+    et les autres requêtes continuent sur l'event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        self._is_coroutine = iscoroutinefunction(self.get_response)
+        if self._is_coroutine:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
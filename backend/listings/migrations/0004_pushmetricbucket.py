@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0003_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PushMetricBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service', models.CharField(choices=[('fcm', 'Google FCM'), ('apple', 'Apple (APNs web push)'), ('mozilla', 'Mozilla autopush'), ('other', 'Autre')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('sent', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('expired', models.PositiveIntegerField(default=0)),
+                ('duration_ms_sum', models.PositiveBigIntegerField(default=0)),
+                ('le_100', models.PositiveIntegerField(default=0)),
+                ('le_250', models.PositiveIntegerField(default=0)),
+                ('le_500', models.PositiveIntegerField(default=0)),
+                ('le_1000', models.PositiveIntegerField(default=0)),
+                ('le_2500', models.PositiveIntegerField(default=0)),
+                ('le_inf', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket_start'], name='listings_pu_bucket__3a36e7_idx')],
+                'constraints': [models.UniqueConstraint(fields=('service', 'bucket_start'), name='uniq_push_metric_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_idempotencykey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('requested', 'Demande envoyée (en attente gérant)'), ('rejected', 'Refusée (déjà pris / indisponible)'), ('approved', 'Acceptée (client peut payer)'), ('awaiting_payment', 'En attente de paiement'), ('paid', 'Acompte payé (escrow plateforme)'), ('checked_in', 'Client arrivé (code validé)'), ('released', 'Reversement effectué (admin)'), ('cancelled', 'Annulée'), ('expired', 'Expirée')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='listings.booking')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='listings_bo_user_id_5da45d_idx'), models.Index(fields=['created_at'], name='listings_bo_created_70d856_idx')],
+            },
+        ),
+    ]
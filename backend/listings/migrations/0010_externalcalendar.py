@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_bookingevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExternalCalendar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, default='', max_length=80)),
+                ('url', models.URLField(max_length=500)),
+                ('is_active', models.BooleanField(default=True)),
+                ('etag', models.CharField(blank=True, max_length=255, null=True)),
+                ('last_modified', models.CharField(blank=True, max_length=64, null=True)),
+                ('last_fetched_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='external_calendars', to='listings.listing')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExternalCalendarBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uid', models.CharField(blank=True, default='', max_length=255)),
+                ('summary', models.CharField(blank=True, default='', max_length=255)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blocks', to='listings.externalcalendar')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='external_blocks', to='listings.listing')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='externalcalendar',
+            constraint=models.UniqueConstraint(fields=('listing', 'url'), name='uniq_external_calendar_listing_url'),
+        ),
+        migrations.AddIndex(
+            model_name='externalcalendarblock',
+            index=models.Index(fields=['listing', 'start_date', 'end_date'], name='listings_ex_listing_9d22d2_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:44
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0010_externalcalendar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaystackWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dedup_key', models.CharField(max_length=255, unique=True)),
+                ('event', models.CharField(blank=True, default='', max_length=60)),
+                ('reference', models.CharField(blank=True, db_index=True, max_length=120, null=True)),
+                ('payload', models.JSONField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'À traiter'), ('done', 'Traité'), ('ignored', 'Ignoré (transaction inconnue / sans référence)'), ('dead', "Abandonné (trop d'échecs)")], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('receive_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('process_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('duplicates', models.PositiveIntegerField(default=0)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'available_at'], name='listings_pa_status_cf8c34_idx'), models.Index(fields=['received_at'], name='listings_pa_receive_f8bce3_idx')],
+            },
+        ),
+    ]
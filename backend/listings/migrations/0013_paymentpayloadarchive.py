@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0012_paymenttransaction_authorization_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='channel',
+            field=models.CharField(blank=True, max_length=30, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='gateway_response',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='paystack_status',
+            field=models.CharField(blank=True, max_length=30, null=True),
+        ),
+        migrations.CreateModel(
+            name='PaymentPayloadArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('initialize', 'Initialize'), ('verify', 'Verify'), ('webhook', 'Webhook'), ('error', 'Erreur')], max_length=12)),
+                ('payload_zlib', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payload_archive', to='listings.paymenttransaction')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['transaction', 'created_at'], name='listings_pa_transac_7218e9_idx')],
+            },
+        ),
+    ]
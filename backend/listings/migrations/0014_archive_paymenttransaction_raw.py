@@ -0,0 +1,75 @@
+import json
+import zlib
+
+from django.db import migrations
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+# ✅ Copie de PaymentTransaction.raw vers PaymentPayloadArchive (zlib) AVANT la suppression de la colonne (0004)
+# Logique recopiée ici (et pas importée de listings.payment_archive): une migration ne doit pas changer
+# de comportement si le module évolue.
+
+def _summary(payload):
+    data = (payload or {}).get("data") if isinstance(payload, dict) else None
+    if not isinstance(data, dict):
+        return {}
+    fields = {}
+    if data.get("status"):
+        fields["paystack_status"] = str(data["status"])[:30]
+    if data.get("gateway_response"):
+        fields["gateway_response"] = str(data["gateway_response"])[:255]
+    if data.get("channel"):
+        fields["channel"] = str(data["channel"])[:30]
+    paid_at = parse_datetime(str(data.get("paid_at") or data.get("paidAt") or ""))
+    if paid_at:
+        fields["paid_at"] = paid_at if timezone.is_aware(paid_at) else timezone.make_aware(paid_at)
+    return fields
+
+
+def archive_raw(apps, schema_editor):
+    PaymentTransaction = apps.get_model("listings", "PaymentTransaction")
+    PaymentPayloadArchive = apps.get_model("listings", "PaymentPayloadArchive")
+
+    rows = PaymentTransaction.objects.filter(raw__isnull=False).values_list("id", "raw", "updated_at")
+    batch = []
+    for tx_id, payload, updated_at in rows.iterator(chunk_size=500):
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        is_error = isinstance(payload, dict) and set(payload) == {"error"}
+        batch.append(PaymentPayloadArchive(
+            transaction_id=tx_id,
+            source="error" if is_error else "verify",
+            payload_zlib=zlib.compress(body, 6),
+            size=len(body),
+        ))
+        fields = _summary(payload)
+        if fields:
+            PaymentTransaction.objects.filter(id=tx_id).update(**fields)
+        if len(batch) >= 500:
+            PaymentPayloadArchive.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        PaymentPayloadArchive.objects.bulk_create(batch)
+
+
+def restore_raw(apps, schema_editor):
+    # ✅ retour arrière: raw = réponse archivée la plus récente
+    PaymentTransaction = apps.get_model("listings", "PaymentTransaction")
+    PaymentPayloadArchive = apps.get_model("listings", "PaymentPayloadArchive")
+
+    latest = {}
+    for tx_id, blob in PaymentPayloadArchive.objects.order_by("created_at", "id").values_list("transaction_id", "payload_zlib").iterator():
+        latest[tx_id] = blob
+    for tx_id, blob in latest.items():
+        PaymentTransaction.objects.filter(id=tx_id).update(raw=json.loads(zlib.decompress(bytes(blob)).decode("utf-8")))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0013_paymentpayloadarchive'),
+    ]
+
+    operations = [
+        migrations.RunPython(archive_raw, restore_raw),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:23
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0014_archive_paymenttransaction_raw'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='paymenttransaction',
+            name='raw',
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0015_remove_paymenttransaction_raw'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBookingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('total_deposit', models.PositiveBigIntegerField(default=0)),
+                ('total_commission', models.PositiveBigIntegerField(default=0)),
+                ('total_payout', models.PositiveBigIntegerField(default=0)),
+                ('pending_payout', models.PositiveBigIntegerField(default=0)),
+                ('paid_payout', models.PositiveBigIntegerField(default=0)),
+                ('last_booking_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='listings.listing')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'day'], name='listings_da_owner_i_c8e011_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'listing'), name='uniq_daily_rollup_day_listing')],
+            },
+        ),
+    ]
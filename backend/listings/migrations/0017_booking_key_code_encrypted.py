@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0016_dailybookingrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='key_code_encrypted',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
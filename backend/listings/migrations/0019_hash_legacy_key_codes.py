@@ -0,0 +1,102 @@
+import base64
+import hashlib
+import hmac
+import secrets
+import string
+
+from cryptography.fernet import Fernet, InvalidToken
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+
+# ✅ Anciens codes clés en clair (Booking.key_code) -> key_code_hash + key_code_encrypted, AVANT la
+# suppression de la colonne (0020). Hash / chiffrement recopiés de listings.key_codes (mêmes réglages
+# KEY_CODE_SECRET / KEY_CODE_ENCRYPTION_KEY): une migration ne doit pas changer si le module évolue.
+#
+# - booking payé, code encore valide: hash + chiffré
+#   ⚠️ 2 anciens bookings payés du même gérant avec le même code -> même hash -> uniq_active_key_code_hash
+#   -> le premier (start_date, id) garde son code, les suivants reçoivent un nouveau code
+#      (le client le relit via my-key-code, le gérant ne valide que le hash)
+# - code expiré / booking non payé: simplement vidé
+
+def _secret():
+    return (getattr(settings, "KEY_CODE_SECRET", "") or settings.SECRET_KEY).encode("utf-8")
+
+
+def _hash(owner_id, code):
+    return hmac.new(_secret(), f"{owner_id}:{(code or '').strip()}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def _fernet():
+    key = getattr(settings, "KEY_CODE_ENCRYPTION_KEY", "")
+    if not key:
+        key = base64.urlsafe_b64encode(hashlib.sha256(b"key-code-encryption:" + _secret()).digest())
+    return Fernet(key)
+
+
+def _new_code():
+    return "".join(secrets.choice(string.digits) for _ in range(6))
+
+
+def hash_legacy_codes(apps, schema_editor):
+    Booking = apps.get_model("listings", "Booking")
+    fernet = _fernet()
+    now = timezone.now()
+
+    legacy = Booking.objects.filter(key_code__isnull=False)
+    legacy.exclude(status="paid").update(key_code=None)
+    legacy.filter(status="paid", key_code_expires_at__lt=now).update(
+        key_code=None, key_code_hash=None, key_code_encrypted=None,
+    )
+
+    remaining = Booking.objects.filter(status="paid", key_code__isnull=False)
+    remaining.update(key_code_hash=None)  # ✅ recalculés ci-dessous (pas de conflit avec un hash périmé)
+    rows = (
+        remaining
+        .order_by("start_date", "id")
+        .values_list("id", "listing__author_id", "key_code")
+    )
+    # ✅ hash déjà actifs (codes émis après le passage au hash) + ceux attribués ici
+    taken = set(
+        Booking.objects
+        .filter(status="paid", key_code_hash__isnull=False)
+        .exclude(key_code__isnull=False)
+        .values_list("key_code_hash", flat=True)
+    )
+    for booking_id, owner_id, code in list(rows):
+        code_hash = _hash(owner_id, code)
+        while code_hash in taken:
+            code = _new_code()
+            code_hash = _hash(owner_id, code)
+        taken.add(code_hash)
+        Booking.objects.filter(id=booking_id).update(
+            key_code=None,
+            key_code_hash=code_hash,
+            key_code_encrypted=fernet.encrypt(code.encode("utf-8")).decode("ascii"),
+        )
+
+
+def restore_legacy_codes(apps, schema_editor):
+    # ✅ retour arrière: key_code = code déchiffré (bookings payés)
+    Booking = apps.get_model("listings", "Booking")
+    fernet = _fernet()
+
+    rows = Booking.objects.filter(status="paid", key_code_encrypted__isnull=False).values_list("id", "key_code_encrypted")
+    for booking_id, token in rows.iterator(chunk_size=500):
+        try:
+            code = fernet.decrypt(token.encode("ascii")).decode("utf-8")
+        except InvalidToken:
+            continue
+        Booking.objects.filter(id=booking_id).update(key_code=code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0018_idempotencykey_locked_until'),
+    ]
+
+    operations = [
+        migrations.RunPython(hash_legacy_codes, restore_legacy_codes),
+    ]
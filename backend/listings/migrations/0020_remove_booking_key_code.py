@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:59
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0019_hash_legacy_key_codes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='booking',
+            name='key_code',
+        ),
+    ]
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.db import migrations
+
+
+# ✅ Index d'occupation des résidences existantes (la lecture publique /availability/ n'en crée plus)
+# Calcul recopié de listings.occupancy (rebuild_listing): une migration ne doit pas changer si le module évolue.
+
+BLOCKING_BOOKING_STATUSES = ("approved", "awaiting_payment", "paid", "checked_in", "released")
+
+
+def _next_month(d):
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _masks_for(ranges):
+    masks = {}
+    for start, end in ranges:
+        m = start.replace(day=1)
+        while m < end:
+            lo, hi = max(start, m), min(end, _next_month(m))
+            for day in range(lo.day, lo.day + (hi - lo).days):
+                masks[m] = masks.get(m, 0) | (1 << (day - 1))
+            m = _next_month(m)
+    return masks
+
+
+def backfill_occupancy(apps, schema_editor):
+    Listing = apps.get_model("listings", "Listing")
+    Booking = apps.get_model("listings", "Booking")
+    ExternalCalendarBlock = apps.get_model("listings", "ExternalCalendarBlock")
+    ListingOccupancy = apps.get_model("listings", "ListingOccupancy")
+    ListingOccupancyMonth = apps.get_model("listings", "ListingOccupancyMonth")
+
+    missing = Listing.objects.filter(occupancy__isnull=True).values_list("id", flat=True)
+    for listing_id in missing.iterator(chunk_size=500):
+        ranges = list(
+            Booking.objects
+            .filter(
+                listing_id=listing_id,
+                status__in=BLOCKING_BOOKING_STATUSES,
+                start_date__isnull=False,
+                end_date__isnull=False,
+            )
+            .values_list("start_date", "end_date")
+        ) + list(
+            ExternalCalendarBlock.objects
+            .filter(listing_id=listing_id, calendar__is_active=True)
+            .values_list("start_date", "end_date")
+        )
+        ListingOccupancyMonth.objects.filter(listing_id=listing_id).delete()
+        ListingOccupancyMonth.objects.bulk_create([
+            ListingOccupancyMonth(listing_id=listing_id, month=m, nights_mask=mask)
+            for m, mask in sorted(_masks_for(ranges).items())
+            if mask
+        ])
+        ListingOccupancy.objects.create(listing_id=listing_id, version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0020_remove_booking_key_code'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
@@ -6,6 +6,8 @@ from django.core.validators import MinValueValidator
 # from django.contrib.gis.db.models import PointField
 # from django.contrib.gis.geos import Point
 from django.db.models import Q
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
 
 User = settings.AUTH_USER_MODEL
 
@@ -31,6 +33,9 @@ BOOKING_STATUS = (
     ("expired", "Expirée"),
 )
 
+# ✅ statuts qui bloquent les dates d'une résidence (calendrier / anti double-réservation)
+BLOCKING_BOOKING_STATUSES = ("approved", "awaiting_payment", "paid", "checked_in", "released")
+
 PAYOUT_STATUS = (
     ("unpaid", "Non payé"),
     ("paid", "Payé"),
@@ -196,12 +201,13 @@ class Booking(models.Model):
     amount_to_pay = models.PositiveIntegerField(default=0, validators=[MinValueValidator(0)])            # deposit + fee
     escrow_amount = models.PositiveIntegerField(default=0, validators=[MinValueValidator(0)])            # montant reçu (dépôt)
 
-    # ✅ Code remise clé (idéalement on stockera hash côté serializer/view, mais on prépare le champ)
+    # ✅ Code remise clé: HMAC(secret serveur, gérant + code) -> recherche indexée (key_codes.py)
     key_code_hash = models.CharField(max_length=255, null=True, blank=True)
+    # ✅ même code chiffré (Fernet), lu seulement par le client via my-key-code
+    key_code_encrypted = models.TextField(null=True, blank=True)
     key_code_expires_at = models.DateTimeField(null=True, blank=True)
     checked_in_at = models.DateTimeField(null=True, blank=True)
 
-    key_code = models.CharField(max_length=6, null=True, blank=True)  # ✅ CHANGE
     # key_code_expires_at = models.DateTimeField(null=True, blank=True)
     # ✅ Reversement gérant (calcul + admin)
     payout_amount = models.PositiveIntegerField(default=0, validators=[MinValueValidator(0)])            # deposit - commission
@@ -218,6 +224,12 @@ class Booking(models.Model):
             models.Index(fields=["status", "created_at"]),
         ]
         constraints = [
+            # ✅ NEW: un code actif (booking payé) est unique -> index partiel pour la validation check-in
+            models.UniqueConstraint(
+                fields=["key_code_hash"],
+                condition=Q(status="paid", key_code_hash__isnull=False),
+                name="uniq_active_key_code_hash",
+            ),
             # ✅ NEW: on impose end_date > start_date seulement si les 2 existent
                 models.CheckConstraint(
             check=(
@@ -243,6 +255,21 @@ class Booking(models.Model):
         return int(self.duration_days or 0)
 
 
+class KeyCodeAttempt(models.Model):
+    """
+    ✅ NEW: anti brute-force des codes clés (par gérant)
+    - failures: échecs dans la fenêtre courante
+    - locked_until: validation bloquée jusqu'à cette date
+    """
+    owner = models.OneToOneField(User, on_delete=models.CASCADE, related_name="key_code_attempts")
+    failures = models.PositiveSmallIntegerField(default=0)
+    window_started_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"KeyCodeAttempt owner={self.owner_id} failures={self.failures}"
+
+
 class BookingDateProposal(models.Model):
     """
     ✅ NEW: proposition de dates par le gérant si indisponible.
@@ -262,6 +289,105 @@ class BookingDateProposal(models.Model):
         return f"Proposal {self.booking_id}: {self.start_date} -> {self.end_date}"
 
 
+class ListingOccupancy(models.Model):
+    """
+    ✅ NEW: index d'occupation d'une résidence (calendrier de dispo)
+    - version: incrémentée à chaque changement -> ETag / clé de cache
+    """
+    listing = models.OneToOneField(Listing, on_delete=models.CASCADE, related_name="occupancy")
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Occupancy listing={self.listing_id} v{self.version}"
+
+
+class ListingOccupancyMonth(models.Model):
+    """
+    ✅ NEW: nuits occupées d'un mois, en bitmap (bit 0 = nuit du 1er, bit 30 = nuit du 31)
+    - recalculé mois par mois quand un booking entre/sort d'un statut bloquant
+    - pas de ligne = mois libre
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="occupancy_months")
+    month = models.DateField()  # ✅ 1er du mois
+    nights_mask = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["listing", "month"], name="uniq_occupancy_listing_month"),
+        ]
+
+    def __str__(self):
+        return f"Occupancy listing={self.listing_id} {self.month:%Y-%m}"
+
+
+class BookingEvent(models.Model):
+    """
+    ✅ NEW: journal léger des changements de statut (flux SSE /bookings/events/stream/)
+    - 1 ligne par destinataire (client et gérant)
+    - id croissant = "Last-Event-ID" pour reprendre le flux après une coupure
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="booking_events")
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name="events")
+    status = models.CharField(max_length=20, choices=BOOKING_STATUS)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "id"]),
+            models.Index(fields=["created_at"]),
+        ]
+
+    def __str__(self):
+        return f"BookingEvent({self.id}) booking={self.booking_id} {self.status}"
+
+
+class ExternalCalendar(models.Model):
+    """
+    ✅ NEW: calendrier .ics externe d'une résidence (Airbnb, Booking.com...)
+    - importé périodiquement (manage.py import_calendars) -> ExternalCalendarBlock
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="external_calendars")
+    name = models.CharField(max_length=80, blank=True, default="")
+    url = models.URLField(max_length=500)
+    is_active = models.BooleanField(default=True)
+
+    # ✅ GET conditionnel côté source (ETag / Last-Modified)
+    etag = models.CharField(max_length=255, null=True, blank=True)
+    last_modified = models.CharField(max_length=64, null=True, blank=True)
+
+    last_fetched_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["listing", "url"], name="uniq_external_calendar_listing_url"),
+        ]
+
+    def __str__(self):
+        return f"ExternalCalendar({self.id}) listing={self.listing_id} {self.name or self.url}"
+
+
+class ExternalCalendarBlock(models.Model):
+    """
+    ✅ NEW: période bloquée par un calendrier externe (nuits [start_date, end_date))
+    -> prise en compte par is_listing_available et l'index d'occupation
+    """
+    calendar = models.ForeignKey(ExternalCalendar, on_delete=models.CASCADE, related_name="blocks")
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="external_blocks")
+    uid = models.CharField(max_length=255, blank=True, default="")
+    summary = models.CharField(max_length=255, blank=True, default="")
+    start_date = models.DateField()
+    end_date = models.DateField()
+
+    class Meta:
+        indexes = [models.Index(fields=["listing", "start_date", "end_date"])]
+
+    def __str__(self):
+        return f"Block listing={self.listing_id} {self.start_date} -> {self.end_date}"
+
+
 class PaymentTransaction(models.Model):
     """
     ✅ NEW: historique des tentatives Paystack (propre et auditable)
@@ -275,8 +401,15 @@ class PaymentTransaction(models.Model):
     # ✅ on stocke en "FCFA" ici (et on convertira en kobo côté Paystack si nécessaire)
     amount = models.PositiveIntegerField(default=0, validators=[MinValueValidator(0)])
 
-    # ✅ réponse brute Paystack (verify/webhook)
-    raw = models.JSONField(null=True, blank=True)
+    # ✅ champs utiles de la dernière réponse Paystack (la réponse brute complète: PaymentPayloadArchive)
+    paystack_status = models.CharField(max_length=30, null=True, blank=True)
+    gateway_response = models.CharField(max_length=255, null=True, blank=True)
+    channel = models.CharField(max_length=30, null=True, blank=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+    # ✅ page de paiement Paystack réutilisée tant qu'elle est valide (pas 1 transaction par clic)
+    authorization_url = models.URLField(max_length=500, null=True, blank=True)
+    authorization_expires_at = models.DateTimeField(null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -291,6 +424,76 @@ class PaymentTransaction(models.Model):
         return f"{self.provider}:{self.reference} ({self.status})"
 
 
+PAYLOAD_SOURCES = (
+    ("initialize", "Initialize"),
+    ("verify", "Verify"),
+    ("webhook", "Webhook"),
+    ("error", "Erreur"),
+)
+
+
+class PaymentPayloadArchive(models.Model):
+    """
+    ✅ NEW: réponses Paystack brutes (verify / webhook...), compressées zlib, en ajout seul
+    - sortie de PaymentTransaction.raw: la table des transactions et ses index restent petits
+    - jamais chargée par les serializers, seulement à la demande (listings/payment_archive.py)
+    """
+    transaction = models.ForeignKey(PaymentTransaction, on_delete=models.CASCADE, related_name="payload_archive")
+    source = models.CharField(max_length=12, choices=PAYLOAD_SOURCES)
+    payload_zlib = models.BinaryField()
+    size = models.PositiveIntegerField(default=0)  # ✅ taille JSON avant compression (octets)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["transaction", "created_at"])]
+
+    def __str__(self):
+        return f"PayloadArchive({self.id}) tx={self.transaction_id} {self.source}"
+
+
+WEBHOOK_EVENT_STATUS = (
+    ("pending", "À traiter"),
+    ("done", "Traité"),
+    ("ignored", "Ignoré (transaction inconnue / sans référence)"),
+    ("dead", "Abandonné (trop d'échecs)"),
+)
+
+
+class PaystackWebhookEvent(models.Model):
+    """
+    ✅ NEW: inbox des webhooks Paystack (signature déjà vérifiée)
+    - la vue stocke et répond 200 tout de suite -> Paystack ne renvoie plus pour lenteur
+    - dedup_key unique: les renvois du même événement sont des no-ops
+    - traité par manage.py paystack_webhook_worker (retries avec backoff)
+    """
+    dedup_key = models.CharField(max_length=255, unique=True)
+    event = models.CharField(max_length=60, blank=True, default="")
+    reference = models.CharField(max_length=120, null=True, blank=True, db_index=True)
+    payload = models.JSONField(null=True, blank=True)
+
+    status = models.CharField(max_length=10, choices=WEBHOOK_EVENT_STATUS, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)  # ✅ prochain essai (backoff / lease worker)
+    last_error = models.TextField(null=True, blank=True)
+
+    # ✅ mesures: temps de réponse du webhook / temps de traitement par le worker
+    receive_ms = models.PositiveIntegerField(null=True, blank=True)
+    process_ms = models.PositiveIntegerField(null=True, blank=True)
+    duplicates = models.PositiveIntegerField(default=0)
+
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+            models.Index(fields=["received_at"]),
+        ]
+
+    def __str__(self):
+        return f"PaystackWebhookEvent({self.id}) {self.event} ref={self.reference} {self.status}"
+
+
 class PushSubscription(models.Model):
     """
     ✅ NEW: stocke les abonnements Web Push (PWA)
@@ -312,6 +515,124 @@ class PushSubscription(models.Model):
     def __str__(self):
         return f"PushSub({self.user_id})"
 
+
+IDEMPOTENCY_STATUS = (
+    ("in_progress", "En cours"),
+    ("done", "Terminée"),
+)
+
+
+class IdempotencyKey(models.Model):
+    """
+    ✅ NEW: réponses des POST sensibles, rejouées si le client renvoie le même header Idempotency-Key
+    - fingerprint: hash méthode + chemin + body (même clé + autre requête -> refus)
+    - in_progress: verrou pendant l'exécution (2e envoi simultané -> 409)
+    - locked_until: bail du verrou (worker tué en pleine requête -> la clé est reprise après expiration)
+    """
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, related_name="idempotency_keys")
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=255)  # ✅ "POST /api/v1/bookings/12/decision/"
+    fingerprint = models.CharField(max_length=64)
+
+    status = models.CharField(max_length=12, choices=IDEMPOTENCY_STATUS, default="in_progress")
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "scope", "key"], name="uniq_idempotency_user_scope_key"),
+        ]
+        indexes = [models.Index(fields=["expires_at"])]
+
+    def __str__(self):
+        return f"Idempotency({self.key}) {self.scope} {self.status}"
+
+
+NOTIFICATION_STATUS = (
+    ("pending", "En attente d'envoi"),
+    ("sent", "Envoyée"),
+    ("dead", "Abandonnée (trop d'échecs)"),
+)
+
+
+class NotificationOutbox(models.Model):
+    """
+    ✅ NEW: outbox des notifications push
+    - écrite dans la MÊME transaction que le changement de booking
+    - vidée par le worker (manage.py push_worker) -> l'API n'attend plus FCM/APNs
+    - retries avec backoff, puis "dead" (dead-letter) après N échecs
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notification_outbox")
+
+    title = models.CharField(max_length=150)
+    body = models.TextField(blank=True, default="")
+    data = models.JSONField(null=True, blank=True)
+
+    status = models.CharField(max_length=10, choices=NOTIFICATION_STATUS, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)  # ✅ prochain essai (backoff / lease worker)
+    last_error = models.TextField(null=True, blank=True)
+
+    # ✅ regroupement (digest): même user + même clé pendant la fenêtre -> 1 seule notif
+    coalesce_key = models.CharField(max_length=60, null=True, blank=True)
+
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+            models.Index(fields=["user", "created_at"]),
+            models.Index(fields=["user", "coalesce_key", "status"]),
+        ]
+
+    def __str__(self):
+        return f"Outbox({self.id}) user={self.user_id} {self.status}"
+
+
+PUSH_SERVICES = (
+    ("fcm", "Google FCM"),
+    ("apple", "Apple (APNs web push)"),
+    ("mozilla", "Mozilla autopush"),
+    ("other", "Autre"),
+)
+
+
+class PushMetricBucket(models.Model):
+    """
+    ✅ NEW: compteurs + histogramme de latence des envois push, par service et par heure
+    - alimenté par push_metrics.flush() (UPDATE ... = col + delta)
+    - lu par GET /admin/push/metrics/
+    """
+    service = models.CharField(max_length=10, choices=PUSH_SERVICES)
+    bucket_start = models.DateTimeField()  # ✅ début de l'heure (UTC)
+
+    sent = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    expired = models.PositiveIntegerField(default=0)
+
+    # ✅ histogramme de durée (ms) — bornes dans push_metrics.LATENCY_BUCKETS_MS
+    duration_ms_sum = models.PositiveBigIntegerField(default=0)
+    le_100 = models.PositiveIntegerField(default=0)
+    le_250 = models.PositiveIntegerField(default=0)
+    le_500 = models.PositiveIntegerField(default=0)
+    le_1000 = models.PositiveIntegerField(default=0)
+    le_2500 = models.PositiveIntegerField(default=0)
+    le_inf = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["service", "bucket_start"], name="uniq_push_metric_bucket"),
+        ]
+        indexes = [models.Index(fields=["bucket_start"])]
+
+    def __str__(self):
+        return f"PushMetric({self.service} {self.bucket_start:%Y-%m-%d %H}h)"
+
 # =========================================================
 # ✅ NEW: Dashboard Admin (payouts, disputes, audit)
 # =========================================================
@@ -433,4 +754,134 @@ class AuditLog(models.Model):
         ordering = ["-created_at"]
 
     def __str__(self):
-        return f"Audit({self.action}) {self.object_type}:{self.object_id}"
\ No newline at end of file
+        return f"Audit({self.action}) {self.object_type}:{self.object_id}"
+
+
+class DailyBookingRollup(models.Model):
+    """
+    ✅ Stats admin pré-agrégées: 1 ligne par jour (created_at du booking) x résidence
+    Seulement les bookings payés (paid / checked_in / released), comme les endpoints stats.
+    Maintenu par rollups.refresh_day() (transitions + signaux), reconstruit par rebuild_booking_rollups.
+    """
+
+    day = models.DateField()
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="daily_rollups")
+    owner = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="daily_rollups")
+
+    bookings = models.PositiveIntegerField(default=0)
+    total_deposit = models.PositiveBigIntegerField(default=0)
+    total_commission = models.PositiveBigIntegerField(default=0)
+    total_payout = models.PositiveBigIntegerField(default=0)
+    pending_payout = models.PositiveBigIntegerField(default=0)   # Payout.status=pending
+    paid_payout = models.PositiveBigIntegerField(default=0)      # Payout.status=paid
+    last_booking_at = models.DateTimeField(null=True, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "listing"], name="uniq_daily_rollup_day_listing"),
+        ]
+        indexes = [
+            models.Index(fields=["owner", "day"]),
+        ]
+
+    def __str__(self):
+        return f"Rollup({self.day}) listing={self.listing_id} bookings={self.bookings}"
+
+
+# =========================================================
+# ✅ Index d'occupation: suit les changements de statut/dates des bookings
+# (les .update() en masse appellent occupancy.refresh_for_bookings() eux-mêmes)
+# =========================================================
+
+@receiver(post_init, sender=Booking)
+def remember_booking_occupancy(sender, instance, **kwargs):
+    # ✅ pas de lecture d'un champ différé (.only(), suppression en cascade): elle déclencherait
+    # un refresh_from_db -> nouvelle instance -> post_init -> ... récursion infinie
+    values = instance.__dict__
+    instance._rollup_status = values.get("status")  # ✅ None = inconnu (différé ou nouveau)
+    if any(name not in values for name in ("status", "start_date", "end_date")):
+        instance._occupancy_snapshot = None  # ✅ état d'origine inconnu
+        return
+    instance._occupancy_snapshot = (values["status"], values["start_date"], values["end_date"])
+
+
+@receiver(post_save, sender=Booking)
+def refresh_booking_occupancy(sender, instance, created, **kwargs):
+    from .occupancy import occupancy_changed, refresh_ranges
+
+    before = getattr(instance, "_occupancy_snapshot", None)
+    after = (instance.status, instance.start_date, instance.end_date)
+    instance._occupancy_snapshot = after
+
+    if created:
+        before = None
+    elif before is None:
+        # ✅ chargé avec des champs différés: on recalcule les mois actuels par précaution
+        if after[1] and after[2]:
+            refresh_ranges(instance.listing_id, [(after[1], after[2])])
+        return
+    if not occupancy_changed(before, after):
+        return
+
+    ranges = [(d[1], d[2]) for d in (before, after) if d and d[1] and d[2]]
+    refresh_ranges(instance.listing_id, ranges)
+
+
+@receiver(post_save, sender=Listing)
+def create_listing_occupancy(sender, instance, created, **kwargs):
+    # ✅ nouvelle résidence = aucun booking: index vide, prêt pour la lecture publique (qui n'écrit jamais)
+    if created:
+        ListingOccupancy.objects.get_or_create(listing_id=instance.pk)
+
+
+# =========================================================
+# ✅ Rollups stats admin: recalcul du jour x résidence quand un booking payé bouge
+# (les transitions via booking_state.transition() le font elles-mêmes)
+# =========================================================
+
+@receiver(post_save, sender=Booking)
+def refresh_booking_rollup(sender, instance, created, **kwargs):
+    from .rollups import PAID_BOOKING_STATUSES, refresh_for_booking
+
+    before = None if created else getattr(instance, "_rollup_status", None)
+    instance._rollup_status = instance.status
+    if created and instance.status not in PAID_BOOKING_STATUSES:
+        return
+    if not created and before is not None and before not in PAID_BOOKING_STATUSES \
+            and instance.status not in PAID_BOOKING_STATUSES:
+        return
+    refresh_for_booking(instance)
+
+
+@receiver(post_delete, sender=Booking)
+def forget_booking_rollup(sender, instance, **kwargs):
+    from .rollups import PAID_BOOKING_STATUSES, refresh_for_booking
+
+    if instance.__dict__.get("status") in PAID_BOOKING_STATUSES:
+        # ✅ create=False: en suppression en cascade (résidence), la ligne part avec la résidence
+        refresh_for_booking(instance, create=False)
+
+
+@receiver(post_save, sender=Payout)
+def refresh_payout_rollup(sender, instance, **kwargs):
+    from .rollups import refresh_for_booking_id
+
+    refresh_for_booking_id(instance.booking_id)
+
+
+@receiver(post_init, sender=Listing)
+def remember_listing_author(sender, instance, **kwargs):
+    instance._rollup_author_id = instance.__dict__.get("author_id")  # ✅ même prudence que les bookings (champ différé)
+
+
+@receiver(post_save, sender=Listing)
+def move_listing_rollups(sender, instance, created, **kwargs):
+    # ✅ changement de gérant: les gains déjà agrégés suivent la résidence (owner copié à la création des rollups)
+    before = getattr(instance, "_rollup_author_id", None)
+    instance._rollup_author_id = instance.author_id
+    if created or before == instance.author_id:
+        return
+    DailyBookingRollup.objects.filter(listing_id=instance.pk).exclude(owner_id=instance.author_id) \
+        .update(owner_id=instance.author_id)
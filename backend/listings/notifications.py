@@ -0,0 +1,198 @@
+#listings/notifications.py
+import random
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import NotificationOutbox
+from .push import deliver_push
+from .workers import claim_due, renew_lease
+
+logger = logging.getLogger("push")
+
+
+# =========================================================
+# ✅ Enqueue (côté API) — une simple ligne en base
+# =========================================================
+
+def enqueue_push(user, title: str, body: str, data: dict = None, coalesce_window: int = None):
+    """
+    ✅ Ajoute une notification à l'outbox.
+    À appeler DANS la transaction du changement de booking:
+    si la transaction rollback, la notif disparaît avec.
+
+    coalesce_window (secondes): si fourni, la notif est retenue pendant la fenêtre
+    et les suivantes du même type (data["type"]) pour ce user y sont fusionnées
+    -> "Vous avez N nouvelles demandes" + data["booking_ids"].
+    """
+    if user is None:
+        return None
+
+    data = dict(data or {})
+    if coalesce_window and data.get("type"):
+        return _enqueue_coalesced(user, title, body, data, coalesce_window)
+
+    return NotificationOutbox.objects.create(
+        user=user,
+        title=title,
+        body=body or "",
+        data=data,
+    )
+
+
+def enqueue_push_many(items):
+    """
+    ✅ Version en lot (sweeper, actions groupées): 1 seul INSERT
+    items: [(user_id, title, body, data), ...]
+    """
+    rows = [
+        NotificationOutbox(user_id=user_id, title=title, body=body or "", data=data or {})
+        for user_id, title, body, data in items
+        if user_id
+    ]
+    return NotificationOutbox.objects.bulk_create(rows)
+
+
+# ✅ Textes des digests (par type de notif)
+DIGESTS = {
+    "booking_request": (
+        "Nouvelles demandes de réservation",
+        "Vous avez {n} nouvelles demandes de réservation.",
+    ),
+}
+
+
+def coalesce_window_for(kind: str) -> int:
+    """
+    ✅ Fenêtre de regroupement (s) par type, 0 = pas de regroupement
+    """
+    return int((getattr(settings, "PUSH_COALESCE_WINDOWS", {}) or {}).get(kind, 0))
+
+
+def _enqueue_coalesced(user, title: str, body: str, data: dict, window: int):
+    kind = data["type"]
+    now = timezone.now()
+    booking_id = data.get("booking_id")
+
+    with transaction.atomic():
+        # ✅ digest encore "ouvert": pas encore réservé par le worker (attempts=0) et fenêtre non écoulée
+        row = (
+            NotificationOutbox.objects
+            .select_for_update()
+            .filter(
+                user=user,
+                coalesce_key=kind,
+                status="pending",
+                attempts=0,
+                available_at__gt=now,
+            )
+            .order_by("-id")
+            .first()
+        )
+
+        if row is None:
+            if booking_id is not None:
+                data["booking_ids"] = [booking_id]
+            data["count"] = 1
+            return NotificationOutbox.objects.create(
+                user=user,
+                title=title,
+                body=body or "",
+                data=data,
+                coalesce_key=kind,
+                available_at=now + timedelta(seconds=window),
+            )
+
+        merged = dict(row.data or {})
+        ids = list(merged.get("booking_ids") or [])
+        if booking_id is not None and booking_id not in ids:
+            ids.append(booking_id)
+        count = int(merged.get("count") or 1) + 1
+
+        merged.update({"booking_ids": ids, "count": count})
+        digest_title, digest_body = DIGESTS.get(kind, (title, body))
+        row.title = digest_title
+        row.body = digest_body.format(n=count)
+        row.data = merged
+        row.save(update_fields=["title", "body", "data"])
+        return row
+
+
+# =========================================================
+# ✅ Drain (côté worker)
+# =========================================================
+
+def _max_attempts() -> int:
+    return int(getattr(settings, "PUSH_OUTBOX_MAX_ATTEMPTS", 6))
+
+
+def _lease_seconds() -> int:
+    return int(getattr(settings, "PUSH_OUTBOX_LEASE_SECONDS", 120))
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    """
+    ✅ Backoff exponentiel + jitter: 30s, 60s, 120s... plafonné (1h par défaut)
+    """
+    base = int(getattr(settings, "PUSH_OUTBOX_BACKOFF_BASE", 30))
+    cap = int(getattr(settings, "PUSH_OUTBOX_BACKOFF_MAX", 60 * 60))
+    delay = min(base * (2 ** max(attempts - 1, 0)), cap)
+    return timedelta(seconds=delay + random.uniform(0, delay * 0.1))
+
+
+def claim_batch(batch_size: int = 50):
+    """
+    ✅ Réserve un lot de notifications dues (SKIP LOCKED + bail, voir workers.py)
+    """
+    return claim_due(NotificationOutbox, batch_size, _lease_seconds(), related=("user",))
+
+
+def _mark_failed(row: NotificationOutbox, error: str):
+    if row.attempts >= _max_attempts():
+        NotificationOutbox.objects.filter(id=row.id).update(status="dead", last_error=error)
+        logger.error("OUTBOX dead-letter id=%s user=%s attempts=%s err=%s", row.id, row.user_id, row.attempts, error)
+        return "dead"
+
+    NotificationOutbox.objects.filter(id=row.id).update(
+        available_at=timezone.now() + backoff_delay(row.attempts),
+        last_error=error,
+    )
+    logger.warning("OUTBOX retry id=%s user=%s attempts=%s err=%s", row.id, row.user_id, row.attempts, error)
+    return "retry"
+
+
+def process_row(row: NotificationOutbox) -> str:
+    """
+    ✅ Envoie une ligne d'outbox -> "sent" | "retry" | "dead"
+    """
+    try:
+        result = deliver_push(row.user, row.title, row.body, row.data)
+    except Exception as e:
+        logger.exception("OUTBOX delivery crashed id=%s err=%s", row.id, str(e))
+        return _mark_failed(row, str(e)[:500])
+
+    if result.should_retry:
+        return _mark_failed(row, f"{result.failed} device(s) en échec")
+
+    # ✅ envoyé (ou aucun device: rien à retenter)
+    NotificationOutbox.objects.filter(id=row.id).update(status="sent", sent_at=timezone.now(), last_error=None)
+    return "sent"
+
+
+def drain_outbox(batch_size: int = 50) -> dict:
+    """
+    ✅ Traite UN lot, retourne les compteurs (utilisé par la commande push_worker)
+    """
+    counts = {"sent": 0, "retry": 0, "dead": 0, "skipped": 0}
+    for row in claim_batch(batch_size):
+        # ✅ bail repris ligne par ligne: un lot lent (timeouts webpush) ne laisse pas
+        # expirer le bail des lignes suivantes -> pas de 2e worker sur la même notif
+        if not renew_lease(row, _lease_seconds()):
+            counts["skipped"] += 1
+            continue
+        counts[process_row(row)] += 1
+
+    return counts
@@ -0,0 +1,223 @@
+#listings/occupancy.py
+from datetime import date, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import (
+    Booking,
+    ExternalCalendarBlock,
+    ListingOccupancy,
+    ListingOccupancyMonth,
+    BLOCKING_BOOKING_STATUSES,
+)
+
+
+# =========================================================
+# ✅ Helpers dates (une "nuit" = la date d'arrivée, end_date = date de départ exclue)
+# =========================================================
+
+def month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def next_month(d: date) -> date:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def months_between(start: date, end: date):
+    """
+    ✅ 1ers des mois couverts par les nuits [start, end)
+    """
+    m = month_start(start)
+    while m < end:
+        yield m
+        m = next_month(m)
+
+
+def _is_blocking(state) -> bool:
+    return bool(state and state[0] in BLOCKING_BOOKING_STATUSES and state[1] and state[2])
+
+
+def occupancy_changed(before, after) -> bool:
+    """
+    ✅ before/after = (status, start_date, end_date)
+    Vrai si le booking entre/sort d'un statut bloquant, ou si ses dates bougent en restant bloquant.
+    """
+    was, now = _is_blocking(before), _is_blocking(after)
+    if was != now:
+        return True
+    return now and (before[1], before[2]) != (after[1], after[2])
+
+
+# =========================================================
+# ✅ Construction des bitmaps
+# =========================================================
+
+def _blocking_ranges(listing_id: int, start: date = None, end: date = None):
+    """
+    ✅ Nuits prises = bookings bloquants + blocs des calendriers externes (.ics importés)
+    """
+    bookings = Booking.objects.filter(
+        listing_id=listing_id,
+        status__in=BLOCKING_BOOKING_STATUSES,
+        start_date__isnull=False,
+        end_date__isnull=False,
+    )
+    blocks = ExternalCalendarBlock.objects.filter(listing_id=listing_id, calendar__is_active=True)
+    if start and end:
+        bookings = bookings.filter(start_date__lt=end, end_date__gt=start)
+        blocks = blocks.filter(start_date__lt=end, end_date__gt=start)
+
+    return list(bookings.values_list("start_date", "end_date")) + list(blocks.values_list("start_date", "end_date"))
+
+
+def _masks_for(ranges, months=None) -> dict:
+    """
+    ✅ {1er du mois: bitmap} à partir d'intervalles [start, end)
+    """
+    masks = {m: 0 for m in (months or [])}
+    for start, end in ranges:
+        for m in months_between(start, end):
+            if months is not None and m not in masks:
+                continue
+            lo = max(start, m)
+            hi = min(end, next_month(m))
+            for day in range(lo.day, lo.day + (hi - lo).days):
+                masks[m] = masks.get(m, 0) | (1 << (day - 1))
+    return masks
+
+
+def _write_masks(listing_id: int, masks: dict):
+    empty = [m for m, mask in masks.items() if not mask]
+    if empty:
+        ListingOccupancyMonth.objects.filter(listing_id=listing_id, month__in=empty).delete()
+
+    for m, mask in masks.items():
+        if mask:
+            ListingOccupancyMonth.objects.update_or_create(
+                listing_id=listing_id, month=m, defaults={"nights_mask": mask},
+            )
+
+
+def rebuild_listing(listing_id: int):
+    """
+    ✅ Recalcule tout l'index d'une résidence (1ère utilisation / commande rebuild_occupancy)
+    """
+    with transaction.atomic():
+        ranges = _blocking_ranges(listing_id)
+        ListingOccupancyMonth.objects.filter(listing_id=listing_id).delete()
+        ListingOccupancyMonth.objects.bulk_create([
+            ListingOccupancyMonth(listing_id=listing_id, month=m, nights_mask=mask)
+            for m, mask in sorted(_masks_for(ranges).items())
+            if mask
+        ])
+        _bump_version(listing_id)
+
+
+def _ensure_index(listing_id: int) -> bool:
+    """
+    ✅ Crée l'index s'il n'existe pas encore -> True si on vient de le (re)construire entièrement
+    Chemins d'écriture seulement (bookings, calendriers importés): la lecture publique ne construit rien
+    (résidences créées avant l'index: migration 0021; nouvelles résidences: signal post_save Listing)
+    """
+    if ListingOccupancy.objects.filter(listing_id=listing_id).exists():
+        return False
+    try:
+        with transaction.atomic():
+            ListingOccupancy.objects.create(listing_id=listing_id, version=0)
+    except IntegrityError:
+        return False  # ✅ créé en parallèle par une autre requête
+    rebuild_listing(listing_id)
+    return True
+
+
+def _bump_version(listing_id: int):
+    ListingOccupancy.objects.filter(listing_id=listing_id).update(version=F("version") + 1)
+
+
+# =========================================================
+# ✅ Mise à jour incrémentale (signal post_save + appels explicites après .update())
+# =========================================================
+
+def refresh_ranges(listing_id: int, ranges):
+    """
+    ✅ Recalcule uniquement les mois touchés par ces intervalles [start, end)
+    """
+    months = sorted({m for start, end in ranges if start and end for m in months_between(start, end)})
+    if not months or not listing_id:
+        return
+
+    with transaction.atomic():
+        if _ensure_index(listing_id):
+            return
+        # ✅ verrou sur l'index de la résidence: 2 refresh concurrents passent l'un après l'autre,
+        # le 2e relit les bookings après le commit du 1er (sinon un masque périmé peut écraser le bon)
+        ListingOccupancy.objects.select_for_update().filter(listing_id=listing_id).values_list("id", flat=True).first()
+        rows = _blocking_ranges(listing_id, months[0], next_month(months[-1]))
+        _write_masks(listing_id, _masks_for(rows, months))
+        _bump_version(listing_id)
+
+
+def refresh_for_bookings(bookings):
+    """
+    ✅ À appeler après un Booking.objects...update(status=...) (pas de signal dans ce cas)
+    bookings: instances ou dicts avec listing_id/start_date/end_date
+    """
+    per_listing = {}
+    for b in bookings:
+        get = b.get if isinstance(b, dict) else (lambda k, _b=b: getattr(_b, k))
+        if get("start_date") and get("end_date"):
+            per_listing.setdefault(get("listing_id"), []).append((get("start_date"), get("end_date")))
+
+    for listing_id, ranges in per_listing.items():
+        refresh_ranges(listing_id, ranges)
+
+
+# =========================================================
+# ✅ Lecture (endpoint disponibilités)
+# =========================================================
+
+def get_version(listing_id: int) -> int:
+    """
+    ✅ Lecture seule -> 0 si la résidence n'a pas (encore) d'index
+    le 1er changement de dates le construit -> version >= 1: ETag / clé de cache changent d'eux-mêmes
+    """
+    return (
+        ListingOccupancy.objects
+        .filter(listing_id=listing_id)
+        .values_list("version", flat=True)
+        .first()
+    ) or 0
+
+
+def availability(listing_id: int, date_from: date, date_to: date, indexed: bool = True) -> dict:
+    """
+    ✅ Nuits [date_from, date_to): statut par nuit + plages occupées fusionnées
+    indexed=False (pas d'index): calculé depuis les bookings / blocs, sans rien écrire
+    """
+    if indexed:
+        masks = dict(
+            ListingOccupancyMonth.objects
+            .filter(listing_id=listing_id, month__gte=month_start(date_from), month__lt=date_to)
+            .values_list("month", "nights_mask")
+        )
+    else:
+        masks = _masks_for(_blocking_ranges(listing_id, date_from, date_to), list(months_between(date_from, date_to)))
+
+    nights, occupied = [], []
+    current = None
+    d = date_from
+    while d < date_to:
+        booked = bool(masks.get(month_start(d), 0) & (1 << (d.day - 1)))
+        nights.append({"date": d.isoformat(), "status": "booked" if booked else "free"})
+        if booked:
+            if current is None:
+                current = {"start": d.isoformat(), "end": None}
+                occupied.append(current)
+            current["end"] = (d + timedelta(days=1)).isoformat()
+        else:
+            current = None
+        d += timedelta(days=1)
+
+    return {"occupied": occupied, "nights": nights}
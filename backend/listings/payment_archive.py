@@ -0,0 +1,73 @@
+#listings/payment_archive.py
+import json
+import zlib
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import PaymentPayloadArchive
+
+
+# =========================================================
+# ✅ Archive des réponses Paystack (remplace PaymentTransaction.raw)
+# - payload complet compressé (zlib) dans PaymentPayloadArchive, 1 ligne par réponse (ajout seul)
+# - sur la transaction: seulement paystack_status / gateway_response / channel / paid_at
+# =========================================================
+
+COMPRESSION_LEVEL = 6
+
+
+def compress(payload) -> tuple:
+    raw = json.dumps(payload, cls=JSONEncoder, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, COMPRESSION_LEVEL), len(raw)
+
+
+def decompress(blob) -> dict:
+    return json.loads(zlib.decompress(bytes(blob)).decode("utf-8"))
+
+
+def summary_fields(payload) -> dict:
+    """
+    ✅ Colonnes gardées sur PaymentTransaction (réponse verify ou webhook: même bloc "data")
+    """
+    data = (payload or {}).get("data") or {}
+    if not isinstance(data, dict):
+        return {}
+
+    fields = {}
+    if data.get("status"):
+        fields["paystack_status"] = str(data["status"])[:30]
+    if data.get("gateway_response"):
+        fields["gateway_response"] = str(data["gateway_response"])[:255]
+    if data.get("channel"):
+        fields["channel"] = str(data["channel"])[:30]
+    paid_at = data.get("paid_at") or data.get("paidAt")
+    if paid_at:
+        parsed = parse_datetime(str(paid_at))
+        if parsed:
+            fields["paid_at"] = parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+    return fields
+
+
+def archive(transaction_id: int, source: str, payload) -> PaymentPayloadArchive:
+    blob, size = compress(payload)
+    return PaymentPayloadArchive.objects.create(
+        transaction_id=transaction_id, source=source, payload_zlib=blob, size=size,
+    )
+
+
+def payloads_for(transaction_id: int, limit: int = 20):
+    """
+    ✅ Lecture explicite (admin / support): [{"source", "created_at", "size", "payload"}], plus récent d'abord
+    """
+    rows = (
+        PaymentPayloadArchive.objects
+        .filter(transaction_id=transaction_id)
+        .order_by("-created_at", "-id")
+        .values_list("source", "created_at", "size", "payload_zlib")[:limit]
+    )
+    return [
+        {"source": source, "created_at": created_at, "size": size, "payload": decompress(blob)}
+        for source, created_at, size, blob in rows
+    ]
@@ -0,0 +1,182 @@
+#listings/paystack_inbox.py
+import time
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, F, Max, Sum
+from django.utils import timezone
+
+from .models import PaymentTransaction, PaystackWebhookEvent
+from .notifications import backoff_delay
+from .workers import claim_due, renew_lease
+from . import payment_archive
+
+logger = logging.getLogger("push")
+
+
+# =========================================================
+# ✅ Inbox des webhooks Paystack
+# - la vue: signature OK -> store_event() -> 200 (quelques ms)
+# - le worker: claim_batch() + process_event() (tx, booking, code clé, push)
+# - même événement renvoyé par Paystack -> même dedup_key -> no-op
+# =========================================================
+
+def dedup_key_for(payload: dict, raw_body: bytes) -> str:
+    event = str(payload.get("event") or "")
+    data = payload.get("data") or {}
+    ident = data.get("reference") or data.get("id")
+    if ident:
+        return f"{event}:{ident}"[:255]
+    return f"{event}:sha256:{hashlib.sha256(raw_body or b'').hexdigest()}"
+
+
+def store_event(payload: dict, raw_body: bytes, receive_ms: int = None):
+    """
+    ✅ -> (row, created). created=False: doublon (déjà reçu), rien à refaire
+    """
+    data = payload.get("data") or {}
+    key = dedup_key_for(payload, raw_body)
+    try:
+        with transaction.atomic():
+            row = PaystackWebhookEvent.objects.create(
+                dedup_key=key,
+                event=str(payload.get("event") or "")[:60],
+                reference=(str(data["reference"])[:120] if data.get("reference") else None),
+                payload=payload,
+                receive_ms=receive_ms,
+            )
+        return row, True
+    except IntegrityError:
+        PaystackWebhookEvent.objects.filter(dedup_key=key).update(duplicates=F("duplicates") + 1)
+        return None, False
+
+
+# =========================================================
+# ✅ Traitement (côté worker)
+# =========================================================
+
+def _max_attempts() -> int:
+    return int(getattr(settings, "PAYSTACK_WEBHOOK_MAX_ATTEMPTS", 8))
+
+
+def _lease_seconds() -> int:
+    return int(getattr(settings, "PAYSTACK_WEBHOOK_LEASE_SECONDS", 120))
+
+
+def claim_batch(batch_size: int = 50):
+    """
+    ✅ SKIP LOCKED + bail (même principe que l'outbox push, voir workers.py)
+    """
+    return claim_due(PaystackWebhookEvent, batch_size, _lease_seconds())
+
+
+def _apply(row: PaystackWebhookEvent) -> str:
+    """
+    ✅ Idempotent: rejouer la même ligne ne change rien
+    (transaction déjà "success" -> pas d'UPDATE, booking déjà "paid" -> transition perdue = no-op)
+    """
+    from .views import confirm_booking_payment  # ✅ import local: views importe ce module
+
+    if not row.reference:
+        return "ignored"
+
+    tx = (
+        PaymentTransaction.objects
+        .select_related("booking__listing")
+        .filter(reference=row.reference, provider="paystack")
+        .first()
+    )
+    if not tx:
+        return "ignored"
+
+    if row.event == "charge.success":
+        if PaymentTransaction.objects.filter(id=tx.id).exclude(status="success").update(
+            status="success", updated_at=timezone.now(), **payment_archive.summary_fields(row.payload),
+        ):
+            payment_archive.archive(tx.id, "webhook", row.payload)
+        confirm_booking_payment(tx.booking)
+    else:
+        # autres events: on garde la trace brute (archive compressée)
+        payment_archive.archive(tx.id, "webhook", row.payload)
+    return "done"
+
+
+def process_event(row: PaystackWebhookEvent) -> str:
+    """
+    ✅ -> "done" | "ignored" | "retry" | "dead"
+    """
+    started = time.monotonic()
+    try:
+        with transaction.atomic():
+            outcome = _apply(row)
+            PaystackWebhookEvent.objects.filter(id=row.id).update(
+                status=outcome,
+                processed_at=timezone.now(),
+                process_ms=int((time.monotonic() - started) * 1000),
+                last_error=None,
+            )
+        return outcome
+    except Exception as e:
+        logger.exception("PAYSTACK inbox error id=%s ref=%s err=%s", row.id, row.reference, str(e))
+        error = str(e)[:500]
+
+    if row.attempts >= _max_attempts():
+        PaystackWebhookEvent.objects.filter(id=row.id).update(status="dead", last_error=error)
+        logger.error("PAYSTACK inbox dead-letter id=%s ref=%s attempts=%s", row.id, row.reference, row.attempts)
+        return "dead"
+
+    PaystackWebhookEvent.objects.filter(id=row.id).update(
+        available_at=timezone.now() + backoff_delay(row.attempts),
+        last_error=error,
+    )
+    return "retry"
+
+
+def drain_inbox(batch_size: int = 50) -> dict:
+    counts = {"done": 0, "ignored": 0, "retry": 0, "dead": 0, "skipped": 0}
+    for row in claim_batch(batch_size):
+        if not renew_lease(row, _lease_seconds()):
+            counts["skipped"] += 1  # ✅ reprise par un autre worker
+            continue
+        counts[process_event(row)] += 1
+    return counts
+
+
+# =========================================================
+# ✅ Mesures + purge
+# =========================================================
+
+def timing_stats(since=None) -> dict:
+    """
+    ✅ Temps de réponse webhook, temps de traitement, délai réception -> traitement
+    """
+    since = since or timezone.now() - timedelta(hours=1)
+    qs = PaystackWebhookEvent.objects.filter(received_at__gte=since)
+    agg = qs.aggregate(
+        receive_ms_avg=Avg("receive_ms"),
+        receive_ms_max=Max("receive_ms"),
+        process_ms_avg=Avg("process_ms"),
+        process_ms_max=Max("process_ms"),
+        lag_max=Max(F("processed_at") - F("received_at")),
+        duplicates=Sum("duplicates"),
+    )
+    lag = agg.pop("lag_max")
+    return {
+        **{k: round(v or 0, 1) for k, v in agg.items()},
+        "lag_ms_max": int(lag.total_seconds() * 1000) if lag else 0,
+        "pending": PaystackWebhookEvent.objects.filter(status="pending").count(),
+    }
+
+
+def purge_old(now=None) -> int:
+    days = int(getattr(settings, "PAYSTACK_WEBHOOK_RETENTION_DAYS", 30))
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    deleted, _ = (
+        PaystackWebhookEvent.objects
+        .filter(received_at__lt=cutoff, status__in=["done", "ignored"])
+        .delete()
+    )
+    return deleted
@@ -0,0 +1,258 @@
+#listings/push.py
+import json
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from django.conf import settings
+from django.utils import timezone
+from pywebpush import webpush, WebPushException
+from py_vapid import Vapid
+
+from .models import PushSubscription
+from . import push_metrics
+
+logger = logging.getLogger("push")  # ✅ utilise le logger "push" du settings.LOGGING
+
+
+@dataclass
+class PushResult:
+    """
+    ✅ Résultat d'un envoi à tous les devices d'un user
+    - failed = erreurs "retryables" (5xx, timeout, réseau...)
+    - removed = abonnements expirés (404/410) supprimés
+    """
+    sent: int = 0
+    removed: int = 0
+    failed: int = 0
+    subscriptions: int = 0
+
+    @property
+    def should_retry(self) -> bool:
+        # ✅ rien n'est parti alors que des devices existent encore -> on retente plus tard
+        return self.sent == 0 and self.failed > 0
+
+
+# =========================================================
+# ✅ Signature VAPID
+# - le PEM est lu/parsé UNE fois par process (avant: à chaque webpush())
+# - le JWT ES256 ne dépend que de "aud" (= host du push service):
+#   on le réutilise jusqu'à peu avant son "exp"
+# =========================================================
+
+class VapidSigner:
+    def __init__(self, private_key_path: str, sub: str, ttl: int = 60 * 60, refresh_margin: int = 5 * 60):
+        self.private_key_path = private_key_path
+        self.sub = sub
+        self.ttl = ttl                        # ✅ 1h (Apple aime les exp courts)
+        self.refresh_margin = refresh_margin  # ✅ on re-signe 5 min avant l'expiration
+        self._vapid = Vapid.from_file(private_key_file=private_key_path)
+        self._headers = {}                    # aud -> (exp, headers)
+        self._lock = threading.Lock()
+
+    def headers_for(self, aud: str) -> dict:
+        now = int(time.time())
+        with self._lock:
+            cached = self._headers.get(aud)
+            if cached and cached[0] - self.refresh_margin > now:
+                return dict(cached[1])
+
+            exp = now + self.ttl
+            headers = self._vapid.sign({"sub": self.sub, "aud": aud, "exp": exp})
+            self._headers[aud] = (exp, headers)
+            return dict(headers)
+
+
+_SIGNER = None
+_SIGNER_LOCK = threading.Lock()
+
+
+def get_vapid_signer():
+    """
+    ✅ Signer partagé du process (recréé si la config VAPID change)
+    - None si VAPID_PRIVATE_KEY_PATH n'est pas configuré
+    """
+    global _SIGNER
+    path = getattr(settings, "VAPID_PRIVATE_KEY_PATH", "") or ""
+    sub = getattr(settings, "VAPID_CLAIMS", {}).get("sub") or "mailto:support@decrouresi.com"
+    if not path:
+        return None
+
+    signer = _SIGNER
+    if signer is None or signer.private_key_path != path or signer.sub != sub:
+        with _SIGNER_LOCK:
+            signer = _SIGNER
+            if signer is None or signer.private_key_path != path or signer.sub != sub:
+                signer = VapidSigner(path, sub)
+                _SIGNER = signer
+    return signer
+
+
+# =========================================================
+# ✅ Fan-out concurrent (un user = plusieurs devices)
+# - pool de threads partagé par le process (worker push)
+# - limite de concurrence PAR host de push service (fcm / apple / mozilla)
+# - une session HTTP par thread (keep-alive vers le push service)
+# =========================================================
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+_HOST_SEMAPHORES = {}
+_THREAD_LOCAL = threading.local()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(
+                    max_workers=int(getattr(settings, "PUSH_MAX_WORKERS", 8)),
+                    thread_name_prefix="webpush",
+                )
+    return _EXECUTOR
+
+
+def _host_semaphore(host: str) -> threading.BoundedSemaphore:
+    with _EXECUTOR_LOCK:
+        sem = _HOST_SEMAPHORES.get(host)
+        if sem is None:
+            sem = threading.BoundedSemaphore(int(getattr(settings, "PUSH_PER_HOST_CONCURRENCY", 4)))
+            _HOST_SEMAPHORES[host] = sem
+        return sem
+
+
+def _http_session() -> requests.Session:
+    session = getattr(_THREAD_LOCAL, "session", None)
+    if session is None:
+        session = requests.Session()
+        _THREAD_LOCAL.session = session
+    return session
+
+
+def _send_one(user_id, sub: PushSubscription, data: str, signer: VapidSigner):
+    """
+    ✅ Envoi vers UN device -> ("sent" | "expired" | "failed", sub_id)
+    Pas d'écriture DB ici: les résultats sont appliqués en bulk par deliver_push().
+    """
+    subscription_info = {
+        "endpoint": sub.endpoint,
+        "keys": {"p256dh": sub.p256dh, "auth": sub.auth},
+    }
+
+    # ✅ VAPID PRO: aud doit matcher le push service (FCM vs Apple)
+    parsed = urlparse(sub.endpoint)
+    aud = f"{parsed.scheme}://{parsed.netloc}"
+    service = push_metrics.service_for_endpoint(sub.endpoint)
+
+    outcome, status_code, error = "failed", None, None
+    started = time.monotonic()
+    try:
+        with _host_semaphore(parsed.netloc):
+            started = time.monotonic()  # ✅ durée = push service seulement (hors attente sémaphore)
+            resp = webpush(
+                subscription_info=subscription_info,
+                data=data,
+                headers=signer.headers_for(aud),  # ✅ JWT VAPID déjà signé (cache par aud)
+                ttl=60 * 10,          # ✅ 10 min
+                content_encoding="aes128gcm",
+                timeout=10,
+                requests_session=_http_session(),
+            )
+        outcome, status_code = "sent", getattr(resp, "status_code", None)
+
+    except WebPushException as ex:
+        status_code = getattr(ex.response, "status_code", None)
+        if status_code in [404, 410]:
+            outcome = "expired"
+        else:
+            try:
+                error = (ex.response.text or "")[:300]
+            except Exception:
+                error = str(ex)[:300]
+
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"[:300]
+
+    duration_ms = (time.monotonic() - started) * 1000
+    push_metrics.record(service, outcome, duration_ms)
+    push_metrics.log_send({
+        "user": user_id,
+        "sub": sub.id,
+        "service": service,
+        "outcome": outcome,
+        "status": status_code,
+        "ms": round(duration_ms, 1),
+        "error": error,
+    })
+    return outcome, sub.id
+
+
+def deliver_push(user, title: str, body: str, data: dict = None) -> PushResult:
+    """
+    ✅ Envoie réellement le push (appels HTTPS FCM/APNs/Mozilla), tous les devices en parallèle.
+    - 1 UPDATE last_seen_at (bulk) pour les envois OK
+    - 1 DELETE (bulk) pour les abonnements expirés (404/410)
+    ⚠️ Bloquant: à appeler depuis le worker (notifications.py), pas depuis une vue.
+    """
+    result = PushResult()
+    user_id = getattr(user, "id", None)
+    subs = list(PushSubscription.objects.filter(user=user))
+    result.subscriptions = len(subs)
+
+    if not subs:
+        return result
+
+    # ✅ IMPORTANT: VAPID_PRIVATE_KEY_PATH = PATH vers le PEM (pas le contenu)
+    try:
+        signer = get_vapid_signer()
+    except Exception as e:
+        logger.exception("VAPID key load failed: %s", str(e))
+        signer = None
+
+    if signer is None:
+        logger.error("VAPID_PRIVATE_KEY_PATH missing or unreadable")
+        result.failed = len(subs)
+        return result
+
+    payload = json.dumps({
+        "title": title,
+        "body": body,
+        "data": data or {},
+    })
+
+    if len(subs) == 1:
+        outcomes = [_send_one(user_id, subs[0], payload, signer)]
+    else:
+        futures = [
+            _executor().submit(_send_one, user_id, sub, payload, signer)
+            for sub in subs
+        ]
+        outcomes = [f.result() for f in futures]
+
+    sent_ids = [sub_id for outcome, sub_id in outcomes if outcome == "sent"]
+    expired_ids = [sub_id for outcome, sub_id in outcomes if outcome == "expired"]
+
+    result.sent = len(sent_ids)
+    result.removed = len(expired_ids)
+    result.failed = len(outcomes) - result.sent - result.removed
+
+    if sent_ids:
+        PushSubscription.objects.filter(id__in=sent_ids).update(last_seen_at=timezone.now())
+    if expired_ids:
+        PushSubscription.objects.filter(id__in=expired_ids).delete()
+
+    push_metrics.flush()
+    return result
+
+
+def send_push_to_user(user, title: str, body: str, data: dict = None):
+    """
+    ✅ Envoi direct (synchrone). Les vues passent par notifications.enqueue_push().
+    """
+    return deliver_push(user, title, body, data).sent > 0
@@ -0,0 +1,154 @@
+#listings/push_metrics.py
+import json
+import random
+import logging
+import threading
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import PushMetricBucket
+
+logger = logging.getLogger("push")
+
+# ✅ bornes (ms) de l'histogramme -> colonnes le_100 ... le_2500, le_inf
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500)
+_BUCKET_FIELDS = [f"le_{b}" for b in LATENCY_BUCKETS_MS] + ["le_inf"]
+_COUNTER_FIELDS = ["sent", "failed", "expired", "duration_ms_sum"] + _BUCKET_FIELDS
+
+
+def service_for_endpoint(endpoint: str) -> str:
+    """
+    ✅ fcm | apple | mozilla | other (d'après le host de l'endpoint)
+    """
+    host = (urlparse(endpoint or "").netloc or "").lower()
+    if host.endswith("googleapis.com"):
+        return "fcm"
+    if host.endswith("push.apple.com"):
+        return "apple"
+    if host.endswith("mozilla.com") or host.endswith("mozaws.net"):
+        return "mozilla"
+    return "other"
+
+
+def _bucket_field(duration_ms: float) -> str:
+    for bound, field in zip(LATENCY_BUCKETS_MS, _BUCKET_FIELDS):
+        if duration_ms <= bound:
+            return field
+    return "le_inf"
+
+
+# =========================================================
+# ✅ Accumulateur en mémoire (thread-safe), vidé en base par flush()
+# =========================================================
+
+_LOCK = threading.Lock()
+_PENDING = defaultdict(lambda: defaultdict(int))  # service -> field -> delta
+
+
+def record(service: str, outcome: str, duration_ms: float):
+    """
+    ✅ outcome: "sent" | "failed" | "expired"
+    """
+    with _LOCK:
+        c = _PENDING[service]
+        c[outcome] += 1
+        c["duration_ms_sum"] += int(duration_ms)
+        c[_bucket_field(duration_ms)] += 1
+
+
+def flush():
+    """
+    ✅ Écrit les deltas accumulés: 1 UPDATE par service touché (heure courante)
+    Ne doit jamais casser l'envoi des push.
+    """
+    with _LOCK:
+        pending = {svc: dict(fields) for svc, fields in _PENDING.items()}
+        _PENDING.clear()
+
+    if not pending:
+        return
+
+    bucket_start = timezone.now().replace(minute=0, second=0, microsecond=0)
+    for service, fields in pending.items():
+        updates = {k: F(k) + v for k, v in fields.items() if v}
+        try:
+            done = PushMetricBucket.objects.filter(service=service, bucket_start=bucket_start).update(**updates)
+            if not done:
+                try:
+                    with transaction.atomic():
+                        PushMetricBucket.objects.create(service=service, bucket_start=bucket_start, **fields)
+                except IntegrityError:
+                    # ✅ un autre worker a créé la ligne entre-temps
+                    PushMetricBucket.objects.filter(service=service, bucket_start=bucket_start).update(**updates)
+        except Exception as e:
+            logger.exception("PUSH_METRICS flush failed service=%s err=%s", service, str(e))
+
+
+def _approx_percentile(row: dict, q: float):
+    """
+    ✅ percentile approché depuis l'histogramme (borne haute du bucket)
+    """
+    total = sum(row[f] for f in _BUCKET_FIELDS)
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for bound, field in zip(list(LATENCY_BUCKETS_MS) + [None], _BUCKET_FIELDS):
+        seen += row[field]
+        if seen >= target:
+            return bound  # None = au-delà de la dernière borne
+    return None
+
+
+def snapshot(since):
+    """
+    ✅ Agrégat par service depuis `since` (pour l'endpoint admin)
+    """
+    rows = (
+        PushMetricBucket.objects
+        .filter(bucket_start__gte=since)
+        .values("service")
+        .annotate(**{f: Sum(f) for f in _COUNTER_FIELDS})
+        .order_by("service")
+    )
+    services = {}
+    for r in rows:
+        r = {k: (v or 0) if k != "service" else v for k, v in r.items()}
+        total = r["sent"] + r["failed"] + r["expired"]
+        services[r["service"]] = {
+            "sent": r["sent"],
+            "failed": r["failed"],
+            "expired": r["expired"],
+            "avg_duration_ms": round(r["duration_ms_sum"] / total, 1) if total else None,
+            "p50_ms_le": _approx_percentile(r, 0.50),
+            "p95_ms_le": _approx_percentile(r, 0.95),
+            "histogram_ms": {
+                **{str(b): r[f"le_{b}"] for b in LATENCY_BUCKETS_MS},
+                "inf": r["le_inf"],
+            },
+        }
+    return services
+
+
+# =========================================================
+# ✅ Logs structurés échantillonnés
+# - succès: 1 sur N (PUSH_LOG_SAMPLE_RATE)
+# - échecs / expirés: toujours
+# =========================================================
+
+def log_send(event: dict):
+    outcome = event.get("outcome")
+    if outcome == "sent":
+        rate = float(getattr(settings, "PUSH_LOG_SAMPLE_RATE", 0.05))
+        if random.random() >= rate:
+            return
+        logger.info("WEBPUSH %s", json.dumps(event, default=str))
+    elif outcome == "expired":
+        logger.warning("WEBPUSH %s", json.dumps(event, default=str))
+    else:
+        logger.error("WEBPUSH %s", json.dumps(event, default=str))
@@ -0,0 +1,146 @@
+#listings/reconciliation.py
+import time
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import PaymentTransaction
+
+logger = logging.getLogger("push")
+
+
+# =========================================================
+# ✅ Réconciliation Paystack
+# transactions "initiated" trop vieilles (page Paystack fermée, webhook perdu)
+# -> verify côté Paystack -> même chemin idempotent que verify / webhook
+#
+# - les ids sont lus par paquets (.iterator), jamais toute la table en mémoire
+# - appels HTTP dans un pool borné (concurrency) + limite de débit (rate/s)
+# - écritures DB dans le thread principal (pas de connexions DB par thread)
+# =========================================================
+
+class RateLimiter:
+    """
+    ✅ Token bucket: au plus `rate` appels/s (rafale max = burst)
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+
+
+def stale_transactions(older_than_minutes: int = None, limit: int = None):
+    """
+    ✅ Transactions Paystack encore "initiated" depuis plus de N minutes (les plus vieilles d'abord)
+    """
+    minutes = int(older_than_minutes or getattr(settings, "PAYSTACK_RECONCILE_AFTER_MINUTES", 30))
+    qs = (
+        PaymentTransaction.objects
+        .filter(provider="paystack", status="initiated", created_at__lt=timezone.now() - timedelta(minutes=minutes))
+        .order_by("created_at", "id")
+        .values_list("id", "reference")
+    )
+    if limit:
+        qs = qs[:limit]
+    return qs.iterator(chunk_size=200)
+
+
+def reconcile(
+    older_than_minutes: int = None,
+    concurrency: int = None,
+    rate: float = None,
+    limit: int = None,
+    dry_run: bool = False,
+    verify=None,
+    settle=None,
+) -> dict:
+    """
+    ✅ -> rapport {"checked", "paid", "already_paid", "failed", "pending", "errors", "elapsed_s", "error_refs"}
+    verify / settle injectables (par défaut: paystack_verify / settle_paystack_transaction des vues)
+    """
+    from .views import paystack_verify, settle_paystack_transaction  # ✅ import local: évite l'import circulaire
+
+    verify = verify or paystack_verify
+    settle = settle or settle_paystack_transaction
+    concurrency = max(1, int(concurrency or getattr(settings, "PAYSTACK_RECONCILE_CONCURRENCY", 4)))
+    rate = float(rate if rate is not None else getattr(settings, "PAYSTACK_RECONCILE_RATE_PER_SECOND", 5))
+    limiter = RateLimiter(rate, burst=concurrency)
+
+    counts = Counter()
+    error_refs = []
+    started = time.monotonic()
+
+    def _fetch(reference):
+        limiter.acquire()
+        return verify(reference)
+
+    def _collect(done):
+        for fut in done:
+            tx_id, reference = pending.pop(fut)
+            counts["checked"] += 1
+            try:
+                resp = fut.result()
+            except Exception as e:
+                counts["errors"] += 1
+                error_refs.append(reference)
+                logger.warning("PAYSTACK reconcile verify failed ref=%s err=%s", reference, str(e))
+                continue
+
+            if dry_run:
+                counts[f"paystack_{(resp.get('data') or {}).get('status') or 'unknown'}"] += 1
+                continue
+
+            try:
+                tx = PaymentTransaction.objects.select_related("booking__listing").get(id=tx_id)
+                counts[settle(tx, resp)] += 1
+            except Exception as e:
+                counts["errors"] += 1
+                error_refs.append(reference)
+                logger.exception("PAYSTACK reconcile apply failed ref=%s err=%s", reference, str(e))
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="paystack-reconcile") as pool:
+        for tx_id, reference in stale_transactions(older_than_minutes, limit):
+            # ✅ au plus 2x concurrency requêtes en vol: le flux d'ids n'est pas tout chargé d'avance
+            if len(pending) >= concurrency * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done)
+            pending[pool.submit(_fetch, reference)] = (tx_id, reference)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            _collect(done)
+
+    report = {
+        "checked": counts.pop("checked", 0),
+        **{k: counts.pop(k, 0) for k in ("paid", "already_paid", "failed", "pending", "errors")},
+        **dict(counts),
+        "elapsed_s": round(time.monotonic() - started, 2),
+        "error_refs": error_refs[:50],
+    }
+    logger.info(
+        "PAYSTACK reconcile %s",
+        " ".join(f"{k}={v}" for k, v in report.items() if k != "error_refs"),
+    )
+    return report
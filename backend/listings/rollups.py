@@ -0,0 +1,131 @@
+#listings/rollups.py
+from datetime import datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from .models import Booking, DailyBookingRollup, Listing, Payout
+
+
+# =========================================================
+# ✅ Rollups quotidiens des stats admin (gains gérants / top résidences / profit plateforme)
+# 1 ligne DailyBookingRollup par jour x résidence (jour = created_at du booking, fuseau du projet)
+#
+# - refresh_day(): recalcule UNE ligne depuis les bookings de ce jour pour cette résidence
+#   (quelques lignes, index listing) -> appelé à chaque transition / save d'un booking payé
+# - rebuild(): reconstruit une période entière (manage.py rebuild_booking_rollups)
+# - owner: copié à la création de la ligne, suivi ensuite par le receiver post_save Listing (models.py)
+# Recalcul (et pas +1/-1): idempotent, rejouable, pas de dérive si un appel est perdu
+# =========================================================
+
+PAID_BOOKING_STATUSES = ("paid", "checked_in", "released")
+
+
+def day_of(dt):
+    return timezone.localtime(dt).date()
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime(day.year, day.month, day.day))
+    return start, start + timedelta(days=1)
+
+
+def refresh_day(listing_id: int, day, create: bool = True):
+    """
+    ✅ Recalcule la ligne (day, listing_id); la supprime s'il n'y a plus de booking payé
+    create=False: met à jour / supprime seulement (suppression en cascade en cours)
+    """
+    start, end = _day_bounds(day)
+    bookings = Booking.objects.filter(
+        listing_id=listing_id, created_at__gte=start, created_at__lt=end, status__in=PAID_BOOKING_STATUSES,
+    )
+    agg = bookings.aggregate(
+        bookings=Count("id"),
+        total_deposit=Sum("deposit_amount"),
+        total_commission=Sum("platform_commission"),
+        total_payout=Sum("payout_amount"),
+        last_booking_at=Max("created_at"),
+    )
+    rows = DailyBookingRollup.objects.filter(listing_id=listing_id, day=day)
+    if not agg["bookings"]:
+        rows.delete()
+        return
+
+    payouts = Payout.objects.filter(booking__in=bookings).aggregate(
+        pending=Sum("amount", filter=Q(status="pending")),
+        paid=Sum("amount", filter=Q(status="paid")),
+    )
+    values = {
+        "bookings": agg["bookings"],
+        "total_deposit": agg["total_deposit"] or 0,
+        "total_commission": agg["total_commission"] or 0,
+        "total_payout": agg["total_payout"] or 0,
+        "pending_payout": payouts["pending"] or 0,
+        "paid_payout": payouts["paid"] or 0,
+        "last_booking_at": agg["last_booking_at"],
+        "updated_at": timezone.now(),
+    }
+    if rows.update(**values) or not create:
+        return
+
+    values["owner_id"] = Listing.objects.filter(id=listing_id).values_list("author_id", flat=True).first()
+    try:
+        with transaction.atomic():
+            DailyBookingRollup.objects.create(listing_id=listing_id, day=day, **values)
+    except IntegrityError:
+        # ✅ créée entre-temps par un autre process: mêmes valeurs recalculées
+        rows.update(**values)
+
+
+def refresh_for_booking(booking: Booking, create: bool = True):
+    if booking.listing_id and booking.created_at:
+        refresh_day(booking.listing_id, day_of(booking.created_at), create=create)
+
+
+def refresh_for_booking_id(booking_id: int):
+    row = Booking.objects.filter(id=booking_id).values("listing_id", "created_at").first()
+    if row and row["created_at"]:
+        refresh_day(row["listing_id"], day_of(row["created_at"]))
+
+
+def rebuild(date_from=None, date_to=None) -> int:
+    """
+    ✅ Reconstruit les rollups de [date_from, date_to] (dates, bornes incluses; None = tout)
+    -> nombre de lignes écrites
+    """
+    bookings = Booking.objects.filter(status__in=PAID_BOOKING_STATUSES)
+    rollups = DailyBookingRollup.objects.all()
+    if date_from:
+        bookings = bookings.filter(created_at__gte=_day_bounds(date_from)[0])
+        rollups = rollups.filter(day__gte=date_from)
+    if date_to:
+        bookings = bookings.filter(created_at__lt=_day_bounds(date_to)[1])
+        rollups = rollups.filter(day__lte=date_to)
+
+    acc = {}
+    fields = (
+        "listing_id", "listing__author_id", "created_at",
+        "deposit_amount", "platform_commission", "payout_amount", "payout__status", "payout__amount",
+    )
+    for b in bookings.values(*fields).iterator(chunk_size=2000):
+        key = (day_of(b["created_at"]), b["listing_id"])
+        row = acc.get(key)
+        if row is None:
+            row = acc[key] = DailyBookingRollup(
+                day=key[0], listing_id=key[1], owner_id=b["listing__author_id"], last_booking_at=b["created_at"],
+            )
+        row.bookings += 1
+        row.total_deposit += b["deposit_amount"] or 0
+        row.total_commission += b["platform_commission"] or 0
+        row.total_payout += b["payout_amount"] or 0
+        if b["payout__status"] == "pending":
+            row.pending_payout += b["payout__amount"] or 0
+        elif b["payout__status"] == "paid":
+            row.paid_payout += b["payout__amount"] or 0
+        row.last_booking_at = max(row.last_booking_at, b["created_at"])
+
+    with transaction.atomic():
+        rollups.delete()
+        DailyBookingRollup.objects.bulk_create(acc.values(), batch_size=1000)
+    return len(acc)
@@ -7,6 +7,7 @@ from django.db.models import Q, Max
 from django.contrib.auth.hashers import make_password, check_password
 import urllib.parse
 from rest_framework import serializers
+from rest_framework.exceptions import Throttled
 from django.db.models import Q, Max, Sum, Count
 
 from .models import (
@@ -20,7 +21,13 @@ from .models import (
     Dispute,
     DisputeMessage,
     AuditLog,
+    BLOCKING_BOOKING_STATUSES,
+    ExternalCalendar,
+    ExternalCalendarBlock,
 )
+from .booking_state import transition
+from . import occupancy, events
+from . import key_codes
 
 
 # =========================================================
@@ -452,6 +459,29 @@ def compute_platform_commission(deposit_amount: int) -> int:
     return int(round(dep * 0.10))
 
 
+def compute_approval_amounts(price_per_night: int, start_date: date, end_date: date) -> dict:
+    """
+    ✅ Montants figés à l'acceptation du gérant (champs Booking)
+    """
+    # ✅ total_amount recalculé à partir des dates (safe)
+    nights = max((end_date - start_date).days, 0)
+    total_amount = compute_total_amount(price_per_night, nights)
+
+    # ✅ préparer paiement (mais pas encore initié)
+    deposit = compute_deposit(total_amount)
+    commission = compute_platform_commission(deposit)
+
+    # ✅ CHANGE: le client paie les frais de service (sécurité) = commission
+    # ✅ Paystack fee n'est plus affiché/ajouté au client (tu l’absorbes côté plateforme)
+    return {
+        "total_amount": total_amount,
+        "deposit_amount": deposit,
+        "platform_commission": commission,
+        "paystack_fee": 0,  # ✅ on garde le champ mais à 0 pour compat UI
+        "amount_to_pay": deposit + commission,
+    }
+
+
 def estimate_paystack_fee(amount_cfa: int) -> int:
     """
     ✅ Estimation simple (à ajuster après selon Paystack CI).
@@ -477,12 +507,13 @@ def is_listing_available(listing_id: int, start_date: date, end_date: date, excl
     On considère comme “bloquants”:
     - approved / awaiting_payment / paid / checked_in / released
     (rejected/cancelled/expired ne bloquent pas)
+    - les blocs des calendriers externes importés
     """
     qs = Booking.objects.filter(
         listing_id=listing_id,
         start_date__isnull=False,
         end_date__isnull=False,
-        status__in=["approved", "awaiting_payment", "paid", "checked_in", "released"],
+        status__in=BLOCKING_BOOKING_STATUSES,
     )
 
     if exclude_booking_id:
@@ -490,7 +521,58 @@ def is_listing_available(listing_id: int, start_date: date, end_date: date, excl
 
     # overlap check côté DB
     qs = qs.filter(start_date__lt=end_date, end_date__gt=start_date)
-    return not qs.exists()
+    if qs.exists():
+        return False
+
+    # ✅ dates bloquées par un calendrier externe (.ics importé)
+    return not ExternalCalendarBlock.objects.filter(
+        listing_id=listing_id,
+        calendar__is_active=True,
+        start_date__lt=end_date,
+        end_date__gt=start_date,
+    ).exists()
+
+
+def taken_ranges_by_listing(listing_ids, lo: date, hi: date) -> dict:
+    """
+    ✅ Version "lot" de is_listing_available: 1 requête pour plusieurs résidences
+    -> {listing_id: [(start, end), ...]} des nuits prises qui touchent [lo, hi)
+    (bookings bloquants + blocs des calendriers externes), contrôle ensuite en mémoire
+    """
+    bookings = Booking.objects.filter(
+        listing_id__in=listing_ids,
+        status__in=BLOCKING_BOOKING_STATUSES,
+        start_date__lt=hi,
+        end_date__gt=lo,
+    )
+
+    blocks = ExternalCalendarBlock.objects.filter(
+        listing_id__in=listing_ids,
+        calendar__is_active=True,
+        start_date__lt=hi,
+        end_date__gt=lo,
+    )
+
+    taken = {}
+    for listing_id, start, end in (
+        bookings.values_list("listing_id", "start_date", "end_date")
+        .union(blocks.values_list("listing_id", "start_date", "end_date"), all=True)
+    ):
+        taken.setdefault(listing_id, []).append((start, end))
+    return taken
+
+
+def lock_listing_dates(booking: Booking, start_date: date, end_date: date):
+    """
+    ✅ Anti double-réservation (à appeler DANS une transaction)
+    - verrou sur la ligne Listing: 2 validations concurrentes sur la même résidence
+      passent l'une après l'autre, la 2e voit les dates prises par la 1re
+    - re-check dispo sous verrou (le statut est re-vérifié par la transition compare-and-set)
+    """
+    Listing.objects.select_for_update().filter(id=booking.listing_id).values_list("id", flat=True).first()
+
+    if not is_listing_available(booking.listing_id, start_date, end_date, exclude_booking_id=booking.id):
+        raise serializers.ValidationError("Cette résidence est déjà prise sur ces dates.")
 
 
 # =========================================================
@@ -504,6 +586,20 @@ class BookingDateProposalSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "created_at"]
 
 
+# ✅ relations lues par BookingPublicSerializer (listing.title, owner_contact, user_*)
+BOOKING_PUBLIC_RELATED = ("listing__author__profile", "user__profile")
+
+
+def booking_public_queryset(qs=None):
+    """
+    ✅ Plan de chargement partagé par TOUTES les vues qui rendent BookingPublicSerializer
+    -> nb de requêtes constant, quel que soit le nb de lignes (pas de N+1)
+    """
+    if qs is None:
+        qs = Booking.objects.all()
+    return qs.select_related(*BOOKING_PUBLIC_RELATED)
+
+
 class BookingPublicSerializer(serializers.ModelSerializer):
     """
     ✅ Serializer “lecture” pour client/owner (safe)
@@ -765,37 +861,23 @@ class BookingOwnerDecisionSerializer(serializers.Serializer):
         action = self.validated_data["action"]
 
         if action == "approve":
-            booking.status = "approved"
-            booking.approved_at = timezone.now()
-            booking.owner_note = owner_note
-
-            # ✅ dates confirmées
-            booking.start_date = self.validated_data["start_date"]
-            booking.end_date = self.validated_data["end_date"]
-
-            # ✅ total_amount recalculé à partir des dates (safe)
-            nights = max((booking.end_date - booking.start_date).days, 0)
-            booking.total_amount = compute_total_amount(booking.price_per_night, nights)
-
-            # ✅ préparer paiement (mais pas encore initié)
-            deposit = compute_deposit(booking.total_amount)
-            commission = compute_platform_commission(deposit)
-
-            # ✅ CHANGE: le client paie les frais de service (sécurité) = commission
-            # ✅ Paystack fee n'est plus affiché/ajouté au client (tu l’absorbes côté plateforme)
-            fee = 0
-            amount_to_pay = deposit + commission
-
-            booking.deposit_amount = deposit
-            booking.platform_commission = commission
-            booking.paystack_fee = fee  # ✅ on garde le champ mais à 0 pour compat UI
-            booking.amount_to_pay = amount_to_pay
-
-
-            # ✅ client pourra payer -> awaiting_payment
-            booking.status = "awaiting_payment"
-
-            booking.save()
+            # ✅ validate() a vérifié sans verrou: on re-vérifie sous verrou avant d'écrire
+            start_date = self.validated_data["start_date"]
+            end_date = self.validated_data["end_date"]
+            lock_listing_dates(booking, start_date, end_date)
+
+            # ✅ client pourra payer -> awaiting_payment (compare-and-set sur "requested")
+            won = transition(
+                booking,
+                "awaiting_payment",
+                approved_at=timezone.now(),
+                owner_note=owner_note,
+                start_date=start_date,          # ✅ dates confirmées
+                end_date=end_date,
+                **compute_approval_amounts(booking.price_per_night, start_date, end_date),
+            )
+            if not won:
+                raise serializers.ValidationError("Cette réservation n'est plus en attente.")
 
             # ✅ clear proposals éventuelles
             booking.date_proposals.all().delete()
@@ -803,10 +885,9 @@ class BookingOwnerDecisionSerializer(serializers.Serializer):
             return booking
 
         # action == reject
-        booking.status = "rejected"
-        booking.rejected_at = timezone.now()
-        booking.owner_note = owner_note
-        booking.save()
+        won = transition(booking, "rejected", rejected_at=timezone.now(), owner_note=owner_note)
+        if not won:
+            raise serializers.ValidationError("Cette réservation n'est plus en attente.")
 
         # ✅ save proposals (optionnel)
         booking.date_proposals.all().delete()
@@ -821,6 +902,222 @@ class BookingOwnerDecisionSerializer(serializers.Serializer):
         return booking
 
 
+class BookingBulkDecisionItemSerializer(serializers.Serializer):
+    booking_id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=["approve", "reject"])
+    start_date = serializers.DateField(required=False, allow_null=True)
+    owner_note = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    proposals = BookingDateProposalSerializer(many=True, required=False)
+
+    def validate(self, attrs):
+        for p in attrs.get("proposals", []):
+            if p["end_date"] <= p["start_date"]:
+                raise serializers.ValidationError("Proposition invalide: end_date doit être > start_date.")
+        return attrs
+
+
+class BookingBulkDecisionSerializer(serializers.Serializer):
+    """
+    ✅ Gérant: approve/reject de plusieurs demandes d'un coup
+    - dispo vérifiée pour tout le lot ensemble (y compris conflits ENTRE demandes du lot)
+    - 1 transaction, écritures en bulk
+    - résultat par demande: les demandes en erreur sont ignorées, les autres appliquées
+    """
+    MAX_ITEMS = 100
+
+    decisions = BookingBulkDecisionItemSerializer(many=True)
+
+    def validate_decisions(self, items):
+        if not items:
+            raise serializers.ValidationError("Aucune décision.")
+        if len(items) > self.MAX_ITEMS:
+            raise serializers.ValidationError(f"Maximum {self.MAX_ITEMS} décisions par appel.")
+        ids = [i["booking_id"] for i in items]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Une même réservation apparaît plusieurs fois.")
+        return items
+
+    @transaction.atomic
+    def save(self):
+        request = self.context["request"]
+        items = self.validated_data["decisions"]
+        now = timezone.now()
+        results = {i["booking_id"]: None for i in items}
+
+        # ✅ 1 requête: les bookings du gérant encore en attente, verrouillés
+        ids = list(results)
+        bookings = {
+            b.id: b
+            for b in Booking.objects
+            .select_for_update(of=("self",))
+            .select_related("listing")
+            .filter(id__in=ids, listing__author_id=request.user.id)
+        }
+
+        # ✅ verrou résidences (ordre fixe -> pas de deadlock entre 2 lots)
+        listing_ids = sorted({b.listing_id for b in bookings.values()})
+        list(Listing.objects.select_for_update().filter(id__in=listing_ids).order_by("id").values_list("id", flat=True))
+
+        approvals = []
+        for item in items:
+            b = bookings.get(item["booking_id"])
+            if b is None:
+                results[item["booking_id"]] = {"ok": False, "detail": "Introuvable ou non autorisé."}
+            elif b.status != "requested":
+                results[b.id] = {"ok": False, "detail": "Cette réservation n'est plus en attente."}
+            elif item["action"] == "approve":
+                sd = item.get("start_date") or b.desired_start_date
+                if not sd:
+                    results[b.id] = {"ok": False, "detail": "Date de début requise (ou date souhaitée)."}
+                    continue
+                approvals.append((item, b, sd, sd + timedelta(days=int(b.duration_days or 1))))
+
+        # ✅ dispo: 1 requête pour toutes les résidences du lot, puis contrôle en mémoire
+        # (rien à exclure: les demandes "requested" du lot ne sont pas bloquantes, et celles déjà
+        # awaiting_payment / paid refusées plus haut gardent leurs dates)
+        taken = {}
+        if approvals:
+            taken = taken_ranges_by_listing(
+                {a[1].listing_id for a in approvals},
+                min(a[2] for a in approvals),
+                max(a[3] for a in approvals),
+            )
+
+        to_update, approved, rejected = [], [], []
+        for item, b, sd, ed in approvals:
+            ranges = taken.setdefault(b.listing_id, [])
+            if any(start < ed and end > sd for start, end in ranges):
+                results[b.id] = {"ok": False, "detail": "Cette résidence est déjà prise sur ces dates."}
+                continue
+            ranges.append((sd, ed))  # ✅ les demandes suivantes du lot voient ces dates prises
+
+            b.status = "awaiting_payment"
+            b.approved_at = now
+            b.owner_note = item.get("owner_note") or ""
+            b.start_date, b.end_date = sd, ed
+            for field, value in compute_approval_amounts(b.price_per_night, sd, ed).items():
+                setattr(b, field, value)
+            to_update.append(b)
+            approved.append(b)
+
+        proposals = []
+        for item in items:
+            b = bookings.get(item["booking_id"])
+            if item["action"] != "reject" or results[item["booking_id"]] is not None:
+                continue
+            b.status = "rejected"
+            b.rejected_at = now
+            b.owner_note = item.get("owner_note") or ""
+            to_update.append(b)
+            rejected.append(b)
+            proposals += [
+                BookingDateProposal(booking=b, start_date=p["start_date"], end_date=p["end_date"], note=p.get("note") or "")
+                for p in item.get("proposals", [])
+            ]
+
+        if to_update:
+            Booking.objects.bulk_update(
+                to_update,
+                [
+                    "status", "approved_at", "rejected_at", "owner_note", "start_date", "end_date",
+                    "total_amount", "deposit_amount", "platform_commission", "paystack_fee", "amount_to_pay",
+                ],
+            )
+            BookingDateProposal.objects.filter(booking_id__in=[b.id for b in to_update]).delete()
+            BookingDateProposal.objects.bulk_create(proposals)
+
+            # ✅ bulk_update: pas de signal -> index d'occupation mis à jour ici
+            occupancy.refresh_for_bookings(approved)
+
+            # ✅ flux SSE: 1 seul INSERT pour tout le lot
+            events.record_many([(b.id, b.user_id, b.listing.author_id, b.status) for b in to_update])
+
+        for b in approved + rejected:
+            results[b.id] = {"ok": True, "status": b.status}
+
+        self.approved, self.rejected = approved, rejected
+        return [{"booking_id": booking_id, **r} for booking_id, r in results.items()]
+
+
+class BookingQuoteRangeSerializer(serializers.Serializer):
+    start_date = serializers.DateField()
+    nights = serializers.IntegerField(min_value=1, max_value=365)
+
+
+class BookingQuoteSerializer(serializers.Serializer):
+    """
+    ✅ Devis en lot (grille de prix côté UI, 1 seule requête)
+    - 1 résidence + plusieurs plages:   {"listing": 3, "ranges": [{"start_date", "nights"}, ...]}
+    - plusieurs résidences + 1 plage:  {"listings": [3, 4], "start_date": ..., "nights": 5}
+    Montants = compute_approval_amounts (les mêmes que ceux figés à l'acceptation du gérant)
+    """
+    MAX_QUOTES = 200
+
+    listing = serializers.IntegerField(required=False)
+    ranges = BookingQuoteRangeSerializer(many=True, required=False)
+    listings = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    start_date = serializers.DateField(required=False)
+    nights = serializers.IntegerField(required=False, min_value=1, max_value=365)
+
+    def validate(self, attrs):
+        single = attrs.get("listing") is not None
+        many = attrs.get("listings") is not None
+        if single == many:
+            raise serializers.ValidationError("Envoyer soit 'listing' + 'ranges', soit 'listings' + 'start_date' + 'nights'.")
+
+        if single:
+            if not attrs.get("ranges"):
+                raise serializers.ValidationError({"ranges": "Au moins une plage."})
+            pairs = [(attrs["listing"], r["start_date"], r["nights"]) for r in attrs["ranges"]]
+        else:
+            if not attrs.get("start_date") or not attrs.get("nights"):
+                raise serializers.ValidationError("'start_date' et 'nights' requis avec 'listings'.")
+            pairs = [(lid, attrs["start_date"], attrs["nights"]) for lid in dict.fromkeys(attrs["listings"])]
+
+        if len(pairs) > self.MAX_QUOTES:
+            raise serializers.ValidationError(f"Maximum {self.MAX_QUOTES} devis par appel.")
+
+        today = timezone.localdate()
+        if any(start < today for _, start, _ in pairs):
+            raise serializers.ValidationError({"start_date": "Les dates passées ne sont pas autorisées."})
+
+        attrs["pairs"] = pairs
+        return attrs
+
+    def quotes(self):
+        pairs = self.validated_data["pairs"]
+
+        # ✅ 1 requête pour les prix, 1 requête pour les dispos de toutes les résidences
+        prices = dict(
+            Listing.objects
+            .filter(id__in={p[0] for p in pairs}, is_active=True)
+            .values_list("id", "price_per_night")
+        )
+        ranges = [(lid, start, start + timedelta(days=n)) for lid, start, n in pairs]
+        taken = taken_ranges_by_listing(
+            list(prices),
+            min(r[1] for r in ranges),
+            max(r[2] for r in ranges),
+        ) if prices else {}
+
+        amounts = {}  # ✅ même prix x même nb de nuits -> même calcul
+        results = []
+        for listing_id, start, end in ranges:
+            row = {"listing": listing_id, "start_date": start, "end_date": end, "nights": (end - start).days}
+            price = prices.get(listing_id)
+            if price is None:
+                results.append({**row, "available": False, "detail": "Résidence introuvable ou inactive."})
+                continue
+
+            key = (price, row["nights"])
+            if key not in amounts:
+                amounts[key] = compute_approval_amounts(price, start, end)
+
+            busy = any(s < end and e > start for s, e in taken.get(listing_id, ()))
+            results.append({**row, "price_per_night": price, "available": not busy, **amounts[key]})
+        return results
+
+
 class BookingPaymentPrepareSerializer(serializers.ModelSerializer):
     """
     ✅ Client: lecture des montants + statut avant paiement
@@ -849,23 +1146,29 @@ class BookingValidateKeySerializer(serializers.Serializer):
 
     def validate(self, attrs):
         request = self.context["request"]
-        code = attrs["code"]
+        owner_id = request.user.id
+
+        # ✅ anti brute-force: gérant bloqué après trop d'échecs
+        wait = key_codes.locked_for(owner_id)
+        if wait:
+            raise Throttled(wait=wait, detail="Trop d'essais. Réessayez plus tard.")
 
-        # ✅ on cherche booking où status=paid et code_hash rempli
-        # IMPORTANT: on ne peut pas filtrer par hash directement, on vérifie en python
-        target = Booking.objects.filter(
+        # ✅ 1 seule recherche indexée: hash(gérant + code) sur les bookings payés
+        # (le hash inclut le gérant: un code d'un autre gérant ne peut pas matcher)
+        target = booking_public_queryset().filter(
             status="paid",
-            listing__author_id=request.user.id,  # ✅ sécurité: le gérant ne valide que ses listings
-            key_code=code,
+            key_code_hash=key_codes.hash_key_code(owner_id, attrs["code"]),
         ).first()
 
-        if not target:
+        if not target or target.listing.author_id != owner_id:
+            key_codes.record_failure(owner_id)
             raise serializers.ValidationError("Code invalide.")
 
         # ✅ expiration
         if target.key_code_expires_at and target.key_code_expires_at < timezone.now():
             raise serializers.ValidationError("Code expiré.")
 
+        key_codes.reset_failures(owner_id)
         attrs["booking"] = target
         return attrs
 
@@ -873,14 +1176,17 @@ class BookingValidateKeySerializer(serializers.Serializer):
     def save(self):
         booking: Booking = self.validated_data["booking"]
 
-        # ✅ passage CHECKED_IN
-        booking.status = "checked_in"
-        booking.checked_in_at = timezone.now()
-
-        # ✅ calc payout (dépôt - commission)
-        booking.payout_amount = max(int(booking.deposit_amount) - int(booking.platform_commission), 0)
-
-        booking.save()
+        # ✅ passage CHECKED_IN (compare-and-set sur "paid": un code ne sert qu'une fois)
+        won = transition(
+            booking,
+            "checked_in",
+            checked_in_at=timezone.now(),
+            key_code_encrypted=None,  # ✅ code consommé: plus rien à relire
+            # ✅ calc payout (dépôt - commission)
+            payout_amount=max(int(booking.deposit_amount) - int(booking.platform_commission), 0),
+        )
+        if not won:
+            raise serializers.ValidationError("Code déjà utilisé.")
         return booking
 
 
@@ -971,10 +1277,40 @@ class PushSubscriptionSerializer(serializers.ModelSerializer):
 class PaymentTransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = PaymentTransaction
-        fields = ["id", "provider", "reference", "status", "amount", "raw", "created_at", "updated_at"]
+        fields = [
+            "id", "provider", "reference", "status", "amount", "paystack_status", "gateway_response",
+            "authorization_url", "authorization_expires_at", "created_at", "updated_at",
+        ]
         read_only_fields = fields
 
 
+class ExternalCalendarSerializer(serializers.ModelSerializer):
+    """
+    ✅ Calendrier .ics externe (Airbnb, Booking.com...) d'une résidence du gérant
+    """
+    blocks_count = serializers.IntegerField(read_only=True, default=0)
+
+    class Meta:
+        model = ExternalCalendar
+        fields = [
+            "id", "listing", "name", "url", "is_active",
+            "last_fetched_at", "last_error", "blocks_count", "created_at",
+        ]
+        read_only_fields = ["id", "listing", "last_fetched_at", "last_error", "blocks_count", "created_at"]
+
+    def validate_url(self, value):
+        from .ical import UnsafeCalendarURL, validate_calendar_url  # ✅ import local: ical importe models
+
+        try:
+            validate_calendar_url(value)
+        except UnsafeCalendarURL:
+            raise serializers.ValidationError("URL https publique attendue.")
+        listing = self.context.get("listing")
+        if listing and ExternalCalendar.objects.filter(listing=listing, url=value).exists():
+            raise serializers.ValidationError("Ce calendrier est déjà ajouté.")
+        return value
+
+
 # ✅ ADD at bottom of listings/serializers.py
 
 from userauths.models import Profile  # ✅ NEW
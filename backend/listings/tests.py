@@ -1,3 +1,1614 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import (
+    AsyncClient, LiveServerTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from py_vapid import Vapid
+from pywebpush import WebPushException
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import (
+    Booking, DailyBookingRollup, ExternalCalendar, IdempotencyKey, Listing, NotificationOutbox, PaymentTransaction,
+    PaystackWebhookEvent, PushMetricBucket, PushSubscription,
+)
+from . import (
+    events, expiry, fake_paystack, geocode, ical, idempotency, key_codes, loadtest, notifications, paystack_inbox,
+    push, push_metrics, reconciliation, serializers, workers,
+)
+
+User = get_user_model()
+
+
+# =========================================================
+# ✅ Helpers (données minimales, dates dans le futur)
+# =========================================================
+
+def make_user(name: str, **extra):
+    return User.objects.create_user(email=f"{name}@test.local", username=name, password="pw", **extra)
+
+
+def make_listing(owner, price: int = 10000):
+    return Listing.objects.create(author=owner, title=f"Résidence {owner.username}", price_per_night=price, max_guests=4)
+
+
+def make_booking(listing, guest, status: str = "requested", start=None, nights: int = 2, **fields):
+    if start:
+        fields.setdefault("desired_start_date", start)
+        if status != "requested":
+            fields.setdefault("start_date", start)
+            fields.setdefault("end_date", date.fromordinal(start.toordinal() + nights))
+    return Booking.objects.create(listing=listing, user=guest, status=status, duration_days=nights, **fields)
+
+
+def count_queries(fn) -> int:
+    with CaptureQueriesContext(connection) as ctx:
+        fn()
+    return len(ctx.captured_queries)
+
+
+def api(user=None) -> APIClient:
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+# =========================================================
+# ✅ Outbox push: bail, retries avec backoff, dead-letter
+# =========================================================
+
+def _delivered(failed: int = 0):
+    return SimpleNamespace(should_retry=bool(failed), failed=failed)
+
+
+@override_settings(PUSH_OUTBOX_LEASE_SECONDS=120, PUSH_OUTBOX_BACKOFF_BASE=30, PUSH_OUTBOX_MAX_ATTEMPTS=2)
+class PushOutboxTests(TestCase):
+    def setUp(self):
+        self.user = make_user("guest")
+
+    def _enqueue(self, n: int = 1):
+        return [notifications.enqueue_push(self.user, f"Titre {i}", "Corps") for i in range(n)]
+
+    def test_claim_leases_rows(self):
+        first, second = self._enqueue(2)
+
+        claimed = notifications.claim_batch(batch_size=1)
+
+        self.assertEqual([r.id for r in claimed], [first.id])
+        first.refresh_from_db()
+        self.assertEqual(first.attempts, 1)
+        self.assertGreater(first.available_at, timezone.now() + timedelta(seconds=100))
+        # ✅ ligne sous bail: pas reprise par le lot suivant
+        self.assertEqual([r.id for r in notifications.claim_batch(batch_size=5)], [second.id])
+        self.assertEqual(notifications.claim_batch(batch_size=5), [])
+
+    def test_row_reclaimed_after_lease_expiry_is_not_sent_twice(self):
+        row = self._enqueue()[0]
+        mine = notifications.claim_batch()[0]
+        # ✅ lot lent: le bail expire, un autre worker reprend la ligne
+        NotificationOutbox.objects.filter(id=row.id).update(available_at=timezone.now())
+        theirs = notifications.claim_batch()[0]
+
+        self.assertFalse(workers.renew_lease(mine, 120))
+        self.assertTrue(workers.renew_lease(theirs, 120))
+
+    def test_drain_sends_each_row_once(self):
+        self._enqueue(3)
+        with mock.patch("listings.notifications.deliver_push", return_value=_delivered()) as deliver:
+            counts = notifications.drain_outbox(batch_size=10)
+
+        self.assertEqual(counts["sent"], 3)
+        self.assertEqual(deliver.call_count, 3)
+        self.assertEqual(NotificationOutbox.objects.filter(status="sent").count(), 3)
+
+    def test_retry_with_backoff_then_dead_letter(self):
+        row = self._enqueue()[0]
+        with mock.patch("listings.notifications.deliver_push", return_value=_delivered(failed=1)):
+            self.assertEqual(notifications.drain_outbox(), {"sent": 0, "retry": 1, "dead": 0, "skipped": 0})
+            row.refresh_from_db()
+            self.assertEqual(row.status, "pending")
+            self.assertGreaterEqual(row.available_at, timezone.now() + timedelta(seconds=29))
+
+            NotificationOutbox.objects.filter(id=row.id).update(available_at=timezone.now())
+            self.assertEqual(notifications.drain_outbox()["dead"], 1)
+
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ("dead", 2))
+        self.assertIn("échec", row.last_error)
+
+    def test_push_worker_once(self):
+        self._enqueue(2)
+        with mock.patch("listings.notifications.deliver_push", return_value=_delivered()):
+            call_command("push_worker", "--once", stdout=io.StringIO())
+        self.assertEqual(NotificationOutbox.objects.filter(status="sent").count(), 2)
+
+
+# =========================================================
+# ✅ Digest des demandes de réservation (gérants très sollicités)
+# =========================================================
+
+@override_settings(PUSH_COALESCE_WINDOWS={"booking_request": 60})
+class NotificationCoalescingTests(TestCase):
+    def setUp(self):
+        self.owner = make_user("owner")
+
+    def _request(self, booking_id: int):
+        return notifications.enqueue_push(
+            self.owner, "Nouvelle demande de réservation", f"Demande {booking_id}",
+            data={"type": "booking_request", "booking_id": booking_id},
+            coalesce_window=notifications.coalesce_window_for("booking_request"),
+        )
+
+    def test_requests_in_the_window_become_one_digest(self):
+        before = timezone.now()
+        for booking_id in (11, 12, 12, 13):
+            self._request(booking_id)
+
+        row = NotificationOutbox.objects.get()
+        self.assertEqual(row.title, "Nouvelles demandes de réservation")
+        self.assertEqual(row.body, "Vous avez 4 nouvelles demandes de réservation.")
+        self.assertEqual((row.data["booking_ids"], row.data["count"]), ([11, 12, 13], 4))
+        self.assertGreaterEqual(row.available_at, before + timedelta(seconds=60))  # ✅ retenu pendant la fenêtre
+
+    def test_claimed_digest_is_closed(self):
+        first = self._request(11)
+        NotificationOutbox.objects.filter(id=first.id).update(attempts=1)  # ✅ réservé par le worker
+
+        second = self._request(12)
+
+        self.assertNotEqual(first.id, second.id)
+        self.assertEqual(second.data["booking_ids"], [12])
+
+    def test_other_types_are_not_coalesced(self):
+        self._request(11)
+        notifications.enqueue_push(
+            self.owner, "Paiement confirmé", "", data={"type": "booking_paid", "booking_id": 11},
+            coalesce_window=notifications.coalesce_window_for("booking_paid"),
+        )
+        self.assertEqual(NotificationOutbox.objects.count(), 2)
+        self.assertIsNone(NotificationOutbox.objects.get(data__type="booking_paid").coalesce_key)
+
+
+# =========================================================
+# ✅ Web push: fan-out concurrent sur les devices d'un user
+# =========================================================
+
+_PUSH_SIGNER = SimpleNamespace(headers_for=lambda aud: {"Authorization": f"vapid {aud}"})
+
+
+class WebPushFanOutTests(TestCase):
+    def setUp(self):
+        self.user = make_user("guest")
+        patcher = mock.patch("listings.push.get_vapid_signer", return_value=_PUSH_SIGNER)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _subscribe(self, n: int, host: str = "fcm.googleapis.com"):
+        return [
+            PushSubscription.objects.create(
+                user=self.user, endpoint=f"https://{host}/send/{host}-{i}", p256dh="p", auth="a",
+            )
+            for i in range(n)
+        ]
+
+    def test_devices_are_sent_in_parallel(self):
+        subs = self._subscribe(2) + self._subscribe(2, host="web.push.apple.com")
+
+        def slow_webpush(**kwargs):
+            time.sleep(0.3)
+            return SimpleNamespace(status_code=201)
+
+        started = time.monotonic()
+        with mock.patch("listings.push.webpush", side_effect=slow_webpush) as webpush:
+            result = push.deliver_push(self.user, "Titre", "Corps")
+        elapsed = time.monotonic() - started
+
+        self.assertEqual((result.sent, result.failed, result.removed), (4, 0, 0))
+        self.assertLess(elapsed, 0.6)  # ✅ 4 x 0,3 s en série = 1,2 s
+        # ✅ aud VAPID = host du push service de chaque device
+        auds = {c.kwargs["headers"]["Authorization"] for c in webpush.call_args_list}
+        self.assertEqual(auds, {"vapid https://fcm.googleapis.com", "vapid https://web.push.apple.com"})
+        self.assertFalse(PushSubscription.objects.filter(id__in=[s.id for s in subs], last_seen_at=None).exists())
+
+    def test_expired_devices_are_removed_and_failures_counted(self):
+        gone, broken, ok = self._subscribe(3)
+
+        def webpush(subscription_info, **kwargs):
+            endpoint = subscription_info["endpoint"]
+            if endpoint == gone.endpoint:
+                raise WebPushException("gone", response=SimpleNamespace(status_code=410, text=""))
+            if endpoint == broken.endpoint:
+                raise WebPushException("boom", response=SimpleNamespace(status_code=503, text="unavailable"))
+            return SimpleNamespace(status_code=201)
+
+        with mock.patch("listings.push.webpush", side_effect=webpush), self.assertLogs("push", "WARNING"):
+            result = push.deliver_push(self.user, "Titre", "Corps")
+
+        self.assertEqual((result.sent, result.removed, result.failed), (1, 1, 1))
+        self.assertFalse(result.should_retry)
+        self.assertEqual(
+            set(PushSubscription.objects.values_list("id", flat=True)), {broken.id, ok.id},
+        )
+
+    def test_nothing_sent_is_retried(self):
+        self._subscribe(2)
+        with mock.patch("listings.push.webpush", side_effect=requests.ConnectionError("down")), \
+                self.assertLogs("push", "ERROR"):
+            result = push.deliver_push(self.user, "Titre", "Corps")
+        self.assertEqual((result.sent, result.failed), (0, 2))
+        self.assertTrue(result.should_retry)
+
+
+class VapidSignerTests(TestCase):
+    FCM, APPLE = "https://fcm.googleapis.com", "https://web.push.apple.com"
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.pem = os.path.join(tmp.name, "vapid.pem")
+        key = Vapid()
+        key.generate_keys()
+        key.save_key(self.pem)
+        self.addCleanup(setattr, push, "_SIGNER", None)
+
+    def test_pem_is_loaded_once_per_process(self):
+        with override_settings(VAPID_PRIVATE_KEY_PATH=self.pem, VAPID_CLAIMS={"sub": "mailto:ops@test.local"}):
+            with mock.patch("listings.push.Vapid.from_file", wraps=Vapid.from_file) as from_file:
+                first, second = push.get_vapid_signer(), push.get_vapid_signer()
+        self.assertIs(first, second)
+        self.assertEqual(from_file.call_count, 1)
+
+        with override_settings(VAPID_PRIVATE_KEY_PATH=""):
+            self.assertIsNone(push.get_vapid_signer())
+
+    def test_jwt_is_reused_per_audience_until_close_to_exp(self):
+        signer = push.VapidSigner(self.pem, "mailto:ops@test.local", ttl=3600, refresh_margin=300)
+        now = time.time()
+        with mock.patch.object(signer._vapid, "sign", wraps=signer._vapid.sign) as sign, \
+                mock.patch("listings.push.time.time", return_value=now):
+            fcm = signer.headers_for(self.FCM)
+            fcm["Authorization"] = "altéré"  # ✅ copie: le cache n'est pas modifiable par l'appelant
+            self.assertNotEqual(signer.headers_for(self.FCM)["Authorization"], "altéré")
+            signer.headers_for(self.APPLE)
+            self.assertEqual(sign.call_count, 2)  # ✅ 1 signature par aud
+
+        with mock.patch.object(signer._vapid, "sign", wraps=signer._vapid.sign) as sign:
+            with mock.patch("listings.push.time.time", return_value=now + 3600 - 301):
+                signer.headers_for(self.FCM)
+            self.assertEqual(sign.call_count, 0)
+            with mock.patch("listings.push.time.time", return_value=now + 3600 - 299):
+                signer.headers_for(self.FCM)  # ✅ dans la marge: re-signé
+            self.assertEqual(sign.call_count, 1)
+
+
+class PushMetricsTests(TestCase):
+    def setUp(self):
+        push_metrics._PENDING.clear()
+        self.addCleanup(push_metrics._PENDING.clear)
+
+    def test_flush_accumulates_into_one_hourly_bucket(self):
+        push_metrics.record("fcm", "sent", 80)
+        push_metrics.record("fcm", "sent", 300)
+        push_metrics.flush()
+        push_metrics.record("fcm", "failed", 3000)
+        push_metrics.record("apple", "expired", 120)
+        push_metrics.flush()
+
+        fcm = PushMetricBucket.objects.get(service="fcm")
+        self.assertEqual(
+            (fcm.sent, fcm.failed, fcm.le_100, fcm.le_500, fcm.le_inf, fcm.duration_ms_sum), (2, 1, 1, 1, 1, 3380),
+        )
+        self.assertEqual(PushMetricBucket.objects.count(), 2)
+
+        r = api(make_user("admin", is_staff=True)).get("/api/v1/admin/push/metrics/?hours=1")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(
+            {k: r.data["services"]["fcm"][k] for k in ("sent", "failed", "p50_ms_le", "p95_ms_le")},
+            {"sent": 2, "failed": 1, "p50_ms_le": 500, "p95_ms_le": None},  # ✅ None = au-delà de 2500 ms
+        )
+        self.assertEqual(r.data["services"]["apple"]["expired"], 1)
+
+    @override_settings(PUSH_LOG_SAMPLE_RATE=0)
+    def test_successes_are_sampled_failures_always_logged(self):
+        with self.assertNoLogs("push", "INFO"):
+            push_metrics.log_send({"outcome": "sent", "sub": 1})
+        with self.assertLogs("push", "ERROR") as logs:
+            push_metrics.log_send({"outcome": "failed", "sub": 2, "status": 503})
+        self.assertEqual(json.loads(logs.records[0].getMessage().split(" ", 1)[1])["status"], 503)
+
+
+# =========================================================
+# ✅ Transitions de statut = compare-and-set (booking_state.transition)
+# =========================================================
+
+class BookingTransitionTests(TestCase):
+    def setUp(self):
+        self.booking = make_booking(
+            make_listing(make_user("owner")), make_user("guest"), status="awaiting_payment",
+            start=date(2027, 10, 1), deposit_amount=10000,
+        )
+
+    def _load(self):
+        return Booking.objects.select_related("listing").get(id=self.booking.id)
+
+    def test_stale_from_loses_the_compare_and_set(self):
+        from .booking_state import transition
+        from .models import BookingEvent, ListingOccupancy
+
+        fresh, stale = self._load(), self._load()
+        self.assertTrue(transition(fresh, "cancelled"))
+        events_after_cancel = BookingEvent.objects.count()
+        version = ListingOccupancy.objects.get(listing_id=self.booking.listing_id).version
+
+        # ✅ l'instance croit encore "awaiting_payment": l'UPDATE ... WHERE status IN (...) ne touche rien
+        self.assertFalse(transition(stale, "paid", key_code_hash="x"))
+
+        self.assertEqual(stale.status, "awaiting_payment")
+        self.assertEqual(
+            Booking.objects.values_list("status", "key_code_hash").get(id=self.booking.id), ("cancelled", None),
+        )
+        self.assertEqual(BookingEvent.objects.count(), events_after_cancel)  # ✅ pas d'effet de bord
+        self.assertEqual(ListingOccupancy.objects.get(listing_id=self.booking.listing_id).version, version)
+
+    def test_explicit_stale_from_statuses_fail(self):
+        from .booking_state import transition
+
+        # ✅ override support: "depuis le statut que j'ai lu" -> refusé si quelqu'un est passé avant
+        self.assertFalse(transition(self._load(), "checked_in", from_statuses=["paid"]))
+        self.assertEqual(self._load().status, "awaiting_payment")
+
+    def test_verify_and_webhook_confirm_once(self):
+        from .views import confirm_booking_payment
+
+        first, second = self._load(), self._load()
+        self.assertEqual(confirm_booking_payment(first), "paid")
+        self.assertEqual(confirm_booking_payment(second), "already_paid")
+        self.assertEqual(NotificationOutbox.objects.filter(data__type="booking_paid").count(), 1)
+
+    def test_approved_booking_is_payable(self):
+        from .views import confirm_booking_payment
+
+        Booking.objects.filter(id=self.booking.id).update(status="approved")
+        self.assertEqual(confirm_booking_payment(self._load()), "paid")
+        self.assertEqual(self._load().status, "paid")
+
+
+# =========================================================
+# ✅ Décisions gérant en lot (bookings/decisions/bulk/)
+# =========================================================
+
+class BulkDecisionTests(TestCase):
+    def setUp(self):
+        self.owner = make_user("owner")
+        self.guest = make_user("guest")
+        self.listing = make_listing(self.owner)
+
+    def test_paid_booking_in_batch_keeps_its_dates(self):
+        # ✅ le booking payé est dans le lot (refusé: plus en attente) mais ses dates restent prises
+        paid = make_booking(self.listing, self.guest, status="paid", start=date(2027, 6, 10), nights=3)
+        overlapping = make_booking(self.listing, make_user("other"), start=date(2027, 6, 11), nights=2)
+
+        r = api(self.owner).post(
+            "/api/v1/bookings/decisions/bulk/",
+            {"decisions": [
+                {"booking_id": paid.id, "action": "approve"},
+                {"booking_id": overlapping.id, "action": "approve"},
+            ]},
+            format="json",
+        )
+
+        self.assertEqual(r.status_code, 200, r.data)
+        overlapping.refresh_from_db()
+        self.assertEqual(overlapping.status, "requested")
+        paid.refresh_from_db()
+        self.assertEqual(paid.status, "paid")
+
+
+# =========================================================
+# ✅ Approbations concurrentes (bookings/<id>/decision/): 1 seule gagne sur des dates qui se chevauchent
+# =========================================================
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentApprovalTests(TransactionTestCase):
+    THREADS = 2
+
+    def setUp(self):
+        self.owner = make_user("owner")
+        self.listing = make_listing(self.owner)
+        self.bookings = [
+            make_booking(self.listing, make_user(f"guest{i}"), start=date(2027, 6, 10 + i), nights=3)
+            for i in range(self.THREADS)
+        ]
+
+    def _approve(self, booking, barrier, results):
+        try:
+            barrier.wait(timeout=10)
+            r = api(self.owner).post(
+                f"/api/v1/bookings/{booking.id}/decision/",
+                {"action": "approve", "start_date": str(booking.desired_start_date)},
+                format="json",
+            )
+            results[booking.id] = r.status_code
+        finally:
+            connections.close_all()  # ✅ 1 connexion par thread: à fermer sinon la base de test reste ouverte
+
+    def test_only_one_overlapping_approval_wins(self):
+        barrier, results = threading.Barrier(self.THREADS), {}
+        threads = [threading.Thread(target=self._approve, args=(b, barrier, results)) for b in self.bookings]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(sorted(results.values()), [200, 400], results)
+        statuses = sorted(Booking.objects.filter(listing=self.listing).values_list("status", flat=True))
+        self.assertEqual(statuses, ["awaiting_payment", "requested"])
+
+
+# =========================================================
+# ✅ Calendrier de disponibilité (listings/<id>/availability/): ETag / 304, index suivi par les écritures
+# =========================================================
+
+class ListingAvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user("owner")
+        self.listing = make_listing(self.owner)
+        self.booking = make_booking(self.listing, make_user("guest"), start=date(2027, 7, 10), nights=3)
+        self.url = f"/api/v1/listings/{self.listing.id}/availability/?from=2027-07-01&to=2027-08-01"
+
+    def _get(self, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return api().get(self.url, **headers)
+
+    @staticmethod
+    def _booked(r):
+        return [n["date"] for n in r.data["nights"] if n["status"] == "booked"]
+
+    def _approve(self):
+        r = api(self.owner).post(
+            f"/api/v1/bookings/{self.booking.id}/decision/",
+            {"action": "approve", "start_date": "2027-07-10"},
+            format="json",
+        )
+        self.assertEqual(r.status_code, 200, r.data)
+        self.booking.refresh_from_db()
+
+    def test_unchanged_calendar_returns_304(self):
+        first = self._get()
+        self.assertEqual((first.status_code, self._booked(first)), (200, []))
+        self.assertEqual(self._get(first["ETag"]).status_code, 304)
+
+    def test_approve_then_cancel_update_the_index(self):
+        from .booking_state import transition
+
+        before = self._get()["ETag"]
+        self._approve()
+
+        approved = self._get(before)
+        self.assertEqual(approved.status_code, 200)
+        self.assertEqual(self._booked(approved), ["2027-07-10", "2027-07-11", "2027-07-12"])
+
+        self.assertTrue(transition(self.booking, "cancelled"))
+        cancelled = self._get(approved["ETag"])
+        self.assertEqual((cancelled.status_code, self._booked(cancelled)), (200, []))
+
+    def test_expiry_sweep_frees_the_dates(self):
+        from . import expiry
+
+        self._approve()
+        etag = self._get()["ETag"]
+        Booking.objects.filter(id=self.booking.id).update(approved_at=timezone.now() - timedelta(days=3))
+
+        self.assertEqual(expiry.sweep()["awaiting_payment"], 1)
+
+        r = self._get(etag)
+        self.assertEqual((r.status_code, self._booked(r)), (200, []))
+
+    def test_get_never_builds_the_index(self):
+        from .booking_state import transition
+        from .models import ListingOccupancy
+
+        self._approve()
+        ListingOccupancy.objects.filter(listing=self.listing).delete()  # ✅ résidence sans index
+        self.listing.occupancy_months.all().delete()
+
+        r = self._get()
+        self.assertEqual(self._booked(r), ["2027-07-10", "2027-07-11", "2027-07-12"])  # ✅ calcul direct
+        self.assertEqual(r.data["version"], 0)
+        self.assertFalse(ListingOccupancy.objects.filter(listing=self.listing).exists())
+
+        # ✅ 1ère écriture: l'index est construit, l'ETag change
+        self.assertTrue(transition(self.booking, "cancelled"))
+        after = self._get(r["ETag"])
+        self.assertEqual((after.status_code, self._booked(after)), (200, []))
+        self.assertGreaterEqual(after.data["version"], 1)
+
+
+# =========================================================
+# ✅ Sweeper d'expiration: demandes sans réponse, paiements non faits, codes clés
+# =========================================================
+
+class BookingExpiryTests(TestCase):
+    def setUp(self):
+        self.owner, self.guest = make_user("owner"), make_user("guest")
+        self.listing = make_listing(self.owner)
+        self.now = timezone.now()
+
+    def _booking(self, status_name: str, day: int, age_hours: float = 0, **fields):
+        booking = make_booking(self.listing, self.guest, status=status_name, start=date(2027, 11, day), **fields)
+        aged = self.now - timedelta(hours=age_hours)
+        Booking.objects.filter(id=booking.id).update(created_at=aged, approved_at=aged)
+        return booking.id
+
+    def _status(self, booking_id):
+        return Booking.objects.values_list("status", flat=True).get(id=booking_id)
+
+    def test_sweep_applies_each_ttl(self):
+        stale_request = self._booking("requested", 1, age_hours=73)
+        fresh_request = self._booking("requested", 1, age_hours=1)
+        unpaid = self._booking("awaiting_payment", 4, age_hours=49)
+        paying = self._booking("awaiting_payment", 8, age_hours=49)
+        PaymentTransaction.objects.create(
+            booking_id=paying, provider="paystack", reference="pay_live", amount=1000, status="initiated",
+            authorization_url="https://checkout.paystack.com/x", authorization_expires_at=self.now + timedelta(minutes=5),
+        )
+        paid = self._booking(
+            "paid", 12, key_code_hash="h", key_code_encrypted="e", key_code_expires_at=self.now - timedelta(minutes=1),
+        )
+
+        counts = expiry.sweep(self.now)
+
+        self.assertEqual((counts["requested"], counts["awaiting_payment"], counts["key_codes"]), (1, 1, 1))
+        self.assertEqual(
+            [self._status(i) for i in (stale_request, fresh_request, unpaid, paying, paid)],
+            ["expired", "requested", "expired", "awaiting_payment", "paid"],  # ✅ page Paystack ouverte: on attend
+        )
+        self.assertEqual(
+            Booking.objects.values_list("key_code_hash", "key_code_encrypted").get(id=paid), (None, None),
+        )
+        # ✅ demande expirée: client + gérant prévenus; paiement expiré: client
+        self.assertEqual(NotificationOutbox.objects.filter(data__type="booking_expired").count(), 3)
+
+    @override_settings(BOOKING_EXPIRY_BATCH_SIZE=2)
+    def test_sweep_runs_in_batches(self):
+        ids = [self._booking("requested", 1 + i, age_hours=80) for i in range(5)]
+        with mock.patch("listings.expiry._expire_batch", wraps=expiry._expire_batch) as batch:
+            counts = expiry.sweep(self.now)
+        self.assertEqual(counts["requested"], 5)
+        self.assertEqual({self._status(i) for i in ids}, {"expired"})
+        requested_batches = [c for c in batch.call_args_list if c.args[0] == "requested"]
+        self.assertEqual(len(requested_batches), 3)  # ✅ 2 + 2 + 1
+
+    def test_late_payment_revives_or_requires_a_refund(self):
+        from .models import Dispute
+        from .views import confirm_booking_payment
+
+        revived = self._booking("expired", 1, deposit_amount=1000)
+        self.assertEqual(confirm_booking_payment(Booking.objects.get(id=revived)), "paid")
+
+        taken = self._booking("expired", 20, deposit_amount=1000)
+        self._booking("paid", 20)  # ✅ dates reprises entre-temps
+        with self.assertLogs("push", "WARNING"):
+            self.assertEqual(confirm_booking_payment(Booking.objects.get(id=taken)), "refund_required")
+        self.assertEqual(self._status(taken), "expired")
+        self.assertTrue(Dispute.objects.filter(booking_id=taken, category="late_payment_refund").exists())
+
+
+# =========================================================
+# ✅ Géocodage async (utils/reverse-geocode/, utils/search-places/)
+# =========================================================
+
+class AsyncGeocodeViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        geocode._REVERSE_CACHE.clear()
+        self.sessions = []
+
+    def _fake_get_json(self, payload):
+        async def get_json(session, url, params, headers, timeout):
+            self.sessions.append(session)
+            return payload
+        return get_json
+
+    def test_reverse_geocode_closes_its_session_under_wsgi(self):
+        nominatim = {"display_name": "Rue 12, Cocody, Abidjan", "address": {"city": "Abidjan", "suburb": "Cocody"}}
+        with mock.patch("listings.geocode._get_json", self._fake_get_json(nominatim)):
+            r = self.client.post(
+                "/api/v1/utils/reverse-geocode/", {"latitude": 5.35, "longitude": -4.0}, content_type="application/json",
+            )
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["area"], "Cocody")
+        # ✅ loop éphémère (async_to_sync): session fermée, rien de partagé qui fuirait
+        self.assertTrue(self.sessions[0].closed)
+        self.assertEqual(len(geocode._SESSIONS), 0)
+
+    def test_search_places(self):
+        nominatim = [{"display_name": "Plateau, Abidjan", "lat": "5.32", "lon": "-4.02", "address": {"city": "Abidjan"}}]
+        with mock.patch("listings.geocode._get_json", self._fake_get_json(nominatim)):
+            r = self.client.get("/api/v1/utils/search-places/", {"q": "plateau"})
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["results"][0]["area"], "Plateau")
+        self.assertTrue(self.sessions[0].closed)
+
+
+class GeocodeLoadTests(TestCase):
+    """
+    ✅ Charge: des géocodages lents (Nominatim à 0,5 s) ne bloquent plus le worker ASGI
+    20 appels simultanés se chevauchent sur le même event loop, et une requête sans rapport
+    (liste des résidences) répond pendant qu'ils attendent
+    """
+    SLOW_SECONDS = 0.5
+    CONCURRENT = 20
+
+    def setUp(self):
+        cache.clear()
+        geocode._REVERSE_CACHE.clear()
+        make_listing(make_user("owner"))
+
+    async def _slow_get_json(self, session, url, params, headers, timeout):
+        await asyncio.sleep(self.SLOW_SECONDS)
+        return {"display_name": "Cocody, Abidjan", "address": {"city": "Abidjan"}}
+
+    async def _storm(self, client, loop):
+        started = loop.time()
+        slow = [
+            asyncio.create_task(client.post(
+                "/api/v1/utils/reverse-geocode/",
+                {"latitude": 5.30 + i / 1000, "longitude": -4.0},  # ✅ coords distinctes: pas de cache
+                content_type="application/json",
+            ))
+            for i in range(self.CONCURRENT)
+        ]
+        await asyncio.sleep(0.05)
+
+        other_started = loop.time()
+        other = await client.get("/api/v1/listings/")
+        other_seconds = loop.time() - other_started
+
+        responses = await asyncio.gather(*slow)
+        total_seconds = loop.time() - started
+        return responses, other, other_seconds, total_seconds
+
+    async def test_slow_geocodes_do_not_starve_the_worker(self):
+        client = AsyncClient()
+        loop = asyncio.get_running_loop()
+        with mock.patch("listings.geocode._get_json", self._slow_get_json):
+            try:
+                responses, other, other_seconds, total_seconds = await self._storm(client, loop)
+            finally:
+                for session in list(geocode._SESSIONS.values()):
+                    await session.close()
+
+        self.assertEqual([r.status_code for r in responses], [200] * self.CONCURRENT)
+        self.assertEqual(other.status_code, 200)
+        # ✅ la requête sans rapport n'attend pas la fin des géocodages
+        self.assertLess(other_seconds, self.SLOW_SECONDS)
+        # ✅ en série: 20 x 0,5 s = 10 s; en parallèle sur le loop: ~0,5 s
+        self.assertLess(total_seconds, self.CONCURRENT * self.SLOW_SECONDS / 4)
+
+
+# =========================================================
+# ✅ Flux SSE (bookings/events/stream/): jeton de flux, ASGI uniquement, table relue sur marqueur
+# =========================================================
+
+@override_settings(BOOKING_EVENTS_POLL_SECONDS=0.05, BOOKING_EVENTS_STREAM_MAX_SECONDS=0.6)
+class BookingEventStreamTests(TestCase):
+    URL = "/api/v1/bookings/events/stream/"
+
+    def setUp(self):
+        cache.clear()
+        self.guest = make_user("guest")
+        self.booking = make_booking(make_listing(make_user("owner")), self.guest, start=date(2027, 4, 2))
+        events.record(self.booking)
+
+        r = api(self.guest).post("/api/v1/bookings/events/stream-token/")
+        self.assertEqual(r.status_code, 200, r.data)
+        self.token = r.data["token"]
+
+    async def _read(self, query: str, on_first_event=None) -> str:
+        r = await self.async_client.get(f"{self.URL}?{query}", headers={"Last-Event-ID": "0"})
+        if r.status_code != 200:
+            return r.status_code
+        body = ""
+        async for chunk in r.streaming_content:
+            body += chunk.decode("utf-8")
+            if on_first_event and "event: booking" in body:
+                await on_first_event()
+                on_first_event = None
+        return body
+
+    def test_wsgi_is_refused(self):
+        access = str(AccessToken.for_user(self.guest))
+        r = self.client.get(self.URL, HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.assertEqual(r.status_code, 501)
+
+    async def test_access_jwt_in_the_url_is_refused(self):
+        access = str(AccessToken.for_user(self.guest))
+        self.assertEqual(await self._read(f"token={access}"), 401)
+
+    async def test_expired_stream_token_is_refused(self):
+        with override_settings(BOOKING_EVENTS_STREAM_TOKEN_SECONDS=0):
+            await asyncio.sleep(1.1)
+            self.assertEqual(await self._read(f"token={self.token}"), 401)
+
+    async def test_table_is_read_again_only_when_the_marker_moves(self):
+        async def approve_meanwhile():
+            def write():
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.booking.status = "awaiting_payment"
+                    events.record(self.booking)
+            await sync_to_async(write)()
+
+        with mock.patch("listings.views.booking_events.since", wraps=events.since) as since:
+            body = await self._read(f"token={self.token}", on_first_event=approve_meanwhile)
+
+        self.assertEqual(body.count("event: booking"), 2)
+        self.assertIn('"status": "awaiting_payment"', body)
+        # ✅ ~12 tours de boucle: 1 lecture initiale + 1 après le commit, pas une par tour
+        self.assertEqual(since.call_count, 2)
+
+
+# =========================================================
+# ✅ Idempotency-Key: une clé in_progress orpheline (process tué) est reprise après son bail
+# =========================================================
+
+class IdempotencyLeaseTests(TestCase):
+    def setUp(self):
+        self.owner = make_user("owner")
+        self.booking = make_booking(make_listing(self.owner), make_user("guest"), start=date(2027, 5, 3))
+        self.url = f"/api/v1/bookings/{self.booking.id}/decision/"
+        self.body = {"action": "approve", "start_date": "2027-05-03"}
+
+    def _in_progress_key(self, locked_until):
+        request = SimpleNamespace(method="POST", path=self.url, data=self.body)
+        return IdempotencyKey.objects.create(
+            user=self.owner,
+            scope=f"POST {self.url}",
+            key="k1",
+            fingerprint=idempotency._fingerprint(request),
+            locked_until=locked_until,
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+
+    def _post(self):
+        return api(self.owner).post(self.url, self.body, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+
+    def test_live_lease_still_conflicts(self):
+        self._in_progress_key(timezone.now() + timedelta(seconds=30))
+        self.assertEqual(self._post().status_code, 409)
+
+    def test_expired_lease_is_taken_over(self):
+        row = self._in_progress_key(timezone.now() - timedelta(seconds=1))
+
+        r = self._post()
+
+        self.assertEqual(r.status_code, 200, r.data)
+        self.assertEqual(r.data["status"], "awaiting_payment")
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.response_status), ("done", 200))
+        self.assertEqual(self._post()["Idempotent-Replayed"], "true")
+
+
+    def test_4xx_is_not_frozen(self):
+        # ✅ initialize Paystack en échec (400) puis renvoi avec la même clé: la vue est ré-exécutée
+        guest = make_user("payer")
+        booking = make_booking(
+            make_listing(make_user("host")), guest, status="awaiting_payment",
+            start=date(2027, 5, 20), amount_to_pay=12000,
+        )
+        url = f"/api/v1/bookings/{booking.id}/paystack/initialize/"
+        page = {"data": {"authorization_url": "https://checkout.paystack.com/abc"}}
+
+        with mock.patch("listings.views.paystack_initialize", side_effect=requests.Timeout("slow")):
+            failed = api(guest).post(url, {}, format="json", HTTP_IDEMPOTENCY_KEY="pay-1")
+        with mock.patch("listings.views.paystack_initialize", return_value=page):
+            retried = api(guest).post(url, {}, format="json", HTTP_IDEMPOTENCY_KEY="pay-1")
+
+        self.assertEqual((failed.status_code, retried.status_code), (400, 200))
+        self.assertNotIn("Idempotent-Replayed", retried)
+        self.assertEqual(retried.data["authorization_url"], page["data"]["authorization_url"])
+
+
+@skipUnlessDBFeature("has_select_for_update")
+@override_settings(IDEMPOTENCY_LOCK_SECONDS=3)
+class IdempotencyLeaseRenewalTests(TransactionTestCase):
+    def test_lease_is_renewed_while_the_view_runs(self):
+        owner = make_user("owner")
+        booking = make_booking(make_listing(owner), make_user("guest"), start=date(2027, 5, 3))
+        url = f"/api/v1/bookings/{booking.id}/decision/"
+        body = {"action": "approve", "start_date": "2027-05-03"}
+        seen = {}
+
+        def slow_push(*args, **kwargs):
+            # ✅ handler plus long que le bail (3 s): la clé doit rester à nous
+            started = timezone.now()
+            time.sleep(4)
+            seen["locked_until"] = IdempotencyKey.objects.values_list("locked_until", flat=True).get()
+            seen["lease_expired_at"] = started + timedelta(seconds=3)
+            fingerprint = idempotency._fingerprint(SimpleNamespace(method="POST", path=url, data=body))
+            seen["claim"] = idempotency._claim(owner, f"POST {url}", "k1", fingerprint)
+
+        with mock.patch("listings.views.enqueue_push", side_effect=slow_push):
+            r = api(owner).post(url, body, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+
+        self.assertEqual(r.status_code, 200, r.data)
+        self.assertGreater(seen["locked_until"], seen["lease_expired_at"])
+        self.assertIsNone(seen["claim"][0])  # ✅ pas de reprise par un renvoi concurrent
+        self.assertEqual(IdempotencyKey.objects.get().status, "done")
+
+
+# =========================================================
+# ✅ Calendriers externes: URL gérant = entrée non fiable (anti-SSRF)
+# =========================================================
+
+def _fake_dns(mapping):
+    def getaddrinfo(host, port, *args, **kwargs):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (mapping[host], port))]
+    return getaddrinfo
+
+
+class ExternalCalendarURLTests(TestCase):
+    def setUp(self):
+        self.owner = make_user("owner")
+        self.listing = make_listing(self.owner)
+        self.url = f"/api/v1/owners/me/listings/{self.listing.id}/external-calendars/"
+
+    def test_rejects_http_and_internal_addresses(self):
+        dns = {"cal.example.com": "93.184.216.34", "internal.example.com": "10.0.0.5", "meta.example.com": "169.254.169.254"}
+        with mock.patch("listings.ical.socket.getaddrinfo", _fake_dns(dns)):
+            for url in ("http://cal.example.com/a.ics", "https://internal.example.com/a.ics", "https://meta.example.com/"):
+                with self.assertRaises(ical.UnsafeCalendarURL, msg=url):
+                    ical.validate_calendar_url(url)
+            ical.validate_calendar_url("https://cal.example.com/a.ics")
+
+    def test_create_does_not_fetch_inline(self):
+        dns = {"cal.example.com": "93.184.216.34"}
+        with mock.patch("listings.ical.socket.getaddrinfo", _fake_dns(dns)), \
+                mock.patch("listings.ical.fetch_calendar") as fetch:
+            r = api(self.owner).post(self.url, {"name": "Airbnb", "url": "https://cal.example.com/a.ics"}, format="json")
+
+        self.assertEqual(r.status_code, 201, r.data)
+        fetch.assert_not_called()
+        self.assertIsNone(ExternalCalendar.objects.get().last_fetched_at)  # ✅ en file pour import_calendars
+
+
+def _http_response(status_code: int, headers=None, body: bytes = b""):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response.raw = io.BytesIO(body)
+    response.encoding = "utf-8"
+    return response
+
+
+class CalendarFetchTests(TestCase):
+    ICS = b"BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n"
+
+    def setUp(self):
+        self.sent = []
+
+    def _send(self, responses):
+        # ✅ remplace l'envoi réseau: note l'IP de connexion et le Host de chaque requête
+        def send(adapter, request, **kwargs):
+            self.sent.append((adapter.address, request.url, request.headers["Host"]))
+            response = responses.pop(0)
+            response.request, response.url = request, request.url
+            return response
+        return mock.patch.object(ical._PinnedAdapter, "send", autospec=True, side_effect=send)
+
+    def test_refuses_private_and_loopback_targets(self):
+        dns = {"loop.example.com": "127.0.0.1", "lan.example.com": "192.168.1.20", "v6.example.com": "::1"}
+        with mock.patch("listings.ical.socket.getaddrinfo", _fake_dns(dns)), self._send([]):
+            for host in dns:
+                with self.assertRaises(ical.UnsafeCalendarURL, msg=host):
+                    ical.fetch_calendar(f"https://{host}/a.ics", {})
+        self.assertEqual(self.sent, [])
+
+    def test_redirect_target_is_checked_again(self):
+        dns = {"cal.example.com": "93.184.216.34", "internal.example.com": "10.0.0.5"}
+        redirect = _http_response(302, {"Location": "https://internal.example.com/a.ics"})
+        with mock.patch("listings.ical.socket.getaddrinfo", _fake_dns(dns)), self._send([redirect]):
+            with self.assertRaises(ical.UnsafeCalendarURL):
+                ical.fetch_calendar("https://cal.example.com/a.ics", {})
+        self.assertEqual(len(self.sent), 1)  # ✅ la cible interne n'est jamais contactée
+
+    def test_connects_to_the_validated_address(self):
+        # ✅ DNS rebinding: 1re résolution publique, la suivante pointerait vers la machine elle-même
+        answers = iter(["93.184.216.34", "127.0.0.1"])
+
+        def rebinding_dns(host, port, *args, **kwargs):
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (next(answers), port))]
+
+        with mock.patch("listings.ical.socket.getaddrinfo", side_effect=rebinding_dns), \
+                self._send([_http_response(200, body=self.ICS)]):
+            status_code, _headers, text = ical.fetch_calendar("https://cal.example.com/a.ics", {})
+
+        self.assertEqual(status_code, 200)
+        self.assertIn("BEGIN:VCALENDAR", text)
+        self.assertEqual(self.sent, [("93.184.216.34", "https://cal.example.com/a.ics", "cal.example.com")])
+
+    def test_pool_uses_pinned_ip_with_hostname_for_tls(self):
+        adapter = ical._PinnedAdapter("cal.example.com", "93.184.216.34")
+        request = requests.Request("GET", "https://cal.example.com/a.ics").prepare()
+
+        host_params, pool_kwargs = adapter.build_connection_pool_key_attributes(request, True)
+
+        self.assertEqual(host_params["host"], "93.184.216.34")
+        self.assertEqual(pool_kwargs["server_hostname"], "cal.example.com")
+        self.assertEqual(pool_kwargs["assert_hostname"], "cal.example.com")
+
+
+# =========================================================
+# ✅ Bouton "Payer" (paystack/initialize/): réutilisation, clic concurrent, plafond
+# =========================================================
+
+class PaystackInitializeTests(TestCase):
+    PAGE = {"status": True, "data": {"authorization_url": "https://checkout.paystack.com/abc"}}
+
+    def setUp(self):
+        self.guest = make_user("guest")
+        self.booking = make_booking(
+            make_listing(make_user("owner")), self.guest, status="awaiting_payment",
+            start=date(2027, 3, 5), amount_to_pay=12000,
+        )
+        self.url = f"/api/v1/bookings/{self.booking.id}/paystack/initialize/"
+
+    def _pay(self):
+        with mock.patch("listings.views.paystack_initialize", return_value=self.PAGE) as init:
+            r = api(self.guest).post(self.url, {}, format="json")
+        return r, init.call_count
+
+    def _attempts(self, n: int, **fields):
+        for i in range(n):
+            PaymentTransaction.objects.create(
+                booking=self.booking, provider="paystack", reference=f"old-{fields.get('status')}-{i}",
+                amount=12000, **fields,
+            )
+
+    def test_second_click_reuses_the_open_page(self):
+        first, calls = self._pay()
+        second, second_calls = self._pay()
+
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual((calls, second_calls), (1, 0))
+        self.assertTrue(second.data["reused"])
+        self.assertEqual(second.data["reference"], first.data["reference"])
+
+    def test_initialize_in_flight_returns_409(self):
+        self._attempts(1, status="initiated")  # ✅ autre clic: page pas encore reçue
+        r, calls = self._pay()
+        self.assertEqual((r.status_code, calls), (409, 0))
+
+    def test_failed_initializations_do_not_count_toward_the_cap(self):
+        self._attempts(6, status="failed")
+        r, calls = self._pay()
+        self.assertEqual((r.status_code, calls), (200, 1))
+
+    def test_cap_on_recently_opened_pages(self):
+        expired = timezone.now() - timedelta(minutes=1)
+        self._attempts(5, status="failed", authorization_url="https://checkout.paystack.com/old",
+                       authorization_expires_at=expired)
+        r, calls = self._pay()
+        self.assertEqual((r.status_code, calls), (429, 0))
+
+        # ✅ hors fenêtre: le client peut de nouveau payer
+        PaymentTransaction.objects.filter(booking=self.booking).update(created_at=timezone.now() - timedelta(hours=2))
+        r, calls = self._pay()
+        self.assertEqual((r.status_code, calls), (200, 1))
+
+
+# =========================================================
+# ✅ Réconciliation Paystack contre le faux Paystack local (latence, pannes, débit)
+# =========================================================
+
+class PaystackReconcileTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = fake_paystack.start_in_thread(port=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        host, port = self.server.server_address[:2]
+        paystack = override_settings(PAYSTACK_BASE_URL=f"http://{host}:{port}", PAYSTACK_SECRET_KEY="sk_test_fake")
+        paystack.enable()
+        self.addCleanup(paystack.disable)
+
+        state = self.server.state
+        state.latency_ms = state.jitter_ms = state.failure_rate = 0
+        state.calls = dict.fromkeys(state.calls, 0)
+
+        self.guest = make_user("guest")
+        self.listing = make_listing(make_user("owner"))
+
+    def _stale_tx(self, reference: str, i: int = 0, age_minutes: int = 45):
+        booking = make_booking(
+            self.listing, self.guest, status="awaiting_payment",
+            start=date(2027, 5, 1) + timedelta(days=3 * i), amount_to_pay=12000,
+        )
+        tx = PaymentTransaction.objects.create(
+            booking=booking, provider="paystack", reference=reference, amount=12000, status="initiated",
+        )
+        PaymentTransaction.objects.filter(id=tx.id).update(created_at=timezone.now() - timedelta(minutes=age_minutes))
+        return tx
+
+    def test_reconcile_settles_each_paystack_outcome(self):
+        paid = self._stale_tx("bk_ok", 0)
+        failed = self._stale_tx("bk_fail_1", 1)
+        abandoned = self._stale_tx("bk_abandon_1", 2)
+        ongoing = self._stale_tx("bk_pending_1", 3)
+        recent = self._stale_tx("bk_recent", 4, age_minutes=5)
+
+        report = reconciliation.reconcile(rate=0)
+
+        self.assertEqual(
+            {k: report[k] for k in ("checked", "paid", "failed", "pending", "errors")},
+            {"checked": 4, "paid": 1, "failed": 2, "pending": 1, "errors": 0},
+        )
+        statuses = dict(PaymentTransaction.objects.values_list("reference", "status"))
+        self.assertEqual(statuses, {
+            paid.reference: "success", failed.reference: "failed", abandoned.reference: "failed",
+            ongoing.reference: "initiated", recent.reference: "initiated",
+        })
+        paid.booking.refresh_from_db()
+        self.assertEqual(paid.booking.status, "paid")
+        self.assertEqual(self.server.state.calls["verify"], 4)
+
+    def test_settle_is_idempotent_against_verify(self):
+        from .views import paystack_verify, settle_paystack_transaction
+
+        tx = self._stale_tx("bk_ok")
+        resp = paystack_verify(tx.reference)
+
+        self.assertEqual(settle_paystack_transaction(tx, resp), "paid")
+        self.assertEqual(settle_paystack_transaction(tx, resp), "already_paid")
+        tx.booking.refresh_from_db()
+        self.assertEqual(tx.booking.status, "paid")
+
+    def test_injected_failures_leave_transactions_for_the_next_run(self):
+        txs = [self._stale_tx(f"bk_ok_{i}", i) for i in range(3)]
+        self.server.state.failure_rate = 1.0
+
+        with self.assertLogs("push", "WARNING") as logs:
+            report = reconciliation.reconcile(rate=0)
+
+        self.assertEqual(len(logs.records), 3)
+        self.assertEqual((report["checked"], report["errors"], report["paid"]), (3, 3, 0))
+        self.assertCountEqual(report["error_refs"], [tx.reference for tx in txs])
+        self.assertFalse(PaymentTransaction.objects.exclude(status="initiated").exists())
+
+        self.server.state.failure_rate = 0
+        report = reconciliation.reconcile(rate=0)
+        self.assertEqual((report["paid"], report["errors"]), (3, 0))
+
+    def test_latency_is_absorbed_by_the_pool(self):
+        for i in range(8):
+            self._stale_tx(f"bk_pending_{i}", i)
+        self.server.state.latency_ms = 300
+
+        report = reconciliation.reconcile(concurrency=4, rate=0)
+
+        # ✅ 8 verify x 300 ms: ~0.6 s à 4 en parallèle (2.4 s en série)
+        self.assertEqual(report["pending"], 8)
+        self.assertLess(report["elapsed_s"], 1.6)
+
+    def test_rate_limit_spaces_verify_calls(self):
+        for i in range(8):
+            self._stale_tx(f"bk_pending_{i}", i)
+
+        report = reconciliation.reconcile(concurrency=4, rate=4)
+
+        # ✅ rafale de 4 puis 4 appels/s: les 4 suivants attendent ~1 s
+        self.assertEqual(self.server.state.calls["verify"], 8)
+        self.assertGreaterEqual(report["elapsed_s"], 0.9)
+
+    def test_rate_limiter_token_bucket(self):
+        limiter = reconciliation.RateLimiter(rate=20, burst=2)
+        started = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+        # ✅ 2 jetons d'avance, puis 4 x 50 ms
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
+
+
+# =========================================================
+# ✅ Webhook Paystack: signature, inbox dédupliquée, worker (retries, dead-letter, purge)
+# =========================================================
+
+@override_settings(PAYSTACK_SECRET_KEY="sk_test_fake")
+class PaystackWebhookInboxTests(TestCase):
+    URL = "/api/v1/payments/paystack/webhook/"
+
+    def setUp(self):
+        self.guest = make_user("guest")
+        self.booking = make_booking(
+            make_listing(make_user("owner")), self.guest, status="awaiting_payment",
+            start=date(2027, 5, 1), deposit_amount=10000, amount_to_pay=12000,
+        )
+        self.tx = PaymentTransaction.objects.create(
+            booking=self.booking, provider="paystack", reference="bk_ref_1", amount=12000, status="initiated",
+        )
+
+    def deliver(self, reference: str = "bk_ref_1", event: str = "charge.success", signature=None):
+        body = json.dumps({"event": event, "data": {"reference": reference, "status": "success"}}).encode("utf-8")
+        if signature is None:
+            signature = fake_paystack.sign_webhook("sk_test_fake", body)
+        return APIClient().post(self.URL, body, content_type="application/json", HTTP_X_PAYSTACK_SIGNATURE=signature)
+
+    def test_invalid_signature_is_rejected(self):
+        r = self.deliver(signature="0" * 128)
+        self.assertEqual(r.status_code, 400)
+        self.assertFalse(PaystackWebhookEvent.objects.exists())
+
+    def test_redelivery_is_deduplicated(self):
+        self.assertEqual(self.deliver().json(), {"ok": True, "duplicate": False})
+        self.assertEqual(self.deliver().json(), {"ok": True, "duplicate": True})
+
+        row = PaystackWebhookEvent.objects.get()
+        self.assertEqual((row.dedup_key, row.status, row.duplicates), ("charge.success:bk_ref_1", "pending", 1))
+
+    def test_view_stores_worker_applies(self):
+        self.deliver()
+        # ✅ la vue ne touche ni la transaction ni le booking
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, "awaiting_payment")
+
+        counts = paystack_inbox.drain_inbox()
+        self.assertEqual(counts["done"], 1)
+        self.booking.refresh_from_db()
+        self.tx.refresh_from_db()
+        self.assertEqual((self.booking.status, self.tx.status), ("paid", "success"))
+        self.assertEqual(PaystackWebhookEvent.objects.get().status, "done")
+
+        self.assertEqual(sum(paystack_inbox.drain_inbox().values()), 0)
+
+    def test_unknown_reference_is_ignored(self):
+        self.deliver(reference="bk_unknown")
+        self.assertEqual(paystack_inbox.drain_inbox()["ignored"], 1)
+        self.assertEqual(PaystackWebhookEvent.objects.get().status, "ignored")
+
+    @override_settings(PAYSTACK_WEBHOOK_MAX_ATTEMPTS=2)
+    def test_failures_back_off_then_dead_letter(self):
+        self.deliver()
+        with mock.patch.object(paystack_inbox, "_apply", side_effect=RuntimeError("db down")), \
+                self.assertLogs("push", "ERROR"):
+            self.assertEqual(paystack_inbox.drain_inbox()["retry"], 1)
+            row = PaystackWebhookEvent.objects.get()
+            self.assertEqual((row.status, row.attempts, row.last_error), ("pending", 1, "db down"))
+            self.assertGreater(row.available_at, timezone.now())
+
+            # ✅ backoff écoulé -> 2e essai = dernier
+            self.assertEqual(sum(paystack_inbox.drain_inbox().values()), 0)
+            PaystackWebhookEvent.objects.update(available_at=timezone.now())
+            self.assertEqual(paystack_inbox.drain_inbox()["dead"], 1)
+
+        self.assertEqual(PaystackWebhookEvent.objects.get().status, "dead")
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, "awaiting_payment")
+
+    def test_lost_lease_is_skipped(self):
+        self.deliver()
+        row, = paystack_inbox.claim_batch()
+        PaystackWebhookEvent.objects.filter(id=row.id).update(attempts=row.attempts + 1)  # ✅ repris ailleurs
+
+        with mock.patch.object(paystack_inbox, "claim_batch", return_value=[row]):
+            self.assertEqual(paystack_inbox.drain_inbox()["skipped"], 1)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, "awaiting_payment")
+
+    def test_purge_keeps_unfinished_events(self):
+        for ref in ("bk_a", "bk_b", "bk_c"):
+            self.deliver(reference=ref)
+        PaystackWebhookEvent.objects.filter(reference="bk_a").update(status="done")
+        PaystackWebhookEvent.objects.filter(reference="bk_b").update(status="dead")
+        PaystackWebhookEvent.objects.update(received_at=timezone.now() - timedelta(days=31))
+
+        self.assertEqual(paystack_inbox.purge_old(), 1)
+        self.assertCountEqual(
+            PaystackWebhookEvent.objects.values_list("reference", flat=True), ["bk_b", "bk_c"],
+        )
+
+
+# =========================================================
+# ✅ Faux Paystack: webhook signé accepté par la vue, injection de pannes, test de charge
+# =========================================================
+
+class FakePaystackTests(TestCase):
+    WEBHOOK_URL = "/api/v1/payments/paystack/webhook/"
+
+    def setUp(self):
+        self.server = fake_paystack.start_in_thread(port=0, webhook_secret="sk_test_fake", webhook_url="http://app/hook")
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        host, port = self.server.server_address[:2]
+        self.base = f"http://{host}:{port}"
+        self.auth = {"Authorization": "Bearer sk_test_fake"}
+
+    def initialize(self, reference: str):
+        with mock.patch.object(fake_paystack.threading, "Timer") as timer:
+            r = requests.post(
+                f"{self.base}/transaction/initialize", json={"reference": reference, "amount": 12000},
+                headers=self.auth, timeout=5,
+            )
+        return r, timer.call_count
+
+    def emitted_webhook(self, reference: str):
+        with mock.patch.object(fake_paystack.requests, "post", return_value=SimpleNamespace(status_code=200)) as post:
+            self.server.state.emit_webhook(reference)
+        return post.call_args.kwargs["data"], post.call_args.kwargs["headers"]["x-paystack-signature"]
+
+    @override_settings(PAYSTACK_SECRET_KEY="sk_test_fake")
+    def test_emitted_webhook_passes_signature_check(self):
+        r, timers = self.initialize("bk_ok")
+        self.assertEqual((r.status_code, timers), (200, 1))
+
+        body, signature = self.emitted_webhook("bk_ok")
+        self.assertEqual(self.server.state.calls["webhooks_sent"], 1)
+        r = APIClient().post(self.WEBHOOK_URL, body, content_type="application/json", HTTP_X_PAYSTACK_SIGNATURE=signature)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(PaystackWebhookEvent.objects.get().dedup_key, "charge.success:bk_ok")
+
+    @override_settings(PAYSTACK_SECRET_KEY="sk_live_other")
+    def test_webhook_signed_with_another_secret_is_rejected(self):
+        self.initialize("bk_ok")
+        body, signature = self.emitted_webhook("bk_ok")
+        r = APIClient().post(self.WEBHOOK_URL, body, content_type="application/json", HTTP_X_PAYSTACK_SIGNATURE=signature)
+        self.assertEqual(r.status_code, 400)
+
+    def test_injected_failures_and_declines(self):
+        state = self.server.state
+        state.failure_rate = 1
+        r, timers = self.initialize("bk_down")
+        self.assertEqual((r.status_code, timers, state.calls["injected_errors"]), (500, 0, 1))
+
+        state.failure_rate, state.decline_rate = 0, 1
+        r, timers = self.initialize("bk_declined")
+        self.assertEqual((r.status_code, timers), (200, 0))  # ✅ refusé: pas de webhook charge.success
+        verify = requests.get(f"{self.base}/transaction/verify/bk_declined", headers=self.auth, timeout=5)
+        self.assertEqual(verify.json()["data"]["status"], "failed")
+
+        # ✅ référence "marquée": statut forcé quel que soit le tirage
+        self.assertEqual(state.outcome_for("bk_pending_1"), "ongoing")
+
+    def test_requests_without_key_are_refused(self):
+        r = requests.get(f"{self.base}/transaction/verify/bk_ok", timeout=5)
+        self.assertEqual(r.status_code, 401)
+
+
+class PaymentLoadtestTests(LiveServerTestCase):
+    """
+    ✅ payment_loadtest de bout en bout: API (live server) + faux Paystack, puis nettoyage des comptes lt_*
+    """
+    def setUp(self):
+        cache.clear()  # ✅ throttles
+        server = fake_paystack.start_in_thread(port=0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address[:2]
+        paystack = override_settings(PAYSTACK_BASE_URL=f"http://{host}:{port}", PAYSTACK_SECRET_KEY="sk_test_fake")
+        paystack.enable()
+        self.addCleanup(paystack.disable)
+
+    def test_full_flow_report(self):
+        out = io.StringIO()
+        call_command(
+            "payment_loadtest", "--base-url", f"{self.live_server_url}/api/v1",
+            "--flows", "3", "--rps", "0", "--concurrency", "1", "--json", stdout=out,
+        )
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report["flows_ok"], 3, report["error_samples"])
+        for step in ("request", "approve", "pay_init", "pay_verify", "check_in"):
+            self.assertEqual((report["steps"][step]["ok"], report["steps"][step]["errors"]), (3, 0))
+            self.assertGreaterEqual(report["steps"][step]["p95_ms"], report["steps"][step]["p50_ms"])
+        self.assertFalse(User.objects.filter(email__endswith="@loadtest.local").exists())
+
+    def test_percentile_nearest_rank(self):
+        self.assertEqual(loadtest.percentile([], 95), 0.0)
+        self.assertEqual(loadtest.percentile([5, 1, 3, 2, 4], 50), 3)
+        self.assertEqual(loadtest.percentile(list(range(1, 101)), 95), 95)
+
+
+# =========================================================
+# ✅ Codes clés: jamais en clair en base
+# =========================================================
+
+class KeyCodeStorageTests(TestCase):
+    def test_code_is_hashed_and_encrypted_only(self):
+        from .views import confirm_booking_payment
+
+        owner, guest = make_user("owner"), make_user("guest")
+        booking = make_booking(
+            make_listing(owner), guest, status="awaiting_payment", start=date(2027, 8, 1), deposit_amount=10000,
+        )
+
+        self.assertEqual(confirm_booking_payment(Booking.objects.select_related("listing").get(id=booking.id)), "paid")
+        stored = Booking.objects.values("key_code_hash", "key_code_encrypted").get(id=booking.id)
+        self.assertTrue(stored["key_code_hash"])
+
+        r = api(guest).get(f"/api/v1/bookings/{booking.id}/my-key-code/")
+        self.assertEqual(r.status_code, 200, r.data)
+        self.assertNotIn(r.data["code"], stored["key_code_encrypted"])
+        self.assertEqual(
+            api(owner).post("/api/v1/bookings/validate-key/", {"code": r.data["code"]}, format="json").status_code, 200,
+        )
+
+
+class LegacyKeyCodeMigrationTests(TransactionTestCase):
+    """
+    ✅ 0019: anciens codes en clair -> hash + chiffré; collisions sur uniq_active_key_code_hash résolues
+    """
+    before = [("listings", "0018_idempotencykey_locked_until")]
+    after = [("listings", "0019_hash_legacy_key_codes")]
+
+    def setUp(self):
+        if settings.MIGRATION_MODULES.get("listings", "") is None:
+            self.skipTest("migrations désactivées (MIGRATION_MODULES)")
+        executor = MigrationExecutor(connection)
+        self.addCleanup(lambda: MigrationExecutor(connection).migrate(executor.loader.graph.leaf_nodes()))
+        executor.migrate(self.before)
+        self.OldBooking = executor.loader.project_state(self.before).apps.get_model("listings", "Booking")
+
+    def _legacy(self, listing, i: int, status: str = "paid", **fields):
+        fields.setdefault("key_code_expires_at", timezone.now() + timedelta(days=30))
+        return self.OldBooking.objects.create(
+            listing_id=listing.id, user_id=self.guest.id, status=status, duration_days=2,
+            start_date=date(2027, 9, 1) + timedelta(days=3 * i), end_date=date(2027, 9, 3) + timedelta(days=3 * i),
+            **fields,
+        ).id
+
+    def test_backfill_resolves_hash_collisions(self):
+        owner, other = make_user("owner"), make_user("other")
+        self.guest = make_user("guest")
+        listing, other_listing = make_listing(owner), make_listing(other)
+
+        first = self._legacy(listing, 0, key_code="123456")
+        duplicate = self._legacy(listing, 1, key_code="123456")
+        hashed = self._legacy(listing, 2, key_code_hash=key_codes.hash_key_code(owner.id, "654321"))
+        clashes_with_hashed = self._legacy(listing, 3, key_code="654321")
+        other_owner = self._legacy(other_listing, 0, key_code="123456")
+        cancelled = self._legacy(listing, 4, status="cancelled", key_code="111111")
+        expired = self._legacy(listing, 5, key_code="222222", key_code_expires_at=timezone.now() - timedelta(days=1))
+
+        MigrationExecutor(connection).migrate(self.after)
+
+        rows = {
+            r["id"]: r for r in
+            self.OldBooking.objects.values("id", "key_code", "key_code_hash", "key_code_encrypted", "listing__author_id")
+        }
+        self.assertFalse([r for r in rows.values() if r["key_code"]])
+        codes = {i: key_codes.decrypt_key_code(r["key_code_encrypted"]) for i, r in rows.items()}
+
+        self.assertEqual((codes[first], codes[other_owner]), ("123456", "123456"))
+        self.assertNotEqual(codes[duplicate], "123456")
+        self.assertNotEqual(codes[clashes_with_hashed], "654321")
+        for i in (first, duplicate, clashes_with_hashed, other_owner):
+            self.assertEqual(rows[i]["key_code_hash"], key_codes.hash_key_code(rows[i]["listing__author_id"], codes[i]))
+        self.assertEqual(rows[hashed]["key_code_hash"], key_codes.hash_key_code(owner.id, "654321"))
+        for i in (cancelled, expired):
+            self.assertEqual((rows[i]["key_code_hash"], codes[i]), (None, None))
+
+
+# =========================================================
+# ✅ Inbox gérant en 1 appel (bookings/owner-inbox/overview/)
+# =========================================================
+
+class OwnerInboxOverviewTests(TestCase):
+    def setUp(self):
+        self.owner = make_user("owner")
+        self.listing = make_listing(self.owner)
+        for i in range(3):
+            make_booking(self.listing, make_user(f"guest{i}"), start=date(2027, 7, 1 + i * 3))
+        make_booking(self.listing, make_user("payer"), status="paid", start=date(2027, 7, 20))
+
+    def test_counts_and_page_in_two_queries(self):
+        client = api(self.owner)
+        # ✅ 1 page (bookings + gérant + profils en select_related) + 1 agrégat conditionnel des compteurs
+        with self.assertNumQueries(2):
+            r = client.get("/api/v1/bookings/owner-inbox/overview/?status=requested")
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.data["results"]), 3)
+        self.assertEqual(r.data["counts"]["requested"], 3)
+        self.assertEqual(r.data["counts"]["paid"], 1)
+
+
+# =========================================================
+# ✅ Devis en lot (bookings/quote/): dispo + montants, nb de requêtes fixe
+# =========================================================
+
+class BookingQuoteTests(TestCase):
+    URL = "/api/v1/bookings/quote/"
+
+    def setUp(self):
+        cache.clear()  # ✅ throttle "search"
+        self.owner = make_user("owner")
+        self.listing = make_listing(self.owner, price=15000)
+        make_booking(self.listing, make_user("guest"), status="paid", start=date(2027, 6, 10), nights=3)
+
+    def quote(self, payload):
+        return api().post(self.URL, payload, format="json")
+
+    def test_ranges_for_one_listing(self):
+        r = self.quote({"listing": self.listing.id, "ranges": [
+            {"start_date": "2027-06-05", "nights": 2},   # ✅ avant le séjour payé
+            {"start_date": "2027-06-11", "nights": 2},   # ✅ chevauche
+            {"start_date": "2027-06-13", "nights": 2},   # ✅ départ le 13 = arrivée possible
+        ]})
+        self.assertEqual(r.status_code, 200)
+        results = r.json()["results"]
+        self.assertEqual([q["available"] for q in results], [True, False, True])
+        self.assertEqual(results[0]["end_date"], "2027-06-07")
+
+        expected = serializers.compute_approval_amounts(15000, date(2027, 6, 5), date(2027, 6, 7))
+        for field, value in expected.items():
+            self.assertEqual(results[0][field], value)
+        self.assertEqual(results[0]["price_per_night"], 15000)
+
+    def test_many_listings_one_range(self):
+        other = make_listing(make_user("owner2"), price=8000)
+        inactive = make_listing(make_user("owner3"))
+        Listing.objects.filter(id=inactive.id).update(is_active=False)
+
+        r = self.quote({
+            "listings": [self.listing.id, other.id, inactive.id, 999999, other.id],
+            "start_date": "2027-06-09",
+            "nights": 2,
+        })
+        self.assertEqual(r.status_code, 200)
+        by_listing = {q["listing"]: q for q in r.json()["results"]}
+        self.assertEqual(len(r.json()["results"]), 4)  # ✅ doublon ignoré
+        self.assertFalse(by_listing[self.listing.id]["available"])
+        self.assertTrue(by_listing[other.id]["available"])
+        self.assertEqual(by_listing[other.id]["total_amount"], 16000)
+        for missing in (inactive.id, 999999):
+            self.assertFalse(by_listing[missing]["available"])
+            self.assertIn("detail", by_listing[missing])
+            self.assertNotIn("total_amount", by_listing[missing])
+
+    def test_query_count_does_not_grow_with_ranges(self):
+        def run(n):
+            ranges = [{"start_date": str(date(2027, 7, 1) + timedelta(days=i)), "nights": 1 + i % 4} for i in range(n)]
+            return count_queries(lambda: self.assertEqual(
+                self.quote({"listing": self.listing.id, "ranges": ranges}).status_code, 200,
+            ))
+
+        self.assertEqual(run(1), run(50))
+
+    def test_validation(self):
+        today = timezone.localdate()
+        bad = [
+            {"listing": self.listing.id, "listings": [self.listing.id], "start_date": "2027-06-01", "nights": 1},
+            {"start_date": "2027-06-01", "nights": 1},
+            {"listing": self.listing.id, "ranges": []},
+            {"listings": [self.listing.id], "start_date": "2027-06-01"},
+            {"listing": self.listing.id, "ranges": [{"start_date": str(today - timedelta(days=1)), "nights": 1}]},
+            {"listing": self.listing.id, "ranges": [{"start_date": "2027-06-01", "nights": 1}] * 201},
+        ]
+        for payload in bad:
+            with self.subTest(payload=sorted(payload)):
+                self.assertEqual(self.quote(payload).status_code, 400)
+
+
+# =========================================================
+# ✅ BookingPublicSerializer: nb de requêtes indépendant du nb de lignes (pas de N+1)
+# =========================================================
+
+class BookingListQueryTests(TestCase):
+    EXTRA_ROWS = 5
+
+    def setUp(self):
+        self.owner = make_user("owner")
+        self.guest = make_user("guest")
+        self.listing = make_listing(self.owner)
+        self._n = 0
+
+    def add_booking(self, guest=None):
+        # ✅ un autre gérant (côté client) ou un autre client (côté gérant) à chaque ligne:
+        # un N+1 sur author / profile se verrait
+        self._n += 1
+        if guest is None:
+            return make_booking(make_listing(make_user(f"owner{self._n}")), self.guest, start=date(2027, 9, 1 + self._n))
+        return make_booking(self.listing, guest, start=date(2027, 9, 1 + self._n))
+
+    def assertQueriesDoNotGrow(self, fetch, add_row):
+        add_row()
+        before = count_queries(fetch)
+        for _ in range(self.EXTRA_ROWS):
+            add_row()
+        after = count_queries(fetch)
+        self.assertEqual(before, after, f"{before} requêtes pour 1 ligne, {after} pour {1 + self.EXTRA_ROWS}")
+
+    def _get_ok(self, client, url):
+        def fetch():
+            r = client.get(url)
+            self.assertEqual(r.status_code, 200)
+        return fetch
+
+    def test_my_bookings(self):
+        self.assertQueriesDoNotGrow(self._get_ok(api(self.guest), "/api/v1/bookings/my/"), self.add_booking)
+
+    def test_owner_inbox(self):
+        add = lambda: self.add_booking(guest=make_user(f"guest{self._n + 1}"))
+        self.assertQueriesDoNotGrow(self._get_ok(api(self.owner), "/api/v1/bookings/owner-inbox/"), add)
+
+    def test_owner_inbox_overview(self):
+        add = lambda: self.add_booking(guest=make_user(f"guest{self._n + 1}"))
+        self.assertQueriesDoNotGrow(self._get_ok(api(self.owner), "/api/v1/bookings/owner-inbox/overview/"), add)
+
+
+# =========================================================
+# ✅ Métriques dashboard admin: budget de requêtes + cache
+# =========================================================
+
+class AdminMetricsQueryBudgetTests(TestCase):
+    URL = "/api/v1/admin/metrics/"
+
+    def setUp(self):
+        cache.clear()
+        self.admin = make_user("admin", is_staff=True)
+        owner, guest = make_user("owner"), make_user("guest")
+        listing = make_listing(owner)
+        for i, status_name in enumerate(("requested", "approved", "paid", "checked_in", "released", "cancelled")):
+            make_booking(listing, guest, status=status_name, start=date(2027, 10, 1 + i * 3), deposit_amount=1000)
+
+    def test_fresh_compute_is_four_queries(self):
+        # ✅ 1 agrégat Booking + 1 Dispute + 1 Payout + la liste d'audit
+        with self.assertNumQueries(4):
+            r = api(self.admin).get(self.URL + "?fresh=1")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data["by_status"]["paid"], 1)
+        self.assertEqual(r.data["money"]["total_deposit"], 3000)
+        self.assertIn("computed_at", r.data)
+
+    def test_cache_hit_is_zero_queries(self):
+        first = api(self.admin).get(self.URL)
+        with self.assertNumQueries(0):
+            second = api(self.admin).get(self.URL)
+        self.assertEqual(first.data["computed_at"], second.data["computed_at"])
+
+
+# =========================================================
+# ✅ Rollups stats admin: les gains suivent la résidence quand elle change de gérant
+# =========================================================
+
+class RollupOwnerChangeTests(TestCase):
+    def test_owner_change_moves_existing_rollups(self):
+        old_owner, new_owner = make_user("old_owner"), make_user("new_owner")
+        listing = make_listing(old_owner)
+        make_booking(listing, make_user("guest"), status="paid", start=date(2027, 4, 2), deposit_amount=10000)
+        self.assertEqual(DailyBookingRollup.objects.get(listing=listing).owner_id, old_owner.id)
+
+        listing.author = new_owner
+        listing.save()
+
+        self.assertEqual(DailyBookingRollup.objects.get(listing=listing).owner_id, new_owner.id)
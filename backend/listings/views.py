@@ -5,36 +5,60 @@ import hashlib
 import logging
 import secrets
 import string
+import time
 import requests
 
+from datetime import date, timedelta
+
 from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password
 from django.shortcuts import get_object_or_404
+from django.http import HttpResponse
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions, generics
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.throttling import ScopedRateThrottle
+from rest_framework.pagination import CursorPagination
 from .models import (
+    BOOKING_STATUS,
     Listing,
     Booking,
     PaymentTransaction,
     PushSubscription,
+    ExternalCalendar,
+    Dispute,
 )
 from .serializers import (
     ListingSerializer,
     BookingPublicSerializer,
     BookingRequestCreateSerializer,
     BookingOwnerDecisionSerializer,
+    BookingBulkDecisionSerializer,
+    BookingQuoteSerializer,
     BookingPaymentPrepareSerializer,
     BookingValidateKeySerializer,
     PushSubscriptionSerializer,
     PaymentTransactionSerializer,
+    ExternalCalendarSerializer,
+    booking_public_queryset,
+    is_listing_available,
 )
-from .geocode import reverse_geocode_nominatim, forward_geocode_nominatim
 from .permissions import IsOwnerOrReadOnly
+from . import occupancy
+from . import ical
+from . import paystack_inbox
+from . import payment_archive
+from . import rollups
+from . import events as booking_events
+from .booking_state import transition
+from .key_codes import hash_key_code, encrypt_key_code, decrypt_key_code
+from .idempotency import idempotent
 
 logger = logging.getLogger(__name__)
 
@@ -50,13 +74,19 @@ def _paystack_headers():
     return {"Authorization": f"Bearer {secret}", "Content-Type": "application/json"}
 
 
+def _paystack_url(path: str) -> str:
+    # ✅ PAYSTACK_BASE_URL: api.paystack.co en prod, faux Paystack local en test (manage.py fake_paystack)
+    base = (getattr(settings, "PAYSTACK_BASE_URL", None) or "https://api.paystack.co").rstrip("/")
+    return f"{base}{path}"
+
+
 def paystack_initialize(email: str, amount_cfa: int, reference: str, callback_url: str = None, metadata: dict = None):
     """
     Paystack attend souvent amount en plus petite unité.
     ⚠️ En XOF, Paystack utilise généralement l'unité de base (pas kobo),
     mais ça dépend du setup. On garde CFA ici. Tu ajusteras si besoin.
     """
-    url = "https://api.paystack.co/transaction/initialize"
+    url = _paystack_url("/transaction/initialize")
 
     payload = {
         "email": email,
@@ -74,7 +104,7 @@ def paystack_initialize(email: str, amount_cfa: int, reference: str, callback_ur
 
 
 def paystack_verify(reference: str):
-    url = f"https://api.paystack.co/transaction/verify/{reference}"
+    url = _paystack_url(f"/transaction/verify/{reference}")
     r = requests.get(url, headers=_paystack_headers(), timeout=20)
     r.raise_for_status()
     return r.json()
@@ -108,117 +138,10 @@ class PushVapidPublicKeyView(APIView):
         })
 
 
-import os
-import json
 import logging
-from django.conf import settings
-from django.utils import timezone
-from pywebpush import webpush, WebPushException
-import time
-from urllib.parse import urlparse
+from .notifications import enqueue_push, enqueue_push_many, coalesce_window_for
 logger = logging.getLogger("push")  # ✅ utilise le logger "push" du settings.LOGGING
 
-
-def send_push_to_user(user, title: str, body: str, data: dict = None):
-    subs = PushSubscription.objects.filter(user=user)
-
-    logger.info(
-        "PUSH_NOTIFY start user=%s subs_count=%s title=%s",
-        getattr(user, "id", None),
-        subs.count(),
-        title,
-    )
-
-    if not subs.exists():
-        logger.warning("PUSH_NOTIFY no subs for user=%s", getattr(user, "id", None))
-        return False
-
-    # ✅ IMPORTANT: on passe un PATH vers le PEM (pas le contenu)
-    vapid_private_key_path = getattr(settings, "VAPID_PRIVATE_KEY_PATH", "") or ""
-    base_sub = getattr(settings, "VAPID_CLAIMS", {}).get("sub") or "mailto:support@decrouresi.com"
-
-    if not vapid_private_key_path:
-        logger.error("VAPID_PRIVATE_KEY_PATH missing in settings")
-        return False
-
-    payload = {
-        "title": title,
-        "body": body,
-        "data": data or {},
-    }
-
-    sent = 0
-    removed = 0
-
-    for sub in subs:
-        subscription_info = {
-            "endpoint": sub.endpoint,
-            "keys": {"p256dh": sub.p256dh, "auth": sub.auth},
-        }
-
-        logger.info(
-            "PUSH_NOTIFY try user=%s sub_id=%s endpoint=%s ua=%s",
-            getattr(user, "id", None),
-            sub.id,
-            (sub.endpoint[:80] + "...") if sub.endpoint else None,
-            sub.user_agent,
-        )
-
-        try:
-    # ✅ IMPORTANT: on récupère la réponse HTTP du push service (FCM/APNs)
-            # ✅ VAPID claims PRO: aud + exp doivent matcher le push service (FCM vs Apple)
-            parsed = urlparse(sub.endpoint)
-            aud = f"{parsed.scheme}://{parsed.netloc}"
-            claims = {
-                "sub": base_sub,
-                "aud": aud,
-                "exp": int(time.time()) + 60 * 60,  # ✅ 1h (Apple aime les exp courts)
-            }
-            resp = webpush(
-                subscription_info=subscription_info,
-                data=json.dumps(payload),
-                vapid_private_key=vapid_private_key_path,  # tu passes le PATH -> ok
-                vapid_claims=claims,
-                ttl=60 * 10,          # ✅ 10 min
-                content_encoding="aes128gcm",
-            )
-
-            # ✅ LOGS COMPLETS côté serveur push
-            logger.info(
-                "WEBPUSH resp user=%s sub_id=%s status=%s headers=%s body=%s",
-                getattr(user, "id", None),
-                sub.id,
-                getattr(resp, "status_code", None),
-                dict(getattr(resp, "headers", {}) or {}),
-                (getattr(resp, "text", "")[:300] if getattr(resp, "text", None) else None),
-            )
-
-            sent += 1
-            PushSubscription.objects.filter(id=sub.id).update(last_seen_at=timezone.now())
-
-        except WebPushException as ex:
-            status_code = getattr(ex.response, "status_code", None)
-            resp_text = None
-            try:
-                resp_text = ex.response.text
-            except Exception:
-                pass
-
-            if status_code in [404, 410]:
-                sub.delete()
-                removed += 1
-                logger.warning("WEBPUSH expired sub deleted user=%s sub=%s status=%s", user.id, sub.id, status_code)
-                continue
-
-            logger.error("WEBPUSH failed user=%s sub=%s status=%s resp=%s", user.id, sub.id, status_code, resp_text)
-
-        except Exception as e:
-            logger.exception("WEBPUSH unknown error user=%s sub=%s err=%s", user.id, sub.id, str(e))
-
-
-    logger.info("PUSH_NOTIFY done user=%s sent=%s removed=%s", user.id, sent, removed)
-    return sent > 0
-
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
@@ -238,75 +161,254 @@ class PushPingView(APIView):
         return Response({"ok": True})
 
 # =========================================================
-# ✅ UTILS: GEO
+# ✅ UTILS: GEO (ASYNC / ASGI)
+# - Servies par backend/asgi.py: l'attente Nominatim ne bloque plus un worker
+# - Sous WSGI (async_to_sync = 1 loop par appel): session aiohttp ouverte/fermée par appel
 # =========================================================
+import asyncio
+from types import SimpleNamespace
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from rest_framework.throttling import AnonRateThrottle
+from .geocode import reverse_geocode_nominatim_async, forward_geocode_nominatim_async
+
+
+def _async_anon_throttle_ok(request) -> bool:
+    """
+    ✅ Même filet que DRF ("anon" 30/min par IP) sans passer par request.user
+    (request.user = accès DB synchrone, interdit dans une vue async)
+    """
+    throttle = AnonRateThrottle()
+    return throttle.allow_request(SimpleNamespace(user=None, META=request.META), None)
 
-class ReverseGeocodeView(APIView):
-    authentication_classes = []
-    permission_classes = [permissions.AllowAny]
 
-    def post(self, request):
-        lat = request.data.get("latitude")
-        lng = request.data.get("longitude")
+def _async_request_data(request) -> dict:
+    if request.content_type == "application/json":
+        try:
+            return json.loads(request.body or b"{}") or {}
+        except (ValueError, TypeError):
+            return {}
+    return request.POST
+
 
-        logger.warning("REVERSE_GEOCODE incoming data=%s", request.data)
+def _shared_geocode_session(request) -> bool:
+    # ✅ session aiohttp réutilisée seulement sous ASGI (event loop du worker, vit autant que lui)
+    return isinstance(request, ASGIRequest)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncReverseGeocodeView(View):
+    """
+    ✅ POST /utils/reverse-geocode/ (async)
+    body: { "latitude": 5.35, "longitude": -4.00 }
+    """
+    http_method_names = ["post"]
+
+    async def post(self, request):
+        if not _async_anon_throttle_ok(request):
+            return JsonResponse({"detail": "Trop de requêtes."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+        payload = _async_request_data(request)
+        lat = payload.get("latitude")
+        lng = payload.get("longitude")
 
         if lat is None or lng is None:
-            return Response({"detail": "latitude et longitude sont requis."}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({"detail": "latitude et longitude sont requis."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             lat = float(lat)
             lng = float(lng)
-            logger.warning("REVERSE_GEOCODE lat=%s lng=%s", lat, lng)
 
-            data = reverse_geocode_nominatim(lat, lng)
+            data = await reverse_geocode_nominatim_async(lat, lng, shared_session=_shared_geocode_session(request))
 
-            logger.warning("REVERSE_GEOCODE ok address_label=%s", data.get("address_label"))
             logger.warning("REVERSE_GEOCODE ok city=%s area=%s borough=%s", data.get("city"), data.get("area"), data.get("borough"))
+            return JsonResponse(data, status=status.HTTP_200_OK)
 
-            return Response(data, status=status.HTTP_200_OK)
+        except asyncio.TimeoutError:
+            logger.warning("REVERSE_GEOCODE timeout lat=%s lng=%s", lat, lng)
+            return JsonResponse(
+                {
+                    "address_label": None,
+                    "city": None,
+                    "area": None,
+                    "borough": None,
+                    "raw": None,
+                    "warning": "geocode_timeout",
+                },
+                status=status.HTTP_200_OK,
+            )
 
         except Exception as e:
             logger.exception("REVERSE_GEOCODE failed: %s", str(e))
-            msg = str(e)
-
-            if "Read timed out" in msg or "Timeout" in msg:
-                return Response(
-                    {
-                        "address_label": None,
-                        "city": None,
-                        "area": None,
-                        "borough": None,
-                        "raw": None,
-                        "warning": "geocode_timeout",
-                    },
-                    status=status.HTTP_200_OK
-                )
-
-            return Response({"detail": "reverse geocoding failed", "error": msg}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({"detail": "reverse geocoding failed", "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class PlaceSearchView(APIView):
-    authentication_classes = []
-    permission_classes = [permissions.AllowAny]
+class AsyncPlaceSearchView(View):
+    """
+    ✅ GET /utils/search-places/?q=...&limit=6 (async)
+    """
+    http_method_names = ["get"]
 
-    def get(self, request):
-        q = request.query_params.get("q", "")
-        limit = request.query_params.get("limit", "6")
+    async def get(self, request):
+        if not _async_anon_throttle_ok(request):
+            return JsonResponse({"detail": "Trop de requêtes."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
 
+        q = request.GET.get("q", "")
         try:
-            limit = int(limit)
+            limit = int(request.GET.get("limit", "6"))
         except Exception:
             limit = 6
 
-        logger.warning("SEARCH_PLACES q=%s limit=%s", q, limit)
-
         try:
-            results = forward_geocode_nominatim(q, limit=limit)
-            return Response({"results": results}, status=status.HTTP_200_OK)
+            results = await forward_geocode_nominatim_async(
+                q, limit=limit, shared_session=_shared_geocode_session(request),
+            )
+            return JsonResponse({"results": results}, status=status.HTTP_200_OK)
         except Exception as e:
             logger.exception("SEARCH_PLACES failed: %s", str(e))
-            return Response({"results": []}, status=status.HTTP_200_OK)
+            return JsonResponse({"results": []}, status=status.HTTP_200_OK)
+
+
+# =========================================================
+# ✅ BOOKINGS: FLUX SSE (ASYNC / ASGI)
+# - remplace le polling de bookings/my/, bookings/<id>/, owner-inbox/
+# - alimenté par la table BookingEvent (events.py), reprise via Last-Event-ID
+# - EventSource ne sait pas envoyer de header: jeton de flux court (stream-token/) dans l'URL,
+#   jamais le JWT d'accès (l'URL finit dans les logs d'accès / proxies)
+# - ASGI uniquement: sous WSGI la réponse serait bufferisée jusqu'à la fin du flux
+# =========================================================
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.http import StreamingHttpResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+
+_STREAM_TOKEN_SALT = "listings.booking-events-stream"
+
+
+def _stream_token_seconds() -> int:
+    return int(getattr(settings, "BOOKING_EVENTS_STREAM_TOKEN_SECONDS", 60))
+
+
+def _sse_user(request):
+    """
+    ✅ JWT via "Authorization: Bearer ..." (clients fetch) ou ?token=<jeton de flux> (EventSource)
+    Le jeton de flux ne sert qu'à ouvrir ce flux (salt dédié) et expire vite
+    """
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw = auth.get_raw_token(header) if header else None
+    if raw:
+        try:
+            user = auth.get_user(auth.get_validated_token(raw))
+        except (InvalidToken, TokenError):
+            return None
+    else:
+        token = request.GET.get("token") or ""
+        try:
+            user_id = signing.loads(token, salt=_STREAM_TOKEN_SALT, max_age=_stream_token_seconds())
+        except signing.BadSignature:  # ✅ SignatureExpired compris
+            return None
+        user = auth.user_model.objects.filter(pk=user_id).first()
+    return user if user and user.is_active else None
+
+
+class BookingEventStreamTokenView(APIView):
+    """
+    ✅ POST /bookings/events/stream-token/ (JWT en header) -> {"token": "...", "expires_in": 60}
+    new EventSource(`/api/v1/bookings/events/stream/?token=${token}`)
+    à redemander à chaque (re)connexion: EventSource.onerror -> nouveau jeton -> nouvel EventSource
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        token = signing.dumps(request.user.pk, salt=_STREAM_TOKEN_SALT)
+        return Response({"token": token, "expires_in": _stream_token_seconds()}, status=status.HTTP_200_OK)
+
+
+def _sse_last_event_id(request):
+    raw = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    try:
+        return max(int(raw), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class BookingEventStreamView(View):
+    """
+    ✅ GET /bookings/events/stream/?token=<jeton de flux> (text/event-stream) — ASGI uniquement
+    (uvicorn backend.asgi:application; sous WSGI: 501)
+    event: booking
+    id: 42
+    data: {"id": 42, "booking_id": 12, "status": "paid", "created_at": "..."}
+
+    - sans Last-Event-ID: seulement les nouveaux événements
+    - la connexion est fermée après BOOKING_EVENTS_STREAM_MAX_SECONDS:
+      le client reprend avec un nouveau jeton + Last-Event-ID (ou ?last_event_id=)
+    - la table n'est relue que si le marqueur en cache du user a bougé
+      (au plus tard toutes les BOOKING_EVENTS_DB_POLL_SECONDS: événements écrits par un autre process
+      quand le cache n'est pas partagé)
+    """
+    http_method_names = ["get"]
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            # ✅ WSGI: un itérateur async est consommé en entier avant envoi -> flux bloqué puis bufferisé
+            return JsonResponse(
+                {"detail": "Flux disponible uniquement sous ASGI."}, status=status.HTTP_501_NOT_IMPLEMENTED,
+            )
+
+        user = await sync_to_async(_sse_user)(request)
+        if user is None:
+            return JsonResponse({"detail": "Authentification requise."}, status=status.HTTP_401_UNAUTHORIZED)
+
+        last_id = _sse_last_event_id(request)
+        if last_id is None:
+            last_id = await sync_to_async(booking_events.last_id_for)(user.id)
+
+        response = StreamingHttpResponse(
+            self._stream(user.id, last_id),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # ✅ nginx: pas de buffering du flux
+        return response
+
+    async def _stream(self, user_id, last_id: int):
+        poll = float(getattr(settings, "BOOKING_EVENTS_POLL_SECONDS", 2))
+        db_poll = float(getattr(settings, "BOOKING_EVENTS_DB_POLL_SECONDS", 30))
+        max_seconds = float(getattr(settings, "BOOKING_EVENTS_STREAM_MAX_SECONDS", 300))
+        heartbeat = 15.0
+
+        loop = asyncio.get_running_loop()
+        started = last_beat = loop.time()
+        last_read, seen = None, None
+
+        yield f"retry: {int(poll * 1000)}\n\n"
+
+        while loop.time() - started < max_seconds:
+            rows = []
+            marker = await booking_events.amarker(user_id)  # ✅ lu AVANT la table: un commit entre les 2 sera revu
+            if last_read is None or marker != seen or loop.time() - last_read >= db_poll:
+                seen, last_read = marker, loop.time()
+                rows = await sync_to_async(booking_events.since)(user_id, last_id)
+            for row in rows:
+                last_id = row["id"]
+                data = json.dumps({**row, "created_at": row["created_at"].isoformat()})
+                yield f"id: {row['id']}\nevent: booking\ndata: {data}\n\n"
+
+            now = loop.time()
+            if rows:
+                last_beat = now
+            elif now - last_beat >= heartbeat:
+                last_beat = now
+                yield ": ping\n\n"  # ✅ garde la connexion ouverte (proxies)
+
+            await asyncio.sleep(poll)
 
 
 # =========================================================
@@ -473,6 +575,86 @@ class ListingRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
             status=status.HTTP_405_METHOD_NOT_ALLOWED,
         )
 
+class ListingAvailabilityView(APIView):
+    """
+    ✅ Calendrier de disponibilité (public)
+    GET /listings/<id>/availability/?from=YYYY-MM-DD&to=YYYY-MM-DD (to exclu)
+    - servi depuis l'index d'occupation (occupancy.py), pas depuis les bookings
+    - ETag = version de l'index -> 304 si rien n'a changé
+    """
+    permission_classes = [permissions.AllowAny]
+
+    MAX_DAYS = 366
+    DEFAULT_DAYS = 90
+
+    def get(self, request, pk):
+        listing = get_object_or_404(Listing.objects.only("id"), pk=pk)
+
+        try:
+            raw_from = request.query_params.get("from")
+            raw_to = request.query_params.get("to")
+            date_from = date.fromisoformat(raw_from) if raw_from else timezone.localdate()
+            date_to = date.fromisoformat(raw_to) if raw_to else date_from + timedelta(days=self.DEFAULT_DAYS)
+        except ValueError:
+            return Response({"detail": "Format attendu: YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if date_to <= date_from:
+            return Response({"detail": "'to' doit être après 'from'."}, status=status.HTTP_400_BAD_REQUEST)
+        if (date_to - date_from).days > self.MAX_DAYS:
+            return Response({"detail": f"Période max: {self.MAX_DAYS} jours."}, status=status.HTTP_400_BAD_REQUEST)
+
+        version = occupancy.get_version(listing.id)
+        etag = f'"occ-{listing.id}-{version}-{date_from:%Y%m%d}-{date_to:%Y%m%d}"'
+        headers = {"ETag": etag, "Cache-Control": "public, max-age=0, must-revalidate"}
+
+        if request.headers.get("If-None-Match") == etag:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        cache_key = f"availability:{listing.id}:{version}:{date_from:%Y%m%d}:{date_to:%Y%m%d}"
+        payload = cache.get(cache_key)
+        if payload is None:
+            payload = {
+                "listing": listing.id,
+                "from": date_from.isoformat(),
+                "to": date_to.isoformat(),
+                "version": version,
+                **occupancy.availability(listing.id, date_from, date_to, indexed=bool(version)),
+            }
+            cache.set(cache_key, payload, 60 * 60)
+
+        return Response(payload, headers=headers)
+
+
+class ListingCalendarExportView(APIView):
+    """
+    ✅ Export iCalendar (public, à coller dans Airbnb / Booking.com / Google Agenda)
+    GET /listings/<id>/calendar.ics
+    - uniquement les bookings bloquants de la plateforme (pas les blocs importés -> pas de boucle)
+    - rendu mis en cache par version de l'index d'occupation + ETag -> 304
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, pk):
+        listing = get_object_or_404(Listing.objects.only("id", "title"), pk=pk)
+
+        version = occupancy.get_version(listing.id)
+        etag = f'"ics-{listing.id}-{version}"'
+        headers = {"ETag": etag, "Cache-Control": "public, max-age=0, must-revalidate"}
+
+        if request.headers.get("If-None-Match") == etag:
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        cache_key = f"ics:{listing.id}:{version}"
+        body = cache.get(cache_key)
+        if body is None:
+            body = ical.render_listing_ics(listing)
+            cache.set(cache_key, body, int(getattr(settings, "ICAL_EXPORT_CACHE_SECONDS", 60 * 60)))
+
+        response = HttpResponse(body, content_type="text/calendar; charset=utf-8", headers=headers)
+        response["Content-Disposition"] = f'inline; filename="residence-{listing.id}.ics"'
+        return response
+
+
 # =========================================================
 # ✅ BOOKINGS — NEW FLOW
 # =========================================================
@@ -487,22 +669,44 @@ class BookingRequestCreateView(generics.CreateAPIView):
     throttle_classes = [ScopedRateThrottle]
     throttle_scope = "booking_request"
 
-    def perform_create(self, serializer):
-        booking = serializer.save()
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        # ✅ renvoi avec le même Idempotency-Key -> même réponse, pas de 2e demande
+        return super().post(request, *args, **kwargs)
 
-        # ✅ Notification PWA au gérant (placeholder log)
-        owner = booking.listing.author
-        if owner:
-            try:
-                send_push_to_user(
+    def perform_create(self, serializer):
+        # ✅ booking + notif dans la même transaction (envoi réel par le worker push)
+        with transaction.atomic():
+            booking = serializer.save()
+            booking_events.record(booking)  # ✅ flux SSE (gérant + client)
+
+            # ✅ Notification PWA au gérant (regroupée si plusieurs demandes dans la fenêtre)
+            owner = booking.listing.author
+            if owner:
+                enqueue_push(
                     owner,
                     title="Nouvelle demande de réservation",
                     body=f"{booking.user} veut réserver {booking.listing.title} ({booking.duration_days} jours)",
                     data={"type": "booking_request", "booking_id": booking.id, "url": "/owner/inbox"},
+                    coalesce_window=coalesce_window_for("booking_request"),
                 )
-            except Exception as e:
-                # ✅ Ne jamais casser la création booking à cause du push
-                logger.exception("PUSH_NOTIFY booking_request failed booking=%s err=%s", booking.id, str(e))
+
+
+class BookingQuoteView(APIView):
+    """
+    ✅ Devis en lot (public): grille de prix + dispo en 1 requête
+    POST /bookings/quote/
+    - {"listing": 3, "ranges": [{"start_date": "2027-01-10", "nights": 3}, ...]}
+    - {"listings": [3, 4, 5], "start_date": "2027-01-10", "nights": 3}
+    """
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = "search"
+
+    def post(self, request):
+        ser = BookingQuoteSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        return Response({"results": ser.quotes()}, status=status.HTTP_200_OK)
 
 
 class MyBookingsView(generics.ListAPIView):
@@ -513,7 +717,7 @@ class MyBookingsView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user).select_related("listing").order_by("-created_at")
+        return booking_public_queryset(Booking.objects.filter(user=self.request.user)).order_by("-created_at")
 
 
 class BookingDetailView(generics.RetrieveAPIView):
@@ -527,7 +731,7 @@ class BookingDetailView(generics.RetrieveAPIView):
     
     def get_queryset(self):
         # ✅ le client ne peut voir que ses bookings
-        return Booking.objects.filter(user=self.request.user).select_related("listing")
+        return booking_public_queryset(Booking.objects.filter(user=self.request.user))
 
 
 
@@ -535,19 +739,61 @@ class OwnerBookingsInboxView(generics.ListAPIView):
     """
     ✅ Gérant: inbox des demandes
     - Par défaut: status=requested
+    - ?ids=12,13,14 -> ces bookings-là (ex: booking_ids d'une notif digest), tous statuts
+    """
+    serializer_class = BookingPublicSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        qs = Booking.objects.filter(listing__author=self.request.user)
+
+        ids = [i for i in (self.request.query_params.get("ids") or "").split(",") if i.strip().isdigit()]
+        if ids:
+            qs = qs.filter(id__in=ids[:100])
+        else:
+            qs = qs.filter(status=self.request.query_params.get("status", "requested"))
+
+        return booking_public_queryset(qs).order_by("-created_at")
+
+
+class OwnerInboxCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-created_at", "-id")
+
+
+class OwnerInboxOverviewView(generics.ListAPIView):
+    """
+    ✅ Gérant: inbox en 1 seul appel (badges des onglets + page courante)
+    GET /bookings/owner-inbox/overview/?status=requested&cursor=...
+    - counts: nb de bookings par statut (1 seul agrégat conditionnel)
+    - results: page du statut demandé (pagination par curseur: stable quand de nouvelles demandes arrivent)
     """
     serializer_class = BookingPublicSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OwnerInboxCursorPagination
+
+    def _owner_bookings(self):
+        return Booking.objects.filter(listing__author=self.request.user)
 
     def get_queryset(self):
-        status_q = self.request.query_params.get("status", "requested")
-        return (
-            Booking.objects
-            .filter(listing__author=self.request.user, status=status_q)
-            .select_related("listing", "user")
-            .order_by("-created_at")
+        return booking_public_queryset(
+            self._owner_bookings().filter(status=self.request.query_params.get("status", "requested"))
         )
 
+    def get_counts(self) -> dict:
+        return self._owner_bookings().aggregate(**{
+            key: Count("id", filter=Q(status=key))
+            for key, _label in BOOKING_STATUS
+        })
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        response.data["counts"] = self.get_counts()
+        return response
+
 
 class OwnerBookingDecisionView(APIView):
     """
@@ -569,8 +815,9 @@ class OwnerBookingDecisionView(APIView):
     """
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request, booking_id: int):
-        booking = get_object_or_404(Booking, id=booking_id)
+        booking = get_object_or_404(booking_public_queryset(), id=booking_id)
 
         # ✅ sécurité: propriétaire uniquement
         if booking.listing.author_id != request.user.id:
@@ -581,27 +828,80 @@ class OwnerBookingDecisionView(APIView):
             context={"request": request, "booking": booking},
         )
         serializer.is_valid(raise_exception=True)
-        updated = serializer.save()
-
-        # ✅ Notif au client (placeholder)
-        if updated.status == "awaiting_payment":
-            send_push_to_user(
-                updated.user,
-                title="Réservation acceptée",
-                body="Le gérant a validé ta demande. Tu peux payer l'acompte.",
-                data={"type": "booking_approved", "booking_id": updated.id, "url": f"/bookings/{updated.id}"},
-            )
-        elif updated.status == "rejected":
-            send_push_to_user(
-                updated.user,
-                title="Réservation refusée",
-                body="Le gérant a indiqué que ce n'est pas disponible.",
-                data={"type": "booking_rejected", "booking_id": updated.id},
-            )
+
+        with transaction.atomic():
+            updated = serializer.save()
+
+            # ✅ Notif au client (outbox, même transaction)
+            if updated.status == "awaiting_payment":
+                enqueue_push(
+                    updated.user,
+                    title="Réservation acceptée",
+                    body="Le gérant a validé ta demande. Tu peux payer l'acompte.",
+                    data={"type": "booking_approved", "booking_id": updated.id, "url": f"/bookings/{updated.id}"},
+                )
+            elif updated.status == "rejected":
+                enqueue_push(
+                    updated.user,
+                    title="Réservation refusée",
+                    body="Le gérant a indiqué que ce n'est pas disponible.",
+                    data={"type": "booking_rejected", "booking_id": updated.id},
+                )
 
         return Response(BookingPublicSerializer(updated).data, status=status.HTTP_200_OK)
 
 
+class OwnerBulkDecisionView(APIView):
+    """
+    ✅ Gérant: approve/reject de plusieurs demandes en 1 appel
+    POST /bookings/decisions/bulk/
+    body:
+    {
+      "decisions": [
+        {"booking_id": 12, "action": "approve", "start_date": "2026-01-22", "owner_note": "OK"},
+        {"booking_id": 13, "action": "reject", "owner_note": "Déjà pris", "proposals": [...]}
+      ]
+    }
+    -> {"results": [{"booking_id": 12, "ok": true, "status": "awaiting_payment"}, ...], "approved": 1, "rejected": 1}
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @idempotent
+    def post(self, request):
+        serializer = BookingBulkDecisionSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            results = serializer.save()
+
+            # ✅ notifs clients (outbox, 1 seul INSERT, même transaction)
+            enqueue_push_many(
+                [
+                    (
+                        b.user_id,
+                        "Réservation acceptée",
+                        "Le gérant a validé ta demande. Tu peux payer l'acompte.",
+                        {"type": "booking_approved", "booking_id": b.id, "url": f"/bookings/{b.id}"},
+                    )
+                    for b in serializer.approved
+                ]
+                + [
+                    (
+                        b.user_id,
+                        "Réservation refusée",
+                        "Le gérant a indiqué que ce n'est pas disponible.",
+                        {"type": "booking_rejected", "booking_id": b.id},
+                    )
+                    for b in serializer.rejected
+                ]
+            )
+
+        return Response(
+            {"results": results, "approved": len(serializer.approved), "rejected": len(serializer.rejected)},
+            status=status.HTTP_200_OK,
+        )
+
+
 class BookingPaymentInfoView(APIView):
     """
     ✅ Client: récupérer les montants et savoir si le bouton payer doit s’afficher
@@ -622,6 +922,146 @@ class BookingPaymentInfoView(APIView):
 # ✅ PAYSTACK — initialize / verify / webhook
 # =========================================================
 
+def _key_code_expiry(booking: Booking):
+    # ✅ expiration: 2 jours après start_date si présent, sinon 48h from now
+    if booking.start_date:
+        return timezone.make_aware(
+            timezone.datetime.combine(booking.start_date, timezone.datetime.min.time())
+        ) + timezone.timedelta(days=2)  #  CHANGE: 2 jours
+    return timezone.now() + timezone.timedelta(hours=48)
+
+
+def _paid_fields(booking: Booking, owner_id: int, code: str) -> dict:
+    return {
+        "escrow_amount": int(booking.deposit_amount),
+        "key_code_hash": hash_key_code(owner_id, code),
+        "key_code_encrypted": encrypt_key_code(code),
+        "key_code_expires_at": _key_code_expiry(booking),
+    }
+
+
+def _transition_paid(booking: Booking, owner_id: int, from_statuses=None) -> bool:
+    for attempt in range(5):
+        # ✅ code clé 6 chiffres: stocké haché (validation gérant, index unique sur les codes actifs)
+        # + chiffré (le client le relit via my-key-code), jamais en clair
+        code = generate_6_digit_code()
+        try:
+            return transition(booking, "paid", from_statuses, **_paid_fields(booking, owner_id, code))
+        except IntegrityError:
+            # ✅ même code déjà actif chez ce gérant (rare): on en tire un autre
+            if attempt == 4:
+                raise
+
+
+# statuts où un paiement qui arrive en retard ne correspond plus à une réservation active
+LATE_PAYMENT_STATUSES = ("expired", "cancelled", "rejected")
+
+
+def _handle_late_payment(booking: Booking, owner_id: int) -> str:
+    """
+    ✅ Paiement confirmé sur un booking expiré / annulé (page Paystack encore ouverte au moment du sweep)
+    - expiré + dates toujours libres -> booking "ressuscité" en paid (code clé + notif normale)
+    - sinon -> litige "late_payment_refund" (urgent) + audit + notif client: l'admin rembourse
+    -> "paid" | "already_paid" | "refund_required"
+    """
+    current = Booking.objects.filter(id=booking.id).values_list("status", flat=True).first()
+    if current not in LATE_PAYMENT_STATUSES:
+        return "already_paid"
+
+    if current == "expired" and booking.start_date and booking.end_date:
+        # ✅ même verrou que la validation gérant: pas de double réservation pendant la reprise
+        Listing.objects.select_for_update().filter(id=booking.listing_id).values_list("id", flat=True).first()
+        if is_listing_available(booking.listing_id, booking.start_date, booking.end_date, exclude_booking_id=booking.id):
+            booking.status = current  # ✅ état réel: l'index d'occupation voit les dates re-bloquées
+            if _transition_paid(booking, owner_id, from_statuses=("expired",)):
+                audit(None, "BOOKING_REVIVED_LATE_PAYMENT", booking, {"previous_status": current})
+                return "paid"
+
+    dispute, created = Dispute.objects.get_or_create(
+        booking=booking,
+        category="late_payment_refund",
+        defaults={
+            "opened_by": booking.user,
+            "priority": "urgent",
+            "title": "Paiement reçu sur une réservation inactive",
+            "description": (
+                f"Acompte payé alors que la réservation était '{current}'. "
+                f"Dates non confirmées: rembourser {booking.amount_to_pay or booking.deposit_amount} FCFA."
+            ),
+        },
+    )
+    if created:
+        audit(None, "LATE_PAYMENT_REFUND_REQUIRED", booking, {"status": current, "dispute_id": dispute.id})
+        enqueue_push(
+            booking.user,
+            title="Paiement reçu",
+            body="Ta réservation n'était plus active: ton acompte va être remboursé.",
+            data={"type": "booking_refund_pending", "booking_id": booking.id},
+        )
+        logger.warning("PAYSTACK late payment booking=%s status=%s -> refund", booking.id, current)
+    return "refund_required"
+
+
+def confirm_booking_payment(booking: Booking) -> str:
+    """
+    ✅ Paiement confirmé (verify OU webhook): booking -> paid + escrow + code clé
+    - compare-and-set: si verify et webhook arrivent en même temps, un seul gagne
+      -> un seul code généré, une seule notif
+    - booking expiré/annulé entre-temps: voir _handle_late_payment
+    -> "paid" | "already_paid" | "refund_required"
+    """
+    owner_id = booking.listing.author_id
+    with transaction.atomic():
+        if not _transition_paid(booking, owner_id):
+            return _handle_late_payment(booking, owner_id)
+
+        # ✅ notif au client (code affiché côté front via endpoint code)
+        enqueue_push(
+            booking.user,
+            title="Paiement confirmé",
+            body="Ton acompte est payé. Tu peux récupérer ton code de remise.",
+            data={"type": "booking_paid", "booking_id": booking.id},
+        )
+    return "paid"
+
+
+# statuts Paystack définitifs côté échec (ongoing / pending / processing / queued: on attend)
+PAYSTACK_FAILED_STATUSES = ("failed", "abandoned", "reversed")
+
+
+def settle_paystack_transaction(tx: PaymentTransaction, resp: dict) -> str:
+    """
+    ✅ Applique une réponse Paystack verify à une transaction (verify client + réconciliation)
+    -> "paid" | "already_paid" | "refund_required" | "failed" | "pending"
+    Idempotent: même chemin que le webhook (compare-and-set sur tx puis booking)
+    """
+    pay_status = (resp.get("data") or {}).get("status")
+    fields = payment_archive.summary_fields(resp)  # ✅ réponse complète -> archive compressée
+
+    if pay_status == "success":
+        with transaction.atomic():
+            changed = PaymentTransaction.objects.filter(id=tx.id).exclude(status="success").update(
+                status="success", updated_at=timezone.now(), **fields,
+            )
+            if changed:
+                payment_archive.archive(tx.id, "verify", resp)
+            tx.status = "success"
+            return confirm_booking_payment(tx.booking)
+
+    if pay_status in PAYSTACK_FAILED_STATUSES:
+        with transaction.atomic():
+            if PaymentTransaction.objects.filter(id=tx.id, status="initiated").update(
+                status="failed", updated_at=timezone.now(), **fields,
+            ):
+                payment_archive.archive(tx.id, "verify", resp)
+        tx.status = "failed"
+        return "failed"
+
+    if fields:
+        PaymentTransaction.objects.filter(id=tx.id, status="initiated").update(**fields)
+    return "pending"
+
+
 class PaystackInitializeView(APIView):
     """
     ✅ Client: init paiement acompte
@@ -629,6 +1069,7 @@ class PaystackInitializeView(APIView):
     """
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request, booking_id: int):
         booking = get_object_or_404(Booking, id=booking_id)
 
@@ -638,15 +1079,71 @@ class PaystackInitializeView(APIView):
         if booking.status != "awaiting_payment":
             return Response({"detail": "Paiement non disponible pour ce statut."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # ✅ créer transaction
-        reference = generate_reference("pay")
-        tx = PaymentTransaction.objects.create(
-            booking=booking,
-            provider="paystack",
-            reference=reference,
-            status="initiated",
-            amount=int(booking.amount_to_pay),
-        )
+        amount = int(booking.amount_to_pay)
+        now = timezone.now()
+
+        with transaction.atomic():
+            # ✅ verrou booking: 2 clics simultanés ne créent pas 2 transactions
+            # + statut relu sous verrou: le sweep d'expiration a pu passer depuis la lecture ci-dessus
+            locked_status = (
+                Booking.objects.select_for_update().filter(id=booking.id).values_list("status", flat=True).first()
+            )
+            if locked_status != "awaiting_payment":
+                return Response({"detail": "Paiement non disponible pour ce statut."}, status=status.HTTP_400_BAD_REQUEST)
+            attempts = PaymentTransaction.objects.filter(booking=booking, provider="paystack")
+
+            # ✅ page Paystack encore valide pour ce montant -> on la renvoie, pas d'appel sortant
+            reusable = (
+                attempts
+                .filter(
+                    status="initiated",
+                    amount=amount,
+                    authorization_url__isnull=False,
+                    authorization_expires_at__gt=now,
+                )
+                .order_by("-created_at")
+                .first()
+            )
+            if reusable:
+                return Response(
+                    {
+                        "authorization_url": reusable.authorization_url,
+                        "reference": reusable.reference,
+                        "transaction": PaymentTransactionSerializer(reusable).data,
+                        "reused": True,
+                    },
+                    status=status.HTTP_200_OK
+                )
+
+            # ✅ initialize d'un autre clic encore en cours
+            if attempts.filter(
+                status="initiated", authorization_url__isnull=True, created_at__gt=now - timedelta(seconds=30),
+            ).exists():
+                return Response(
+                    {"detail": "Paiement déjà en cours d'initialisation."},
+                    status=status.HTTP_409_CONFLICT,
+                    headers={"Retry-After": "2"},
+                )
+
+            # ✅ plafond = pages Paystack réellement ouvertes sur la fenêtre récente
+            # (un initialize en échec / une panne Paystack ne bloque pas le paiement pour toujours)
+            max_attempts = int(getattr(settings, "PAYSTACK_MAX_INIT_ATTEMPTS_PER_BOOKING", 5))
+            window = timedelta(minutes=int(getattr(settings, "PAYSTACK_INIT_ATTEMPTS_WINDOW_MINUTES", 60)))
+            if attempts.filter(authorization_url__isnull=False, created_at__gt=now - window).count() >= max_attempts:
+                return Response(
+                    {"detail": "Trop de tentatives de paiement pour cette réservation. Contacte le support."},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                )
+
+            # ✅ créer transaction
+            reference = generate_reference("pay")
+            tx = PaymentTransaction.objects.create(
+                booking=booking,
+                provider="paystack",
+                reference=reference,
+                status="initiated",
+                amount=amount,
+            )
 
         # ✅ callback_url optionnel (ex: front url)
         callback_url = getattr(settings, "PAYSTACK_CALLBACK_URL", None)
@@ -657,7 +1154,7 @@ class PaystackInitializeView(APIView):
         try:
             resp = paystack_initialize(
     email=user_email,
-    amount_cfa=int(booking.amount_to_pay) * 100,  # ✅ FIX PAYSTACK
+    amount_cfa=amount * 100,  # ✅ FIX PAYSTACK
     reference=reference,
     callback_url=callback_url,
     metadata={"booking_id": booking.id},
@@ -667,11 +1164,18 @@ class PaystackInitializeView(APIView):
             # Paystack data.authorization_url
             auth_url = (resp.get("data") or {}).get("authorization_url")
 
+            ttl = int(getattr(settings, "PAYSTACK_AUTHORIZATION_TTL_MINUTES", 30))
+            tx.authorization_url = auth_url
+            tx.authorization_expires_at = timezone.now() + timedelta(minutes=ttl) if auth_url else None
+            tx.save(update_fields=["authorization_url", "authorization_expires_at", "updated_at"])
+            payment_archive.archive(tx.id, "initialize", resp)
+
             return Response(
                 {
                     "authorization_url": auth_url,
                     "reference": reference,
                     "transaction": PaymentTransactionSerializer(tx).data,
+                    "reused": False,
                 },
                 status=status.HTTP_200_OK
             )
@@ -679,8 +1183,8 @@ class PaystackInitializeView(APIView):
         except Exception as e:
             logger.exception("PAYSTACK init failed: %s", str(e))
             tx.status = "failed"
-            tx.raw = {"error": str(e)}
-            tx.save()
+            tx.save(update_fields=["status", "updated_at"])
+            payment_archive.archive(tx.id, "error", {"error": str(e)})
             return Response({"detail": "Paystack init failed", "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -698,83 +1202,52 @@ class PaystackVerifyView(APIView):
             return Response({"detail": "reference requis"}, status=status.HTTP_400_BAD_REQUEST)
 
         tx = get_object_or_404(PaymentTransaction, reference=reference, provider="paystack")
-        if tx.status == "success":
-                    return Response(
-                        {"detail": "payment already verified", "booking_id": booking.id},
-                        status=status.HTTP_200_OK
-                    )
         booking = tx.booking
 
         # ✅ sécurité: le client doit être le propriétaire de la réservation
         if booking.user_id != request.user.id:
             return Response({"detail": "Non autorisé."}, status=status.HTTP_403_FORBIDDEN)
 
+        if tx.status == "success":
+            return Response(
+                {"detail": "payment already verified", "booking_id": booking.id},
+                status=status.HTTP_200_OK
+            )
+
         try:
             resp = paystack_verify(reference)
-            tx.raw = resp
-
-            data = resp.get("data") or {}
-            pay_status = data.get("status")
-
-            if pay_status == "success":
-                tx.status = "success"
-                
-
-                tx.save()
-
-                # ✅ marquer booking paid + escrow + générer code
-                if booking.status in ["awaiting_payment", "approved"]:  # approved ne devrait pas arriver mais safe
-                    booking.status = "paid"
-                    booking.escrow_amount = int(booking.deposit_amount)
-
-                    # ✅ code clé 6 chiffres hashé
-                    # ✅ code clé 6 chiffres (MVP: stocké en clair)
-                    code = generate_6_digit_code()
-                    booking.key_code = code  #  CHANGE
-
-                    # ✅ expiration: 2 jours après start_date si présent, sinon 48h from now
-                    if booking.start_date:
-                        booking.key_code_expires_at = timezone.make_aware(
-                            timezone.datetime.combine(booking.start_date, timezone.datetime.min.time())
-                        ) + timezone.timedelta(days=2)  #  CHANGE: 2 jours
-                    else:
-                        booking.key_code_expires_at = timezone.now() + timezone.timedelta(hours=48)
-
-                    booking.save()
-
-                    # ✅ notif au client (code affiché côté front via endpoint code)
-                    send_push_to_user(
-                        booking.user,
-                        title="Paiement confirmé",
-                        body="Ton acompte est payé. Tu peux récupérer ton code de remise.",
-                        data={"type": "booking_paid", "booking_id": booking.id},
-                    )
+        except Exception as e:
+            logger.exception("PAYSTACK verify failed: %s", str(e))
+            return Response({"detail": "verify failed", "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-                    return Response(
-                        {
-                            "detail": "payment verified",
-                            "booking_id": booking.id,
-                            # ⚠️ IMPORTANT:
-                            # On renvoie le code ici UNIQUEMENT si tu veux l'afficher direct.
-                            # Sinon on met un endpoint dédié "my-code".
-                            "key_code": code,
-                            "expires_at": booking.key_code_expires_at,
-                        },
-                        status=status.HTTP_200_OK
-                    )
+        # ✅ marquer booking paid + escrow + générer code (une seule fois, verify / webhook / réconciliation)
+        outcome = settle_paystack_transaction(tx, resp)
 
-                return Response({"detail": "payment already processed"}, status=status.HTTP_200_OK)
+        if outcome == "paid":
+            return Response(
+                {
+                    "detail": "payment verified",
+                    "booking_id": booking.id,
+                    # ⚠️ IMPORTANT:
+                    # On renvoie le code ici UNIQUEMENT si tu veux l'afficher direct.
+                    # Sinon on met un endpoint dédié "my-code".
+                    "key_code": decrypt_key_code(booking.key_code_encrypted),
+                    "expires_at": booking.key_code_expires_at,
+                },
+                status=status.HTTP_200_OK
+            )
 
-            tx.status = "failed"
-            tx.save()
-            return Response({"detail": "payment not successful", "paystack_status": pay_status}, status=status.HTTP_400_BAD_REQUEST)
+        if outcome == "already_paid":
+            return Response({"detail": "payment already processed"}, status=status.HTTP_200_OK)
 
-        except Exception as e:
-            logger.exception("PAYSTACK verify failed: %s", str(e))
-            tx.status = "failed"
-            tx.raw = {"error": str(e)}
-            tx.save()
-            return Response({"detail": "verify failed", "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if outcome == "refund_required":
+            return Response(
+                {"detail": "payment received but booking is no longer active: refund pending", "booking_id": booking.id},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        pay_status = (resp.get("data") or {}).get("status")
+        return Response({"detail": "payment not successful", "paystack_status": pay_status}, status=status.HTTP_400_BAD_REQUEST)
 
 
 class PaystackWebhookView(APIView):
@@ -782,12 +1255,14 @@ class PaystackWebhookView(APIView):
     ✅ Webhook Paystack (source of truth)
     POST /payments/paystack/webhook/
     - Vérifier x-paystack-signature (HMAC SHA512)
-    - Mettre à jour transaction + booking
+    - Stocker l'événement (inbox, dédupliqué) et répondre 200 tout de suite
+    - transaction + booking + code clé + push: manage.py paystack_webhook_worker
     """
     authentication_classes = []
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
+        started = time.monotonic()
         secret = getattr(settings, "PAYSTACK_SECRET_KEY", "")
         signature = request.META.get("HTTP_X_PAYSTACK_SIGNATURE", "")
 
@@ -798,59 +1273,24 @@ class PaystackWebhookView(APIView):
             return Response({"detail": "invalid signature"}, status=status.HTTP_400_BAD_REQUEST)
 
         payload = request.data or {}
-        event = payload.get("event")
-        data = payload.get("data") or {}
-        reference = data.get("reference")
-
-        logger.warning("PAYSTACK webhook event=%s ref=%s", event, reference)
-
-        if not reference:
-            return Response({"detail": "no reference"}, status=status.HTTP_200_OK)
+        if not isinstance(payload, dict):
+            return Response({"detail": "invalid payload"}, status=status.HTTP_200_OK)
 
         try:
-            tx = PaymentTransaction.objects.filter(reference=reference, provider="paystack").first()
-            if not tx:
-                return Response({"detail": "tx not found"}, status=status.HTTP_200_OK)
-
-            tx.raw = payload
-
-            if event == "charge.success":
-                tx.status = "success"
-                tx.save()
-
-                booking = tx.booking
-                if booking.status != "paid" and booking.status == "awaiting_payment":
-                    booking.status = "paid"
-                    booking.escrow_amount = int(booking.deposit_amount)
-                    code = generate_6_digit_code()
-                    booking.key_code = code  # ✅ CHANGE
-
-                    # ✅ expiration: 2 jours après start_date si présent, sinon 48h
-                    if booking.start_date:
-                        booking.key_code_expires_at = timezone.make_aware(
-                            timezone.datetime.combine(booking.start_date, timezone.datetime.min.time())
-                        ) + timezone.timedelta(days=2)
-                    else:
-                        booking.key_code_expires_at = timezone.now() + timezone.timedelta(hours=48)
-                    booking.save()
-
-                    # ✅ notif client
-                    send_push_to_user(
-                        booking.user,
-                        title="Paiement confirmé",
-                        body="Ton acompte est payé. Tu peux récupérer ton code de remise.",
-                        data={"type": "booking_paid", "booking_id": booking.id},
-                    )
-
-            else:
-                # autres events: mark failed si besoin
-                tx.save()
-
-            return Response({"ok": True}, status=status.HTTP_200_OK)
-
+            row, created = paystack_inbox.store_event(
+                payload, raw_body, receive_ms=int((time.monotonic() - started) * 1000),
+            )
         except Exception as e:
-            logger.exception("PAYSTACK webhook error: %s", str(e))
-            return Response({"ok": True}, status=status.HTTP_200_OK)
+            # ✅ pas stocké: on laisse Paystack renvoyer
+            logger.exception("PAYSTACK webhook store error: %s", str(e))
+            return Response({"detail": "retry"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        logger.info(
+            "PAYSTACK webhook event=%s ref=%s %s in %.1fms",
+            payload.get("event"), (payload.get("data") or {}).get("reference"),
+            "stored" if created else "duplicate", (time.monotonic() - started) * 1000,
+        )
+        return Response({"ok": True, "duplicate": not created}, status=status.HTTP_200_OK)
 
 
 # =========================================================
@@ -865,18 +1305,24 @@ class OwnerValidateKeyView(APIView):
     """
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         serializer = BookingValidateKeySerializer(data=request.data, context={"request": request})
         serializer.is_valid(raise_exception=True)
-        booking = serializer.save()
 
-        # ✅ notif client
-        send_push_to_user(
-            booking.user,
-            title="Check-in validé",
-            body="Le gérant a validé ton arrivée.",
-            data={"type": "checked_in", "booking_id": booking.id},
-        )
+        with transaction.atomic():
+            booking = serializer.save()  # ✅ lève une erreur si la transition a perdu
+
+            # ✅ payout à verser au gérant (une seule fois: seulement si on a gagné la transition)
+            ensure_payout_for_booking(booking, actor=request.user)
+
+            # ✅ notif client
+            enqueue_push(
+                booking.user,
+                title="Check-in validé",
+                body="Le gérant a validé ton arrivée.",
+                data={"type": "checked_in", "booking_id": booking.id},
+            )
 
         return Response(BookingPublicSerializer(booking).data, status=status.HTTP_200_OK)
 
@@ -897,14 +1343,15 @@ class MyKeyCodeView(APIView):
         if booking.status != "paid":
             return Response({"detail": "Code indisponible pour ce statut."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if not booking.key_code or not booking.key_code_expires_at:
+        code = decrypt_key_code(booking.key_code_encrypted)
+        if not code or not booking.key_code_expires_at:
             return Response({"detail": "Code non généré."}, status=status.HTTP_400_BAD_REQUEST)
 
         if booking.key_code_expires_at < timezone.now():
             return Response({"detail": "Code expiré."}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response(
-            {"code": booking.key_code, "expires_at": booking.key_code_expires_at},
+            {"code": code, "expires_at": booking.key_code_expires_at},
             status=status.HTTP_200_OK
         )
 
@@ -917,7 +1364,7 @@ class AdminReleaseBookingView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def post(self, request, booking_id: int):
-        booking = get_object_or_404(Booking, id=booking_id)
+        booking = get_object_or_404(booking_public_queryset(), id=booking_id)
 
         if booking.status != "checked_in":
             return Response({"detail": "Booking doit être CHECKED_IN."}, status=status.HTTP_400_BAD_REQUEST)
@@ -926,26 +1373,31 @@ class AdminReleaseBookingView(APIView):
         if not payout_ref.strip():
             return Response({"detail": "payout_reference requis."}, status=status.HTTP_400_BAD_REQUEST)
 
-        booking.payout_reference = payout_ref
-        booking.payout_status = "paid"
-        booking.released_at = timezone.now()
-        booking.status = "released"
-        booking.save()
-
-        # ✅ notif gérant + client
-        if booking.listing.author:
-            send_push_to_user(
-                booking.listing.author,
-                title="Reversement effectué",
-                body=f"Reversement OK pour booking #{booking.id}.",
+        with transaction.atomic():
+            won = transition(
+                booking,
+                "released",
+                payout_reference=payout_ref,
+                payout_status="paid",
+                released_at=timezone.now(),
+            )
+            if not won:
+                return Response({"detail": "Booking doit être CHECKED_IN."}, status=status.HTTP_400_BAD_REQUEST)
+
+            # ✅ notif gérant + client
+            if booking.listing.author:
+                enqueue_push(
+                    booking.listing.author,
+                    title="Reversement effectué",
+                    body=f"Reversement OK pour booking #{booking.id}.",
+                    data={"type": "released", "booking_id": booking.id},
+                )
+            enqueue_push(
+                booking.user,
+                title="Réservation terminée",
+                body="Reversement effectué au gérant. Merci !",
                 data={"type": "released", "booking_id": booking.id},
             )
-        send_push_to_user(
-            booking.user,
-            title="Réservation terminée",
-            body="Reversement effectué au gérant. Merci !",
-            data={"type": "released", "booking_id": booking.id},
-        )
 
         return Response(BookingPublicSerializer(booking).data, status=status.HTTP_200_OK)
 
@@ -1103,6 +1555,68 @@ class OwnerListingDeleteView(APIView):
         return Response({"detail": "Résidence supprimée."}, status=status.HTTP_204_NO_CONTENT)
 
 
+class OwnerExternalCalendarListCreateView(APIView):
+    """
+    ✅ Calendriers .ics externes d'une résidence du gérant
+    GET  /owners/me/listings/<listing_id>/external-calendars/
+    POST /owners/me/listings/<listing_id>/external-calendars/  {name, url}
+    -> import (1er puis périodiques) par le worker manage.py import_calendars --loop, jamais dans la requête
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def _listing(self, request, listing_id):
+        listing = get_object_or_404(Listing.objects.only("id", "author_id"), id=listing_id)
+        if listing.author_id != request.user.id:
+            return None
+        return listing
+
+    def get(self, request, listing_id: int):
+        listing = self._listing(request, listing_id)
+        if listing is None:
+            return Response({"detail": "Non autorisé."}, status=status.HTTP_403_FORBIDDEN)
+
+        qs = (
+            ExternalCalendar.objects
+            .filter(listing=listing)
+            .annotate(blocks_count=Count("blocks"))
+            .order_by("id")
+        )
+        return Response(ExternalCalendarSerializer(qs, many=True).data)
+
+    def post(self, request, listing_id: int):
+        listing = self._listing(request, listing_id)
+        if listing is None:
+            return Response({"detail": "Non autorisé."}, status=status.HTTP_403_FORBIDDEN)
+
+        ser = ExternalCalendarSerializer(data=request.data, context={"request": request, "listing": listing})
+        ser.is_valid(raise_exception=True)
+        calendar = ser.save(listing=listing)
+
+        # ✅ last_fetched_at=None: le worker le prend en priorité (ical.sync_new)
+        calendar.blocks_count = 0
+        return Response(ExternalCalendarSerializer(calendar).data, status=status.HTTP_201_CREATED)
+
+
+class OwnerExternalCalendarDeleteView(APIView):
+    """
+    ✅ DELETE /owners/me/external-calendars/<pk>/ -> libère les dates bloquées par ce calendrier
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def delete(self, request, pk: int):
+        calendar = get_object_or_404(ExternalCalendar.objects.select_related("listing"), pk=pk)
+        if calendar.listing.author_id != request.user.id:
+            return Response({"detail": "Non autorisé."}, status=status.HTTP_403_FORBIDDEN)
+
+        with transaction.atomic():
+            ranges = list(calendar.blocks.values_list("start_date", "end_date"))
+            listing_id = calendar.listing_id
+            calendar.delete()
+            occupancy.refresh_ranges(listing_id, ranges)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 # =========================================================
 # ✅ ADMIN DASHBOARD ENDPOINTS (paste at end of views.py)
 # =========================================================
@@ -1120,7 +1634,9 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework.parsers import JSONParser, FormParser, MultiPartParser
 from rest_framework.exceptions import ValidationError, PermissionDenied
 
-from .models import Booking, Listing, PaymentTransaction, Payout, Dispute, DisputeMessage, AuditLog
+from .models import (
+    Booking, Listing, PaymentTransaction, Payout, Dispute, DisputeMessage, AuditLog, DailyBookingRollup, BOOKING_STATUS,
+)
 from .permissions import IsAdminDashboard, IsSupportDashboard, IsPayoutManager
 
 # -------------------------
@@ -1305,72 +1821,88 @@ def _audit_card(a: AuditLog):
 # 1) METRICS
 # =========================================================
 
-class AdminMetricsView(APIView):
-    permission_classes = [IsAdminDashboard]
-    parser_classes = [JSONParser]
+ADMIN_METRICS_CACHE_KEY = "admin:metrics:v2"
+PAID_BOOKING_STATUSES = ("paid", "checked_in", "released")
 
-    def get(self, request):
-        now = timezone.now()
-        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        week_start = today_start - timezone.timedelta(days=7)
-        month_start = today_start - timezone.timedelta(days=30)
 
-        qs = Booking.objects.select_related("listing", "user", "listing__author")
+def _admin_metrics(now):
+    """
+    ✅ 4 requêtes au lieu de ~15: 1 agrégat conditionnel Booking, 1 Dispute, 1 Payout, 1 audit
+    """
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    periods = {
+        "today": today_start,
+        "last_7_days": today_start - timezone.timedelta(days=7),
+        "last_30_days": today_start - timezone.timedelta(days=30),
+    }
+    paid_q = Q(status__in=PAID_BOOKING_STATUSES)
 
-        # Count by status (global)
-        by_status = dict(
-            qs.values("status").annotate(c=Count("id")).values_list("status", "c")
-        )
+    booking_aggs = {f"status_{code}": Count("id", filter=Q(status=code)) for code, _ in BOOKING_STATUS}
+    booking_aggs.update(
+        total_deposit=Sum("deposit_amount", filter=paid_q),
+        total_commission=Sum("platform_commission", filter=paid_q),
+        total_payout=Sum("payout_amount", filter=paid_q),
+    )
+    dispute_aggs = {"open": Count("id", filter=Q(status__in=["open", "in_review"]))}
+    for name, start in periods.items():
+        booking_aggs[f"{name}_bookings"] = Count("id", filter=Q(created_at__gte=start))
+        booking_aggs[f"{name}_paid"] = Count("id", filter=Q(created_at__gte=start) & paid_q)
+        dispute_aggs[f"{name}_disputes"] = Count("id", filter=Q(created_at__gte=start))
 
-        # Money aggregates (only meaningful for paid/checked_in/released)
-        money_qs = qs.filter(status__in=["paid", "checked_in", "released"])
-        money = money_qs.aggregate(
-            total_deposit=Sum("deposit_amount"),
-            total_commission=Sum("platform_commission"),
-            total_payout=Sum("payout_amount"),
-        )
+    b = Booking.objects.aggregate(**booking_aggs)
+    d = Dispute.objects.aggregate(**dispute_aggs)
+    pending_payout_sum = Payout.objects.aggregate(s=Sum("amount", filter=Q(status="pending")))["s"] or 0
 
-        # Pending payout amount (based on Payout model if exists, else fallback)
-        pending_payout_sum = Payout.objects.filter(status="pending").aggregate(s=Sum("amount"))["s"] or 0
+    # Count by status (global) — seulement les statuts présents, comme l'ancien group-by
+    by_status = {code: b[f"status_{code}"] for code, _ in BOOKING_STATUS if b[f"status_{code}"]}
 
+    return {
+        "by_status": by_status,
+        "money": {
+            "total_deposit": b["total_deposit"] or 0,
+            "total_commission": b["total_commission"] or 0,
+            "total_payout": b["total_payout"] or 0,
+            "pending_payout": pending_payout_sum,
+        },
         # “Now to handle”
-        to_handle = {
-            "awaiting_owner_decision": qs.filter(status="requested").count(),
-            "awaiting_payment": qs.filter(status="approved").count(),
-            "awaiting_checkin": qs.filter(status="paid").count(),
-            "awaiting_payout": qs.filter(status="checked_in").count(),
-            "open_disputes": Dispute.objects.filter(status__in=["open", "in_review"]).count(),
-        }
-
-        # Recent activity (audit)
-        recent_audit = AuditLog.objects.all()[:20]
-        recent_audit = [_audit_card(a) for a in recent_audit]
-
+        "to_handle": {
+            "awaiting_owner_decision": b["status_requested"],
+            "awaiting_payment": b["status_approved"],
+            "awaiting_checkin": b["status_paid"],
+            "awaiting_payout": b["status_checked_in"],
+            "open_disputes": d["open"],
+        },
         # Trends by period
-        def period_counts(start):
-            q = qs.filter(created_at__gte=start)
-            return {
-                "bookings": q.count(),
-                "paid": q.filter(status__in=["paid", "checked_in", "released"]).count(),
-                "disputes": Dispute.objects.filter(created_at__gte=start).count(),
+        "periods": {
+            name: {
+                "bookings": b[f"{name}_bookings"],
+                "paid": b[f"{name}_paid"],
+                "disputes": d[f"{name}_disputes"],
             }
+            for name in periods
+        },
+        # Recent activity (audit)
+        "recent_activity": [_audit_card(a) for a in AuditLog.objects.all()[:20]],
+        "computed_at": now,
+    }
 
-        data = {
-            "by_status": by_status,
-            "money": {
-                "total_deposit": money["total_deposit"] or 0,
-                "total_commission": money["total_commission"] or 0,
-                "total_payout": money["total_payout"] or 0,
-                "pending_payout": pending_payout_sum,
-            },
-            "to_handle": to_handle,
-            "periods": {
-                "today": period_counts(today_start),
-                "last_7_days": period_counts(week_start),
-                "last_30_days": period_counts(month_start),
-            },
-            "recent_activity": recent_audit,
-        }
+
+class AdminMetricsView(APIView):
+    """
+    ✅ Dashboard admin (rafraîchi automatiquement): résultat en cache ADMIN_METRICS_CACHE_SECONDS
+    - computed_at = date du calcul (le front peut afficher "mis à jour il y a Xs")
+    - ?fresh=1 -> recalcul immédiat
+    """
+    permission_classes = [IsAdminDashboard]
+    parser_classes = [JSONParser]
+
+    def get(self, request):
+        data = None
+        if request.query_params.get("fresh") not in ("1", "true"):
+            data = cache.get(ADMIN_METRICS_CACHE_KEY)
+        if data is None:
+            data = _admin_metrics(timezone.now())
+            cache.set(ADMIN_METRICS_CACHE_KEY, data, int(getattr(settings, "ADMIN_METRICS_CACHE_SECONDS", 30)))
         return Response(data)
 
 
@@ -1439,10 +1971,16 @@ class AdminBookingDetailView(APIView):
         # Payment transactions (if you store them)
         payments = list(
             PaymentTransaction.objects.filter(booking=booking).order_by("-created_at").values(
-                "id", "provider", "reference", "amount", "status", "created_at"
+                "id", "provider", "reference", "amount", "status",
+                "paystack_status", "gateway_response", "channel", "paid_at", "created_at",
             )
         )
 
+        # ✅ réponses Paystack brutes: seulement si demandées (?include_payloads=1)
+        if request.query_params.get("include_payloads") in ("1", "true"):
+            for p in payments:
+                p["payloads"] = payment_archive.payloads_for(p["id"])
+
         # Payout
         payout = None
         try:
@@ -1485,19 +2023,25 @@ class AdminBookingOverrideStatusView(APIView):
             raise ValidationError({"status": "Statut invalide."})
 
         old = booking.status
-        booking.status = new_status
 
         # minimal timestamp upkeep
+        fields = {}
         if new_status == "checked_in" and not booking.checked_in_at:
-            booking.checked_in_at = timezone.now()
+            fields["checked_in_at"] = timezone.now()
         if new_status == "released" and not booking.released_at:
-            booking.released_at = timezone.now()
+            fields["released_at"] = timezone.now()
 
-        booking.save()
+        # compare-and-set on the status we just read (override may skip steps, not race)
+        with transaction.atomic():
+            if not transition(booking, new_status, from_statuses=[old], **fields):
+                return Response(
+                    {"detail": "Le statut a changé entre-temps, rechargez la réservation."},
+                    status=status.HTTP_409_CONFLICT,
+                )
 
-        # Ensure payout if checked_in
-        if new_status == "checked_in":
-            ensure_payout_for_booking(booking, actor=request.user)
+            # Ensure payout if checked_in
+            if new_status == "checked_in":
+                ensure_payout_for_booking(booking, actor=request.user)
 
         audit(
             request.user,
@@ -1562,22 +2106,24 @@ class AdminPayoutMarkPaidView(APIView):
             raise ValidationError({"reference": "Référence requise (preuve / id transfert)."})
 
 
-        payout.status = "paid"
-        payout.reference = reference
-        payout.processed_by = request.user
-        payout.processed_at = timezone.now()
-        payout.save()
+        # compare-and-set: two managers clicking at once -> only one marks it paid
+        now = timezone.now()
+        won = (
+            Payout.objects
+            .filter(id=payout.id)
+            .exclude(status="paid")
+            .update(status="paid", reference=reference, processed_by=request.user, processed_at=now)
+        )
+        if not won:
+            return Response({"detail": "Déjà payé."}, status=200)
+        payout.status, payout.reference, payout.processed_by, payout.processed_at = "paid", reference, request.user, now
 
         # Update booking payout status too (if you keep that field)
         booking = payout.booking
-        try:
-            booking.payout_status = "paid"
-            booking.released_at = booking.released_at or timezone.now()
-            if booking.status != "released":
-                booking.status = "released"
-            booking.save()
-        except Exception:
-            pass
+        released_at = booking.released_at or now
+        if not transition(booking, "released", payout_status="paid", released_at=released_at):
+            Booking.objects.filter(id=booking.id).update(payout_status="paid", released_at=released_at)
+            rollups.refresh_for_booking(booking)  # ✅ payout pending -> paid (pas de signal sur .update())
 
         audit(request.user, "PAYOUT_MARKED_PAID", payout, {"reference": reference})
         return Response({"detail": "Reversement marqué payé.", "payout": _payout_card(payout)})
@@ -1775,6 +2321,15 @@ class AdminAuditLogListView(generics.ListAPIView):
 # 6) STATS
 # =========================================================
 
+def _apply_day_filter(qs, date_from, date_to):
+    """✅ Même période que _apply_date_filter, sur DailyBookingRollup.day (date_to déjà exclusif)."""
+    if date_from:
+        qs = qs.filter(day__gte=timezone.localtime(date_from).date())
+    if date_to:
+        qs = qs.filter(day__lt=timezone.localtime(date_to).date())
+    return qs
+
+
 class AdminStatsOwnerEarningsView(APIView):
     """
     ✅ Gains par gérant, période filtrable.
@@ -1783,6 +2338,7 @@ class AdminStatsOwnerEarningsView(APIView):
     - commission plateforme
     - payout gérant (payout_amount)
     - top listings du gérant
+    Lu depuis DailyBookingRollup (jour x résidence), pas depuis les bookings.
     """
     permission_classes = [IsAdminDashboard]
     parser_classes = [JSONParser]
@@ -1790,12 +2346,11 @@ class AdminStatsOwnerEarningsView(APIView):
     def get(self, request):
         date_from, date_to = _date_range_from_params(request)
 
-        qs = Booking.objects.filter(status__in=["paid", "checked_in", "released"]).select_related("listing", "listing__author")
-        qs = _apply_date_filter(qs, "created_at", date_from, date_to)
+        qs = _apply_day_filter(DailyBookingRollup.objects.all(), date_from, date_to)
 
         owner_id = request.query_params.get("owner")
         if owner_id:
-            qs = qs.filter(listing__author_id=owner_id)
+            qs = qs.filter(owner_id=owner_id)
 
         listing_id = request.query_params.get("listing")
         if listing_id:
@@ -1804,19 +2359,19 @@ class AdminStatsOwnerEarningsView(APIView):
         # Group by owner
         rows = (
             qs.values(
-                "listing__author_id",
-                "listing__author__full_name",
-                "listing__author__email",
-                "listing__author__phone",
+                "owner_id",
+                "owner__full_name",
+                "owner__email",
+                "owner__phone",
             )
             .annotate(
-                bookings=Count("id"),
-                total_deposit=Sum("deposit_amount"),
-                total_commission=Sum("platform_commission"),
-                total_payout=Sum("payout_amount"),
-                last_booking=Max("created_at"),
+                total_bookings=Sum("bookings"),
+                sum_deposit=Sum("total_deposit"),
+                sum_commission=Sum("total_commission"),
+                sum_payout=Sum("total_payout"),
+                last_booking=Max("last_booking_at"),
             )
-            .order_by("-total_payout", "-bookings")
+            .order_by("-sum_payout", "-total_bookings")
         )
 
         # Optional: top listings per owner (small)
@@ -1824,29 +2379,39 @@ class AdminStatsOwnerEarningsView(APIView):
         owners = []
         for r in rows[:500]:
             item = {
-                "owner_id": r["listing__author_id"],
-                "owner_full_name": r["listing__author__full_name"],
-                "owner_email": r["listing__author__email"],
-                "owner_phone": r["listing__author__phone"],
-                "bookings": r["bookings"] or 0,
-                "total_deposit": r["total_deposit"] or 0,
-                "total_commission": r["total_commission"] or 0,
-                "total_payout": r["total_payout"] or 0,
+                "owner_id": r["owner_id"],
+                "owner_full_name": r["owner__full_name"],
+                "owner_email": r["owner__email"],
+                "owner_phone": r["owner__phone"],
+                "bookings": r["total_bookings"] or 0,
+                "total_deposit": r["sum_deposit"] or 0,
+                "total_commission": r["sum_commission"] or 0,
+                "total_payout": r["sum_payout"] or 0,
                 "last_booking": r["last_booking"],
             }
 
             if include_listings and item["owner_id"]:
                 top = (
-                    qs.filter(listing__author_id=item["owner_id"])
+                    qs.filter(owner_id=item["owner_id"])
                     .values("listing_id", "listing__title", "listing__city")
                     .annotate(
-                        bookings=Count("id"),
-                        total_payout=Sum("payout_amount"),
-                        total_deposit=Sum("deposit_amount"),
+                        total_bookings=Sum("bookings"),
+                        sum_payout=Sum("total_payout"),
+                        sum_deposit=Sum("total_deposit"),
                     )
-                    .order_by("-bookings", "-total_payout")[:10]
+                    .order_by("-total_bookings", "-sum_payout")[:10]
                 )
-                item["top_listings"] = list(top)
+                item["top_listings"] = [
+                    {
+                        "listing_id": t["listing_id"],
+                        "listing__title": t["listing__title"],
+                        "listing__city": t["listing__city"],
+                        "bookings": t["total_bookings"] or 0,
+                        "total_payout": t["sum_payout"] or 0,
+                        "total_deposit": t["sum_deposit"] or 0,
+                    }
+                    for t in top
+                ]
 
             owners.append(item)
 
@@ -1867,6 +2432,7 @@ class AdminStatsTopListingsView(APIView):
     - montant total encaissé
     - payout gérant
     - commission plateforme
+    Lu depuis DailyBookingRollup (jour x résidence), pas depuis les bookings.
     """
     permission_classes = [IsAdminDashboard]
     parser_classes = [JSONParser]
@@ -1876,8 +2442,7 @@ class AdminStatsTopListingsView(APIView):
         limit = int(request.query_params.get("limit") or 10)
         limit = max(1, min(limit, 100))
 
-        qs = Booking.objects.filter(status__in=["paid", "checked_in", "released"]).select_related("listing", "listing__author")
-        qs = _apply_date_filter(qs, "created_at", date_from, date_to)
+        qs = _apply_day_filter(DailyBookingRollup.objects.all(), date_from, date_to)
 
         city = request.query_params.get("city")
         if city:
@@ -1892,20 +2457,35 @@ class AdminStatsTopListingsView(APIView):
                 "listing__author__full_name",
             )
             .annotate(
-                bookings=Count("id"),
-                total_deposit=Sum("deposit_amount"),
-                total_commission=Sum("platform_commission"),
-                total_payout=Sum("payout_amount"),
+                total_bookings=Sum("bookings"),
+                sum_deposit=Sum("total_deposit"),
+                sum_commission=Sum("total_commission"),
+                sum_payout=Sum("total_payout"),
             )
-            .order_by("-bookings", "-total_deposit")[:limit]
+            .order_by("-total_bookings", "-sum_deposit")[:limit]
         )
 
+        results = [
+            {
+                "listing_id": r["listing_id"],
+                "listing__title": r["listing__title"],
+                "listing__city": r["listing__city"],
+                "listing__author_id": r["listing__author_id"],
+                "listing__author__full_name": r["listing__author__full_name"],
+                "bookings": r["total_bookings"] or 0,
+                "total_deposit": r["sum_deposit"] or 0,
+                "total_commission": r["sum_commission"] or 0,
+                "total_payout": r["sum_payout"] or 0,
+            }
+            for r in rows
+        ]
+
         return Response(
             {
                 "date_from": request.query_params.get("date_from"),
                 "date_to": request.query_params.get("date_to"),
                 "limit": limit,
-                "results": list(rows),
+                "results": results,
             }
         )
 
@@ -1917,6 +2497,7 @@ class AdminStatsPlatformProfitView(APIView):
     - total commission (bénéfice brut plateforme)
     - total payouts gérants
     - pending payouts (via Payout model)
+    Lu depuis DailyBookingRollup (jour x résidence), pas depuis les bookings.
     """
     permission_classes = [IsAdminDashboard]
     parser_classes = [JSONParser]
@@ -1924,23 +2505,17 @@ class AdminStatsPlatformProfitView(APIView):
     def get(self, request):
         date_from, date_to = _date_range_from_params(request)
 
-        qs = Booking.objects.filter(status__in=["paid", "checked_in", "released"])
-        qs = _apply_date_filter(qs, "created_at", date_from, date_to)
+        qs = _apply_day_filter(DailyBookingRollup.objects.all(), date_from, date_to)
 
         agg = qs.aggregate(
-            total_deposit=Sum("deposit_amount"),
-            total_commission=Sum("platform_commission"),
-            total_payout=Sum("payout_amount"),
-            bookings=Count("id"),
+            total_deposit=Sum("total_deposit"),
+            total_commission=Sum("total_commission"),
+            total_payout=Sum("total_payout"),
+            bookings=Sum("bookings"),
+            pending_payout=Sum("pending_payout"),
+            paid_payout=Sum("paid_payout"),
         )
 
-        # Pending payouts in same date range (optional)
-        payout_qs = Payout.objects.all().select_related("booking")
-        if date_from or date_to:
-            payout_qs = payout_qs.filter(booking__in=qs.values("id"))
-        pending_payout = payout_qs.filter(status="pending").aggregate(s=Sum("amount"))["s"] or 0
-        paid_payout = payout_qs.filter(status="paid").aggregate(s=Sum("amount"))["s"] or 0
-
         return Response(
             {
                 "date_from": request.query_params.get("date_from"),
@@ -1949,7 +2524,39 @@ class AdminStatsPlatformProfitView(APIView):
                 "total_deposit": agg["total_deposit"] or 0,
                 "platform_profit_commission": agg["total_commission"] or 0,
                 "total_payout_to_owners": agg["total_payout"] or 0,
-                "pending_payout": pending_payout,
-                "paid_payout": paid_payout,
+                "pending_payout": agg["pending_payout"] or 0,
+                "paid_payout": agg["paid_payout"] or 0,
+            }
+        )
+
+# =========================================================
+# 7) PUSH (métriques de livraison)
+# =========================================================
+
+from . import push_metrics
+
+
+class AdminPushMetricsView(APIView):
+    """
+    ✅ Compteurs + latences des envois push par service (fcm / apple / mozilla)
+    GET /admin/push/metrics/?hours=24
+    """
+    permission_classes = [IsAdminDashboard]
+    parser_classes = [JSONParser]
+
+    def get(self, request):
+        try:
+            hours = int(request.query_params.get("hours") or 24)
+        except (TypeError, ValueError):
+            raise ValidationError({"hours": "Entier attendu."})
+        hours = max(1, min(hours, 24 * 31))
+
+        since = timezone.now().replace(minute=0, second=0, microsecond=0) - timezone.timedelta(hours=hours - 1)
+        return Response(
+            {
+                "since": since,
+                "hours": hours,
+                "latency_buckets_ms": list(push_metrics.LATENCY_BUCKETS_MS),
+                "services": push_metrics.snapshot(since),
             }
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,88 @@
+#listings/workers.py
+import time
+import signal
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+# =========================================================
+# ✅ Files de travail en base (outbox push, inbox webhooks Paystack)
+# Lignes avec status / available_at / attempts:
+# - claim_due(): réserve un lot (SKIP LOCKED: plusieurs workers en parallèle),
+#   available_at repoussé = bail -> si le worker meurt, la ligne revient toute seule
+# - renew_lease(): juste avant de traiter UNE ligne, on reprend un bail complet;
+#   attempts sert de jeton: si un autre worker a repris la ligne (bail expiré pendant
+#   qu'on traitait les précédentes), attempts a bougé -> on la saute (pas de double envoi)
+# =========================================================
+
+def claim_due(model, batch_size: int, lease_seconds: int, related=()):
+    now = timezone.now()
+    with transaction.atomic():
+        qs = model.objects.select_for_update(skip_locked=True, of=("self",))
+        if related:
+            qs = qs.select_related(*related)
+        rows = list(qs.filter(status="pending", available_at__lte=now).order_by("available_at", "id")[:batch_size])
+        if rows:
+            model.objects.filter(id__in=[r.id for r in rows]).update(
+                available_at=now + timedelta(seconds=lease_seconds),
+                attempts=F("attempts") + 1,
+            )
+            for r in rows:
+                r.attempts += 1
+    return rows
+
+
+def renew_lease(row, lease_seconds: int) -> bool:
+    """
+    ✅ False: la ligne n'est plus à nous (reprise par un autre worker, ou déjà traitée)
+    """
+    return bool(
+        type(row).objects
+        .filter(id=row.id, status="pending", attempts=row.attempts)
+        .update(available_at=timezone.now() + timedelta(seconds=lease_seconds))
+    )
+
+
+# =========================================================
+# ✅ Boucle des commandes worker (push_worker, paystack_webhook_worker, import_calendars)
+# SIGTERM / SIGINT: on termine le lot en cours puis on sort proprement
+# =========================================================
+
+class WorkerLoop:
+    def __init__(self):
+        self.stopped = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+    def stop(self, *args):
+        self.stopped = True
+
+    def sleep(self, seconds: float, tick=None, every: float = None):
+        """
+        ✅ Pause interruptible (tranches de 1 s); tick() appelé toutes les `every` secondes
+        """
+        slept = 0.0
+        while slept < seconds and not self.stopped:
+            step = min(1.0, seconds - slept)
+            time.sleep(step)
+            slept += step
+            if tick and every and slept % every < step:
+                tick()
+
+    def drain(self, drain_batch, batch_size: int, once: bool, idle_sleep: float, on_batch):
+        """
+        ✅ drain_batch(batch_size=...) -> compteurs; on_batch(compteurs) si le lot n'est pas vide
+        once: s'arrête dès qu'un lot n'est pas plein (file vide)
+        """
+        while not self.stopped:
+            counts = drain_batch(batch_size=batch_size)
+            processed = sum(counts.values())
+            if processed:
+                on_batch(counts)
+            if processed < batch_size:
+                if once:
+                    break
+                self.sleep(idle_sleep)